@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+""" Throughput benchmarks of the client against an in-process fake OpenPhoto
+    server (benchmarks/server.py).
+
+    Run them from the top of the source tree with::
+
+        python -m benchmarks [--latency 0.005] [--error-rate 0.01] \\
+            [--save] [--baseline benchmarks/baseline.json]
+
+    Every benchmark reports ops/sec, p50/p99 latency of a single operation
+    and the peak memory allocated while it runs. With --save the results are
+    stored as the baseline; later runs are compared to it and slowdowns
+    beyond --tolerance are reported (and make the command exit with 1).
+"""
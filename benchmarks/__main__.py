@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+import argparse
+import os
+import sys
+from openphoto.decoding import DECODERS
+from .harness import (compare,
+                      load_baseline,
+                      report,
+                      save_baseline)
+from .suite import (BENCHMARKS,
+                    Options,
+                    run)
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmarks the client against a fake OpenPhoto server")
+    parser.add_argument("names", nargs="*", metavar="benchmark",
+                        help="benchmarks to run, among: {0}".format(
+                            ", ".join(BENCHMARKS)))
+    parser.add_argument("--photos", type=int, default=500)
+    parser.add_argument("--photo-size", type=int, default=256 * 1024,
+                        help="bytes of every photo download and upload")
+    parser.add_argument("--page-size", type=int, default=100,
+                        help="pageSize asked by listings")
+    parser.add_argument("--max-page-size", type=int,
+                        help="page size enforced by the server")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added by the server to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests failing with a 503")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiplies the number of operations timed")
+    parser.add_argument("--decoder", choices=list(DECODERS),
+                        help="JSON decoder (default: the fastest installed)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="slowdown (fraction) reported as a regression")
+    parser.add_argument("--save", action="store_true",
+                        help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error("unknown benchmark(s): {0}".format(", ".join(unknown)))
+
+    options = Options(photos=args.photos, photo_size=args.photo_size,
+                      page_size=args.page_size,
+                      max_page_size=args.max_page_size, latency=args.latency,
+                      error_rate=args.error_rate, scale=args.scale,
+                      decoder=args.decoder)
+    results = run(options, args.names)
+    regressions = compare(results, load_baseline(args.baseline),
+                          args.tolerance)
+    print(report(results, regressions))
+
+    if args.save:
+        save_baseline(args.baseline, results)
+        print("Baseline saved to {0}".format(args.baseline))
+        return 0
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
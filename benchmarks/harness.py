@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+import collections
+import gc
+import json
+import math
+import time
+from openphoto.compat import OrderedDict
+
+try:
+    import tracemalloc
+
+except ImportError:  # pragma: nocover (python < 3.4)
+    tracemalloc = None
+
+
+Result = collections.namedtuple("Result", [
+    "name",
+    "ops",          # number of operations timed
+    "ops_per_sec",
+    "p50",          # seconds
+    "p99",          # seconds
+    "peak_memory",  # bytes, None if tracemalloc is not available
+])
+
+Regression = collections.namedtuple("Regression", [
+    "name", "metric", "baseline", "value", "change"
+])
+
+# metric -> True if higher is better
+METRICS = OrderedDict([
+    ("ops_per_sec", True),
+    ("p50", False),
+    ("p99", False),
+    ("peak_memory", False),
+])
+
+
+def percentile(values, pct):
+    """ Nearest rank percentile of the sorted list values """
+    if not values:
+        return None
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+def measure(name, fn, ops, warmup=1):
+    """ Calls fn() ops times (after warmup untimed calls) and returns a
+        Result. fn is a single operation; the peak memory is the largest
+        amount allocated during one more call, traced apart so that tracing
+        does not slow down the timed ones.
+    """
+    for _ in range(warmup):
+        fn()
+
+    gc.collect()
+    timings = []
+    start = time.time()
+    for _ in range(ops):
+        op_start = time.time()
+        fn()
+        timings.append(time.time() - op_start)
+    total = time.time() - start
+
+    peak = None
+    if tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+
+        finally:
+            tracemalloc.stop()
+
+    timings.sort()
+    return Result(name, ops, ops / total if total else float("inf"),
+                  percentile(timings, 50), percentile(timings, 99), peak)
+
+
+def load_baseline(path):
+    """ Returns the name -> Result mapping stored in path, empty if path does
+        not exist.
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+
+    except (IOError, OSError):
+        return {}
+
+    return dict((name, Result(name=name, **values))
+                for name, values in data.items())
+
+
+def save_baseline(path, results, merge=True):
+    """ Stores results in path. If merge is True, results of benchmarks not
+        run this time are kept.
+    """
+    baseline = load_baseline(path) if merge else {}
+    baseline.update((r.name, r) for r in results)
+    data = dict((name, dict((k, v) for k, v in r._asdict().items()
+                            if k != "name"))
+                for name, r in baseline.items())
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def compare(results, baseline, tolerance=0.2):
+    """ Returns the Regressions of results with respect to baseline: any
+        metric worse than its baseline value by more than tolerance (a
+        fraction).
+    """
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = getattr(base, metric), getattr(result, metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / float(old)
+            worse = -change if higher_is_better else change
+            if worse > tolerance:
+                regressions.append(Regression(result.name, metric, old, new,
+                                              change))
+    return regressions
+
+
+def _format_value(metric, value):
+    if value is None:
+        return "-"
+    if metric == "ops_per_sec":
+        return "{0:.1f}".format(value)
+    if metric == "peak_memory":
+        return "{0:.1f}KiB".format(value / 1024.0)
+    return "{0:.2f}ms".format(value * 1000)
+
+
+def report(results, regressions=()):
+    """ Returns a plain text table of results, regressions marked with ! """
+    flagged = set((r.name, r.metric) for r in regressions)
+    header = ["benchmark", "ops"] + list(METRICS)
+    rows = [header]
+    for result in results:
+        row = [result.name, str(result.ops)]
+        for metric in METRICS:
+            cell = _format_value(metric, getattr(result, metric))
+            if (result.name, metric) in flagged:
+                cell += " !"
+            row.append(cell)
+        rows.append(row)
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = ["  ".join(cell.ljust(width) if i == 0 else cell.rjust(width)
+                       for i, (cell, width) in enumerate(zip(row, widths)))
+             for row in rows]
+    for r in regressions:
+        lines.append("REGRESSION {0} {1}: {2} -> {3} ({4:+.0%})".format(
+            r.name, r.metric, _format_value(r.metric, r.baseline),
+            _format_value(r.metric, r.value), r.change))
+    return "\n".join(lines)
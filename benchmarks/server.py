@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+""" A small in-process stand-in for the OpenPhoto API, used by the
+    benchmarks and by the tests that need to talk to a real HTTP server.
+"""
+import hashlib
+import json
+import random
+import re
+import socket
+import sys
+import threading
+import time
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qsl
+
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qsl
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # clients closing a streamed response early
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+
+class FakeOpenPhoto(object):
+    """ Serves a fake photo library over HTTP on localhost.
+
+        photos is the number of photos initially in the library; every photo
+        can be downloaded in any size at /photo/<id>/<size>.jpg.
+
+        latency seconds are added to every response, a fraction error_rate
+        of the requests (chosen with a random generator seeded with seed)
+        fail with a 503, and listings return at most max_page_size items
+        per page whatever the pageSize asked.
+    """
+    routes = []
+
+    def __init__(self, photos=0, photo_size=1024, latency=0.0, error_rate=0.0,
+                 max_page_size=None, seed=0):
+        self.lock = threading.Lock()
+        self.photo_size = photo_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_page_size = max_page_size
+        self.random = random.Random(seed)
+        self.requests = []
+        self.photos = {}
+        self.albums = {}
+        self.batch = True
+        self.list_by_ids = True
+        # False ignores Range headers; range_skew is added to the start of
+        # the ranges served, as a broken server would
+        self.ranges = True
+        self.range_skew = 0
+        self.nextprevious_count = 2
+        self.failures = []
+        self._next_id = 1
+        for _ in range(photos):
+            self.add_photo()
+
+        handler = type("Handler", (_Handler,), dict(fake=self))
+        self.httpd = _ThreadingServer(("127.0.0.1", 0), handler)
+        self.thread = None
+
+    @property
+    def host(self):
+        return "{0}:{1}".format(*self.httpd.server_address)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def new_id(self):
+        with self.lock:
+            id_ = str(self._next_id)
+            self._next_id += 1
+        return id_
+
+    def content(self, id_, size):
+        seed = "{0}-{1}".format(id_, size).encode("ascii")
+        block = hashlib.sha1(seed).digest()
+        return (block * (self.photo_size // len(block) + 1))[:self.photo_size]
+
+    def add_photo(self, **data):
+        id_ = data.pop("id", None) or self.new_id()
+        photo = dict(id=id_, title="photo {0}".format(id_), tags=[],
+                     dateTaken=1000 + int(id_), dateUploaded=2000 + int(id_),
+                     hash=hashlib.sha1(id_.encode("ascii")).hexdigest())
+        photo.update(data)
+        self.photos[id_] = photo
+        return photo
+
+    def add_album(self, name, photos=()):
+        album = dict(id=self.new_id(), name=name, photos=list(photos))
+        self.albums[album["id"]] = album
+        return album
+
+    def album_data(self, album, photos=False):
+        data = dict(album, count=len(album["photos"]))
+        del data["photos"]
+        if photos:
+            data["photos"] = [self.photo_data(self.photos[id_], {})
+                              for id_ in album["photos"]
+                              if id_ in self.photos]
+        return data
+
+    def photo_data(self, photo, params):
+        data = dict(photo)
+        sizes = params.get("returnSizes")
+        if sizes:
+            for size in sizes.split(","):
+                data["path" + size] = "http://{0}/photo/{1}/{2}.jpg".format(
+                    self.host, photo["id"], size)
+        return data
+
+    # -- routing
+    @classmethod
+    def route(cls, method, pattern):
+        def decorator(fn):
+            cls.routes.append((method, re.compile("^" + pattern + "$"), fn))
+            return fn
+        return decorator
+
+    def fail(self, pattern, status=503, times=1, method=None, headers=None):
+        """ Makes the next times requests whose path matches pattern fail
+            with status; status "reset" drops the connection instead.
+        """
+        regex = re.compile("^" + pattern + "$")
+        self.failures.append([method, regex, status, times, headers or {}])
+
+    def _failure(self, method, path):
+        with self.lock:
+            if self.error_rate and self.random.random() < self.error_rate:
+                return (503, dict(code=503, result=None,
+                                  message="Random failure"))
+            for failure in self.failures:
+                fmethod, regex, status, times, headers = failure
+                if times and fmethod in (None, method) and regex.match(path):
+                    failure[3] = times - 1
+                    if status == "reset":
+                        return status, None
+                    return (status, dict(code=status, result=None,
+                                         message="Injected failure"), headers)
+
+    def dispatch(self, handler, method, path, params, body):
+        if self.latency:
+            time.sleep(self.latency)
+        failure = self._failure(method, path)
+        if failure:
+            return failure
+        for rmethod, regex, fn in self.routes:
+            match = regex.match(path)
+            if rmethod == method and match:
+                return fn(self, handler, params, body, *match.groups())
+        return 404, dict(code=404, message="Not Found", result=None)
+
+
+def ok(result):
+    return 200, dict(code=200, message="ok", result=result)
+
+
+def _page(fake, params, items):
+    """ Returns the requested page of items, with the pagination fields """
+    size = int(params.get("pageSize", 100))
+    if fake.max_page_size:
+        size = min(size, fake.max_page_size)
+    page = int(params.get("page", 1))
+    total = len(items)
+    pages = (total + size - 1) // size
+    result = []
+    for data in items[(page - 1) * size:page * size]:
+        data.update(totalRows=total, totalPages=pages, currentPage=page,
+                    currentRows=size)
+        result.append(data)
+    return ok(result)
+
+
+@FakeOpenPhoto.route("GET", r"/photos(?:/([^/]+))?/list\.json")
+def _list_photos(fake, handler, params, body, filter_=None):
+    photos = list(fake.photos.values())
+    if filter_:
+        key, _, value = filter_.partition("-")
+        if key == "hash":
+            photos = [p for p in photos if p["hash"] == value]
+        elif key == "tags":
+            photos = [p for p in photos if value in p["tags"]]
+        elif key == "ids" and fake.list_by_ids:
+            photos = [p for p in photos if p["id"] in value.split(",")]
+    sort_by = params.get("sortBy", "").split(",")
+    if sort_by[0] in ("dateUploaded", "dateTaken"):
+        photos.sort(key=lambda p: (int(p[sort_by[0]]), int(p["id"])),
+                    reverse=sort_by[-1] == "desc")
+    else:
+        photos.sort(key=lambda p: int(p["id"]))
+    return _page(fake, params, [fake.photo_data(p, params) for p in photos])
+
+
+@FakeOpenPhoto.route("GET", r"/tags/list\.json")
+def _list_tags(fake, handler, params, body):
+    counts = {}
+    for photo in fake.photos.values():
+        for tag in photo["tags"]:
+            counts[tag] = counts.get(tag, 0) + 1
+    return ok([dict(id=tag, count=count)
+               for tag, count in sorted(counts.items())])
+
+
+@FakeOpenPhoto.route("GET", r"/photo/([^/]+)/view\.json")
+def _view_photo(fake, handler, params, body, id_):
+    if id_ not in fake.photos:
+        return 404, dict(code=404, message="Photo not found", result=None)
+    return ok(fake.photo_data(fake.photos[id_], params))
+
+
+@FakeOpenPhoto.route("GET", r"/photo/([^/]+)/nextprevious/list\.json")
+def _nextprevious(fake, handler, params, body, id_):
+    if id_ not in fake.photos:
+        return 404, dict(code=404, message="Photo not found", result=None)
+    photos = sorted(fake.photos.values(),
+                    key=lambda p: (int(p["dateTaken"]), int(p["id"])))
+    pos = [p["id"] for p in photos].index(id_)
+    count = fake.nextprevious_count
+    result = {}
+    previous = photos[max(0, pos - count):pos][::-1]
+    following = photos[pos + 1:pos + 1 + count]
+    if previous:
+        result["previous"] = [fake.photo_data(p, params) for p in previous]
+    if following:
+        result["next"] = [fake.photo_data(p, params) for p in following]
+    return ok(result)
+
+
+@FakeOpenPhoto.route("GET", r"/photo/([^/]+)/([^/]+)\.jpg")
+def _download(fake, handler, params, body, id_, size):
+    content = fake.content(id_, size)
+    range_ = handler.headers.get("Range")
+    if not range_ or not fake.ranges:
+        return 200, content
+    start = int(range_.split("=")[1].split("-")[0]) + fake.range_skew
+    if start >= len(content):
+        return 416, b"", {"Content-Range": "bytes */{0}".format(len(content))}
+    headers = {"Content-Range": "bytes {0}-{1}/{2}".format(
+        start, len(content) - 1, len(content))}
+    return 206, content[start:], headers
+
+
+@FakeOpenPhoto.route("POST", r"/photo/upload\.json")
+def _upload(fake, handler, params, body):
+    content = body["photo"]
+    sha1 = hashlib.sha1(content).hexdigest()
+    if not params.get("allowDuplicate"):
+        for photo in fake.photos.values():
+            if photo["hash"] == sha1:
+                return 409, dict(code=409, message="Duplicate", result=None)
+    data = dict((k, v) for k, v in body.items() if k != "photo")
+    data.update(params)
+    if "tags" in data:
+        data["tags"] = data["tags"].split(",")
+    photo = fake.add_photo(hash=sha1,
+                           size=len(content), **data)
+    return ok(fake.photo_data(photo, params))
+
+
+def _update(photo, body):
+    for key, value in body.items():
+        if key == "tags":
+            photo["tags"] = value.split(",")
+        elif key == "tagsAdd":
+            photo["tags"] = photo["tags"] + value.split(",")
+        elif key != "ids":
+            photo[key] = value
+
+
+@FakeOpenPhoto.route("POST", r"/photos/(update|delete)\.json")
+def _batch(fake, handler, params, body, action):
+    if not fake.batch:
+        return 404, dict(code=404, message="Not Found", result=None)
+    ids = body["ids"].split(",")
+    if any(id_ not in fake.photos for id_ in ids):
+        return ok(False)
+    for id_ in ids:
+        if action == "delete":
+            del fake.photos[id_]
+        else:
+            _update(fake.photos[id_], body)
+    return ok(True)
+
+
+@FakeOpenPhoto.route("POST", r"/photo/([^/]+)/(update|delete)\.json")
+def _update_photo(fake, handler, params, body, id_, action):
+    if id_ not in fake.photos:
+        return 404, dict(code=404, message="Photo not found", result=None)
+    if action == "delete":
+        del fake.photos[id_]
+        return ok(True)
+    _update(fake.photos[id_], body)
+    return ok(fake.photo_data(fake.photos[id_], params))
+
+
+@FakeOpenPhoto.route("GET", r"/albums/list\.json")
+def _list_albums(fake, handler, params, body):
+    albums = sorted(fake.albums.values(), key=lambda a: int(a["id"]))
+    return _page(fake, params, [fake.album_data(a) for a in albums])
+
+
+@FakeOpenPhoto.route("POST", r"/album/create\.json")
+def _create_album(fake, handler, params, body):
+    return ok(fake.album_data(fake.add_album(body["name"])))
+
+
+@FakeOpenPhoto.route("GET", r"/album/([^/]+)/view\.json")
+def _view_album(fake, handler, params, body, id_):
+    if id_ not in fake.albums:
+        return 404, dict(code=404, message="Album not found", result=None)
+    return ok(fake.album_data(fake.albums[id_], photos=True))
+
+
+@FakeOpenPhoto.route("POST", r"/album/([^/]+)/photo/(add|remove)\.json")
+def _album_photos(fake, handler, params, body, id_, action):
+    if id_ not in fake.albums:
+        return 404, dict(code=404, message="Album not found", result=None)
+    album = fake.albums[id_]
+    for photo_id in body["ids"].split(","):
+        photo_id = photo_id.strip()
+        if action == "add" and photo_id not in album["photos"]:
+            album["photos"].append(photo_id)
+        elif action == "remove" and photo_id in album["photos"]:
+            album["photos"].remove(photo_id)
+    return ok(True)
+
+
+def _parse_multipart(raw, ctype):
+    boundary = ctype.split("boundary=")[1].strip('"').encode("ascii")
+    fields = {}
+    for part in raw.split(b"--" + boundary)[1:-1]:
+        head, _, value = part.partition(b"\r\n\r\n")
+        name = re.search(br'name="([^"]*)"', head).group(1).decode("utf-8")
+        value = value[:-2]
+        if b"filename=" not in head:
+            value = value.decode("utf-8")
+        fields[name] = value
+    return fields
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake = None
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately: with Nagle's algorithm every
+    # keep-alive response would wait for the delayed ACK of the headers
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        ctype = self.headers.get("Content-Type", "")
+        raw = self.rfile.read(length) if length else b""
+        if ctype.startswith("multipart/form-data"):
+            return _parse_multipart(raw, ctype)
+        return dict(parse_qsl(raw.decode("utf-8")))
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        params = dict(parse_qsl(url.query))
+        body = self._body() if method == "POST" else {}
+        with self.fake.lock:
+            self.fake.requests.append((method, url.path, params,
+                                       dict(self.headers.items())))
+        res = self.fake.dispatch(self, method, url.path, params, body)
+        status, payload, headers = (tuple(res) + ({},))[:3]
+        if payload is None:
+            self.close_connection = True
+            return
+        if isinstance(payload, bytes):
+            ctype = "image/jpeg"
+        else:
+            ctype = "application/json"
+            payload = json.dumps(payload).encode("utf-8")
+            if method == "GET" and status == 200:
+                etag = '"{0}"'.format(hashlib.sha1(payload).hexdigest())
+                headers = dict(headers, ETag=etag)
+                if self.headers.get("If-None-Match") == etag:
+                    status, payload = 304, b""
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        if status != 304:
+            self.send_header("Content-Length", str(len(payload)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+import io
+import json
+from openphoto import Client
+from openphoto.compat import OrderedDict
+from openphoto.decoding import get_decoder
+from openphoto.collection import PhotoCollection
+from openphoto.models import (Album,
+                              Photo)
+from openphoto.retry import RetryPolicy
+from openphoto.sync import Mirror
+from .server import FakeOpenPhoto
+from .harness import measure
+
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(ops=50):
+    """ Registers a benchmark. The decorated function takes an Environment,
+        prepares the fixtures and returns the operation to time.
+    """
+    def decorator(fn):
+        BENCHMARKS[fn.__name__] = (fn, ops)
+        return fn
+    return decorator
+
+
+class Options(object):
+    """ Benchmark parameters: library size, fake server behaviour and the
+        number of operations timed (scale multiplies the default of every
+        benchmark) and the JSON decoder of the client.
+    """
+
+    def __init__(self, photos=500, photo_size=256 * 1024, page_size=100,
+                 max_page_size=None, latency=0.0, error_rate=0.0, scale=1.0,
+                 warmup=1, decoder=None):
+        self.photos = photos
+        self.photo_size = photo_size
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.scale = scale
+        self.warmup = warmup
+        self.decoder = decoder
+
+
+class Environment(object):
+    """ A fresh fake server and a client talking to it """
+
+    def __init__(self, options):
+        self.options = options
+        self.server = FakeOpenPhoto(photos=options.photos,
+                                    photo_size=options.photo_size,
+                                    latency=options.latency,
+                                    error_rate=options.error_rate,
+                                    max_page_size=options.max_page_size)
+        retry = RetryPolicy(retries=10, backoff=0.001, jitter=False)
+        self.client = Client(self.server.host, "ckey", "csecret", "otoken",
+                             "osecret", scheme="http", retry=retry,
+                             decoder=options.decoder)
+
+    def __enter__(self):
+        self.server.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.stop()
+
+
+@benchmark(ops=20)
+def iterate(env):
+    """ Base.iterate: full paginated listing """
+    page_size = env.options.page_size
+    return lambda: list(Photo.all(env.client, pageSize=page_size))
+
+
+@benchmark(ops=20)
+def iterate_prefetch(env):
+    """ Base.iterate: full paginated listing, 4 pages prefetched """
+    page_size = env.options.page_size
+    return lambda: list(Photo.all(env.client, pageSize=page_size,
+                                  prefetch=4))
+
+
+@benchmark(ops=50)
+def upload(env):
+    """ Photo.create of an in-memory file """
+    content = b"\xff" * env.options.photo_size
+
+    def op():
+        Photo.create(env.client, io.BytesIO(content), allow_duplicate=True)
+    return op
+
+
+@benchmark(ops=50)
+def download(env):
+    """ PhotoSize.download of the original size into memory """
+    photo = next(Photo.all(env.client, pageSize=1, returnSizes="original"))
+    size = photo.sizes["original"]
+    return lambda: size.download(io.BytesIO())
+
+
+@benchmark(ops=50)
+def album_photos(env):
+    """ Album.photos of a 100 photos album, not yet loaded """
+    album = env.server.add_album("benchmark",
+                                 sorted(env.server.photos, key=int)[:100])
+
+    def op():
+        photos = Album(env.client, {"id": album["id"]}).photos()
+        assert len(photos) == len(album["photos"])
+    return op
+
+
+@benchmark(ops=20)
+def attributes(env):
+    """ Attribute access on 1000 photos (model hot path, no requests) """
+    photos = [Photo(env.client, dict(env.server.photo_data(p, {}),
+                                     pathOriginal="/original.jpg"))
+              for p in env.server.photos.values()]
+    photos = (photos * (1000 // max(1, len(photos)) + 1))[:1000]
+
+    def op():
+        for photo in photos:
+            photo.id
+            photo.title
+            photo.date_taken
+            photo.date_uploaded
+            photo.paths()
+    return op
+
+
+@benchmark(ops=10)
+def models(env):
+    """ 5000 Photo objects built from listing data (model memory) """
+    items = [env.server.photo_data(p, {"returnSizes": "100x100,original"})
+             for p in env.server.photos.values()]
+    items = (items * (5000 // max(1, len(items)) + 1))[:5000]
+    return lambda: [Photo(env.client, dict(item)) for item in items]
+
+
+@benchmark(ops=20)
+def collection(env):
+    """ PhotoCollection of 50000 photos: size by month of photos without GPS
+    """
+    items = [env.server.photo_data(p, {}) for p in env.server.photos.values()]
+    items = (items * (50000 // max(1, len(items)) + 1))[:50000]
+    photos = PhotoCollection(items, client=env.client)
+
+    def op():
+        months = photos.filter(latitude__missing=True).group_by(
+            "date_taken", period="month")
+        return dict((k, v.sum("size")) for k, v in months.items())
+    return op
+
+
+@benchmark(ops=20)
+def sync_delta(env):
+    """ Mirror.sync of an up to date mirror (incremental) """
+    mirror = Mirror(env.client, page_size=env.options.page_size)
+    mirror.sync()
+    return mirror.sync
+
+
+def _decode_page(env, items):
+    page = [env.server.photo_data(p, {"returnSizes": "100x100,original"})
+            for p in env.server.photos.values()]
+    page = (page * (items // max(1, len(page)) + 1))[:items]
+    body = json.dumps(dict(code=200, message="ok",
+                           result=page)).encode("utf-8")
+    loads = get_decoder(env.options.decoder)
+    return lambda: loads(body)
+
+
+@benchmark(ops=50)
+def decode_100(env):
+    """ JSON decoding of a 100 photos listing page """
+    return _decode_page(env, 100)
+
+
+@benchmark(ops=20)
+def decode_500(env):
+    """ JSON decoding of a 500 photos listing page """
+    return _decode_page(env, 500)
+
+
+def run(options=None, names=None):
+    """ Runs the benchmarks in names (default: all) and returns the list of
+        their Results.
+    """
+    options = options or Options()
+    results = []
+    for name, (fn, ops) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        with Environment(options) as env:
+            op = fn(env)
+            ops = max(1, int(ops * options.scale))
+            results.append(measure(name, op, ops, warmup=options.warmup))
+    return results
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+""" asyncio flavour of the client.
+
+    Requires python >= 3.6 and aiohttp; it is not imported by the openphoto
+    package, import it explicitly with ``from openphoto.aio import
+    AsyncClient``.
+"""
+import asyncio
+import functools
+import logging
+import os
+import traceback
+from urllib.parse import urlencode
+
+import aiohttp
+import requests
+from oauthlib import oauth1
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from . import decoding
+from .client import (Client,
+                     raise_for_code)
+from .compat import stringcls
+from .models import Photo
+
+
+def _response(aioresponse, content):
+    """ Wraps a fully read aiohttp response in a requests.Response, so that
+        callers can use the same json() / raise_for_status() interface as
+        with the synchronous client.
+    """
+    response = requests.Response()
+    response.status_code = aioresponse.status
+    response.reason = aioresponse.reason
+    response.headers = CaseInsensitiveDict(aioresponse.headers)
+    response.url = str(aioresponse.url)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = content
+    return decoding.attach(response)
+
+
+class AsyncClient(object):
+    """ Same as Client, but every request is a coroutine run on an aiohttp
+        session, so that many requests can be in flight on one event loop.
+
+        Async counterparts of the model operations are available as
+        coroutines on the client itself (view, create, all, create_photo and
+        download).
+    """
+    log = logging.getLogger(__name__)
+
+    def __init__(self, host, consumer_key, consumer_secret,
+                 oauth_token, oauth_secret, scheme="https", limit=100,
+                 session=None, identity_map=None):
+        self.auth = oauth1.Client(consumer_key,
+                                  client_secret=consumer_secret,
+                                  resource_owner_key=oauth_token,
+                                  resource_owner_secret=oauth_secret)
+        self.host = host
+        self.scheme = scheme
+        self.limit = limit
+        self._session = session
+        self.identity_map = identity_map
+
+    url = Client.url
+
+    @property
+    def session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.limit)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def __getattr__(self, attr):
+        if attr in ("get", "post", "put", "delete", "patch", "head"):
+            return functools.partial(self.request, attr)
+
+        raise AttributeError(attr)
+
+    async def request(self, method, endpoint, **kwargs):
+        if "auth" in kwargs:
+            raise ValueError("request() called with auth")
+        kwargs['auth'] = self.auth
+        return await self.request_full_url(method, self.url(endpoint),
+                                           **kwargs)
+
+    def _prepare(self, method, url, params, data, files, headers, auth):
+        headers = dict(headers or {})
+        if params:
+            sep = "&" if "?" in url else "?"
+            url = url + sep + urlencode(sorted(params.items()))
+
+        body = None
+        if files:
+            body = aiohttp.FormData()
+            for key, value in (data or {}).items():
+                body.add_field(key, str(value))
+            for key, file_ in files.items():
+                name = os.path.basename(getattr(file_, "name", key))
+                body.add_field(key, file_, filename=name)
+
+        elif data:
+            body = urlencode(sorted(data.items()))
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        if auth is not None:
+            signed_body = body if isinstance(body, stringcls) else None
+            url, headers, _ = auth.sign(url, http_method=method.upper(),
+                                        body=signed_body, headers=headers)
+        return url, body, headers
+
+    async def request_full_url(self, method, url, params=None, data=None,
+                               files=None, headers=None, auth=None,
+                               stream=False):
+        """ Performs the request; unless stream is True the body is read
+            and a requests.Response is returned, otherwise the aiohttp
+            response is returned and must be released by the caller.
+        """
+        url, body, headers = self._prepare(method, url, params, data, files,
+                                           headers, auth)
+        aioresponse = await self.session.request(method.upper(), url,
+                                                 data=body, headers=headers)
+        if stream and aioresponse.status < 400:
+            return aioresponse
+
+        try:
+            content = await aioresponse.read()
+        finally:
+            aioresponse.release()
+
+        response = _response(aioresponse, content)
+        response.raise_for_status()
+        try:
+            jres = response.json()
+
+        except:
+            self.log.debug(traceback.format_exc())
+
+        else:
+            raise_for_code(jres, response)
+
+        return response
+
+    # -- model operations
+    async def view(self, obj, **kwargs):
+        """ Async counterpart of Base.view """
+        params = dict(includeElements=1)
+        params.update(kwargs)
+        response = await self.get(obj.url("view"), params=params)
+        obj._update_data(response.json()['result'])
+        return obj
+
+    async def create(self, cls, path=None, **kwargs):
+        """ Async counterpart of Base.create """
+        params = kwargs.pop("params", {})
+        path = path or cls.create_path
+        response = await self.post(path, data=kwargs, params=params)
+        return cls(self, response.json()['result'])
+
+    async def all(self, cls, paginate=True, prefetch=None, **kwargs):
+        """ Async counterpart of Base.all: an async iterator over the
+            collection. prefetch pages are requested concurrently.
+        """
+        url = "{0}/list.json".format(cls.collection_path)
+        if not paginate:
+            response = await self.get(url, params=kwargs)
+            for data in response.json()['result']:
+                yield cls(self, data)
+            return
+
+        page_size = kwargs.get("pageSize", cls.page_size)
+
+        async def fetch(page):
+            params = dict(kwargs, pageSize=page_size, page=page)
+            response = await self.get(url, params=params)
+            return response.json()['result']
+
+        result = await fetch(1)
+        total = cls._total_pages(result, page_size)
+        window = prefetch or 1
+        page = 1
+        pending = []
+        try:
+            while result:
+                while len(pending) < window and (total is None or
+                                                 page + len(pending) < total):
+                    next_page = page + len(pending) + 1
+                    pending.append(asyncio.ensure_future(fetch(next_page)))
+
+                for data in result:
+                    yield cls(self, data)
+
+                if not pending:
+                    break
+                result = await pending.pop(0)
+                page = page + 1
+
+        finally:
+            for future in pending:
+                future.cancel()
+
+    list = all
+
+    async def create_photo(self, photo, private=False, title=None,
+                           description=None, tags=None, date_uploaded=None,
+                           date_taken=None, license=None, latitude=None,
+                           longitude=None, return_sizes=None,
+                           allow_duplicate=False):
+        """ Async counterpart of Photo.create """
+        params = Photo._upload_params(private, title, description, tags,
+                                      date_uploaded, date_taken, license,
+                                      latitude, longitude, return_sizes,
+                                      allow_duplicate)
+        close_f = isinstance(photo, stringcls)
+        photo_f = open(photo, "rb") if close_f else photo
+        try:
+            Photo.log.info("Uploading from %s", photo)
+            response = await self.post(Photo.create_path,
+                                       files={"photo": photo_f},
+                                       params=params)
+            return Photo(self, response.json()["result"])
+
+        finally:
+            if close_f:
+                photo_f.close()
+
+    async def download(self, size, destination=None, mode="wb",
+                       chunk_size=65536):
+        """ Async counterpart of PhotoSize.download. Without a destination
+            an async iterator over the content is returned.
+        """
+        response = await self.request_full_url("get", size.url, stream=True)
+        if not destination:
+            return self._iter_content(response, chunk_size)
+
+        close_file = isinstance(destination, stringcls)
+        file_ = open(destination, mode) if close_file else destination
+        try:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                file_.write(chunk)
+
+        except Exception:
+            if close_file:
+                file_.close()
+                close_file = False
+                try:
+                    os.unlink(destination)
+                except OSError:  # pragma: nocover
+                    pass
+            raise
+
+        finally:
+            response.release()
+            if close_file:
+                file_.close()
+
+    @staticmethod
+    async def _iter_content(response, chunk_size):
+        try:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+        finally:
+            response.release()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+""" Response caches for Client.
+
+    A cache stores the GET responses of the API keyed by their full url
+    (query string included). Entries younger than ttl seconds are served
+    without contacting the server; older entries are revalidated with a
+    conditional request when the server sent an ETag or Last-Modified
+    header, and dropped otherwise.
+"""
+import collections
+import json
+import sqlite3
+import threading
+import time
+import requests
+from requests.structures import CaseInsensitiveDict
+from .compat import OrderedDict
+
+try:
+    from urlparse import urlsplit
+
+except ImportError:  # pragma: nocover
+    from urllib.parse import urlsplit
+
+
+class CacheEntry(collections.namedtuple("CacheEntry",
+                                        "url status headers content stored")):
+    """ A stored response """
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.url, response.status_code,
+                   dict(response.headers), response.content, time.time())
+
+    @property
+    def validators(self):
+        """ Headers that make a request conditional on this entry """
+        headers = CaseInsensitiveDict(self.headers)
+        validators = {}
+        if "ETag" in headers:
+            validators["If-None-Match"] = headers["ETag"]
+        if "Last-Modified" in headers:
+            validators["If-Modified-Since"] = headers["Last-Modified"]
+        return validators
+
+    def is_fresh(self, ttl):
+        return time.time() - self.stored < ttl
+
+    def touch(self):
+        return self._replace(stored=time.time())
+
+    def response(self):
+        response = requests.Response()
+        response.url = self.url
+        response.status_code = self.status
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = requests.utils.get_encoding_from_headers(
+            response.headers)
+        response._content = self.content
+        response.from_cache = True
+        return response
+
+
+def cache_key(url, params=None):
+    """ Returns the key of a GET request: its url with the query string """
+    request = requests.models.PreparedRequest()
+    request.prepare_url(url, params)
+    return request.url
+
+
+def invalidation_prefixes(url):
+    """ Returns the url prefixes whose entries are stale after a write
+        request to url.
+
+        A write to /photo/<id>/... invalidates /photo/<id>/ and the /photos/
+        listings, a create (/photo/upload.json) only the listings and a
+        batch operation (/photos/update.json) every photo. Writes to photos
+        also invalidate the tag and album listings and albums (their tags,
+        counts and photos change); writes to tags, and to the photos of an
+        album, invalidate the photos.
+    """
+    parts = urlsplit(url)
+    base = "{0}://{1}".format(parts.scheme, parts.netloc)
+    segments = [s for s in parts.path.split("/") if s]
+    if not segments:
+        return [base + "/"]
+
+    kind = segments[0]
+    singular = kind[:-1] if kind.endswith("s") else kind
+    prefixes = ["{0}/{1}s/".format(base, singular)]
+    if kind != singular:
+        prefixes.append("{0}/{1}/".format(base, singular))
+    elif len(segments) > 2:
+        prefixes.append("{0}/{1}/{2}/".format(base, kind, segments[1]))
+
+    if singular == "photo":
+        related = ("tags", "albums", "album")
+    elif singular == "tag" or (singular == "album" and
+                               "photo" in segments[2:]):
+        related = ("photos", "photo")
+    else:
+        related = ()
+    prefixes.extend("{0}/{1}/".format(base, name) for name in related
+                    if "{0}/{1}/".format(base, name) not in prefixes)
+    return prefixes
+
+
+class MemoryCache(object):
+    """ In-memory LRU cache, bounded to max_entries entries and max_bytes
+        bytes of content.
+    """
+
+    def __init__(self, ttl=60, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.entries[key] = entry
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.content)
+            if len(entry.content) > self.max_bytes:
+                return
+            self.entries[key] = entry
+            self.size += len(entry.content)
+            while (len(self.entries) > self.max_entries or
+                   self.size > self.max_bytes):
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.content)
+
+    def delete(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry.content)
+
+    def invalidate(self, prefix):
+        with self.lock:
+            for key in [k for k in self.entries if k.startswith(prefix)]:
+                self.size -= len(self.entries.pop(key).content)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class SQLiteCache(object):
+    """ On-disk cache stored in a SQLite database at path; it can be shared
+        between processes.
+
+        Like MemoryCache it is bounded to max_entries entries and max_bytes
+        bytes of content, the least recently stored (or revalidated)
+        entries being dropped first; entries older than ttl that can't be
+        revalidated are dropped as well.
+    """
+
+    def __init__(self, path, ttl=60, max_entries=1024,
+                 max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                            "key TEXT PRIMARY KEY, url TEXT, status INTEGER, "
+                            "headers TEXT, content BLOB, stored REAL)")
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute(
+                "SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT url, status, headers, content, "
+                                  "stored FROM responses WHERE key = ?",
+                                  (key,)).fetchone()
+        if row is None:
+            return None
+        url, status, headers, content, stored = row
+        return CacheEntry(url, status, json.loads(headers), bytes(content),
+                          stored)
+
+    def set(self, key, entry):
+        with self.lock:
+            with self.db:
+                if len(entry.content) > self.max_bytes:
+                    self.db.execute("DELETE FROM responses WHERE key = ?",
+                                    (key,))
+                    return
+                self.db.execute("INSERT OR REPLACE INTO responses VALUES "
+                                "(?, ?, ?, ?, ?, ?)",
+                                (key, entry.url, entry.status,
+                                 json.dumps(entry.headers),
+                                 sqlite3.Binary(entry.content), entry.stored))
+                self._prune()
+
+    def _prune(self):
+        """ Drops the expired entries without validators, then the oldest
+            entries beyond the bounds; called in a transaction.
+        """
+        self.db.execute("DELETE FROM responses WHERE stored < ? AND "
+                        "lower(headers) NOT LIKE '%\"etag\":%' AND "
+                        "lower(headers) NOT LIKE '%\"last-modified\":%'",
+                        (time.time() - self.ttl,))
+        count, size = self.db.execute("SELECT COUNT(*), "
+                                      "TOTAL(LENGTH(content)) "
+                                      "FROM responses").fetchone()
+        evicted = []
+        rows = self.db.execute("SELECT key, LENGTH(content) FROM responses "
+                               "ORDER BY stored")
+        for key, length in rows:
+            if count <= self.max_entries and size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            count -= 1
+            size -= length
+        self.db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def delete(self, key):
+        with self.lock:
+            with self.db:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def invalidate(self, prefix):
+        escaped = (prefix.replace("\\", "\\\\").replace("%", "\\%")
+                   .replace("_", "\\_"))
+        with self.lock:
+            with self.db:
+                self.db.execute("DELETE FROM responses WHERE key LIKE ? "
+                                "ESCAPE '\\'", (escaped + "%",))
+
+    def clear(self):
+        with self.lock:
+            with self.db:
+                self.db.execute("DELETE FROM responses")
+
+    def close(self):
+        self.db.close()
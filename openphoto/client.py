@@ -1,9 +1,19 @@
 #!/usr/bin/env python
 import functools
 import logging
+import time
 import traceback
 import requests
 import requests_oauthlib
+from . import (decoding,
+               instrument)
+from .cache import (CacheEntry,
+                    cache_key,
+                    invalidation_prefixes)
+from .retry import (RetryPolicy,
+                    TokenBucket,
+                    rate_limit_pause)
+from .transport import TransportAdapter
 try:
     import httplib
 except ImportError:  # pragma: nocover
@@ -11,20 +21,71 @@ except ImportError:  # pragma: nocover
 
 
 class Client(object):
+    """ OpenPhoto API client.
+
+        Transport: pool_maxsize connections per host are kept open (and never
+        exceeded if pool_block is True), timeout is the default (connect,
+        read) timeout of every request and keepalive the idle seconds before
+        TCP keep-alive probes. A different requests transport adapter (e.g.
+        one speaking HTTP/2) can be given as adapter, in which case the pool
+        options are ignored.
+
+        Scheduling: retry is a RetryPolicy (or a number of retries) used
+        for failed requests, rate_limit a TokenBucket (or a number of
+        requests per second) shared by every thread using the client.
+        Exhausted X-RateLimit-* headers pause the bucket until the reset.
+
+        Instrumentation: every request is reported as an
+        instrument.RequestEvent to the callables added with add_listener;
+        changes made through the models are reported as events.ModelEvent
+        to the ones added with add_model_listener.
+
+        Decoding: response bodies are decoded once, with decoder (a
+        decoding.DECODERS name or a loads function; default: the fastest
+        installed), and response.json() returns the decoded object.
+    """
     log = logging.getLogger(__name__)
 
     def __init__(self, host, consumer_key, consumer_secret,
                  oauth_token, oauth_secret, scheme="https",
-                 http_debug_level=None):
+                 http_debug_level=None, cache=None, identity_map=None,
+                 pool_connections=10, pool_maxsize=10, pool_block=False,
+                 timeout=None, keepalive=None, adapter=None, retry=None,
+                 rate_limit=None, decoder=None):
         self.auth = requests_oauthlib.OAuth1(
                             consumer_key,
                             consumer_secret,
                             oauth_token,
                             oauth_secret)
         self.session = requests.Session()
+        if adapter is None:
+            adapter = TransportAdapter(pool_connections=pool_connections,
+                                       pool_maxsize=pool_maxsize,
+                                       pool_block=pool_block,
+                                       timeout=timeout,
+                                       keepalive=keepalive)
+        self.transport = adapter
+        if isinstance(retry, int):
+            retry = RetryPolicy(retries=retry)
+        self.retry = retry
+        if isinstance(rate_limit, (int, float)):
+            rate_limit = TokenBucket(rate_limit)
+        self.rate_limit = rate_limit
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         self.host = host
         self.scheme = scheme
         self.http_debug_level = http_debug_level
+        self.cache = cache
+        self.identity_map = identity_map
+        self.listeners = []
+        self.model_listeners = []
+        self.loads = decoding.get_decoder(decoder)
+
+    @property
+    def pool_stats(self):
+        """ PoolStats of the transport, None if it does not keep any """
+        return getattr(self.transport, "stats", None)
 
     @property
     def http_debug_level(self):
@@ -36,6 +97,54 @@ class Client(object):
             value = 0
         httplib.HTTPConnection.debuglevel = int(value)
 
+    def add_listener(self, listener):
+        """ Calls listener(event) with an instrument.RequestEvent after
+            every request.
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def add_model_listener(self, listener):
+        """ Calls listener(event) with an events.ModelEvent after every
+            change made through the models.
+        """
+        self.model_listeners.append(listener)
+
+    def remove_model_listener(self, listener):
+        self.model_listeners.remove(listener)
+
+    def _notify(self, method, url, start, response, error=None, cached=False):
+        bytes_out = bytes_in = 0
+        ttfb = status = None
+        if response is not None:
+            status = response.status_code
+            if response.elapsed is not None and not cached:
+                ttfb = response.elapsed.total_seconds()
+            if response._content_consumed or cached:
+                bytes_in = len(response.content or b"")
+            else:
+                bytes_in = int(response.headers.get("Content-Length") or 0)
+            request = response.request
+            if request is not None and request.body is not None:
+                try:
+                    bytes_out = len(request.body)
+                except TypeError:
+                    bytes_out = int(request.headers.get("Content-Length")
+                                    or 0)
+
+        url = url.split("?")[0]
+        event = instrument.RequestEvent(
+            method.upper(), url, instrument.endpoint_template(url), status,
+            bytes_out, bytes_in, ttfb, time.time() - start,
+            instrument.current_operations(), error, cached)
+        for listener in list(self.listeners):
+            try:
+                listener(event)
+            except Exception:
+                self.log.exception("Error in listener %s", listener)
+
     def url(self, endpoint):
         if not endpoint.startswith("/"):
             endpoint = "/" + endpoint
@@ -54,24 +163,139 @@ class Client(object):
         return self.request_full_url(method, self.url(endpoint), **kwargs)
 
     def request_full_url(self, method, url, **kwargs):
-        response = self.session.request(method, url, **kwargs)
+        if self.cache is None:
+            return self._send(method, url, **kwargs)
+
+        if method.lower() != "get":
+            # before the write, and again after it: a GET sent meanwhile may
+            # have stored what the server returned before the write
+            prefixes = invalidation_prefixes(url)
+            for prefix in prefixes:
+                self.cache.invalidate(prefix)
+            try:
+                return self._send(method, url, **kwargs)
+
+            finally:
+                for prefix in prefixes:
+                    self.cache.invalidate(prefix)
+
+        if kwargs.get("stream"):
+            return self._send(method, url, **kwargs)
+
+        key = cache_key(url, kwargs.get("params"))
+        entry = self.cache.get(key)
+        if entry is not None:
+            if entry.is_fresh(self.cache.ttl):
+                response = decoding.attach(entry.response(), self.loads)
+                if self.listeners:
+                    self._notify(method, url, time.time(), response,
+                                 cached=True)
+                return response
+
+            validators = entry.validators
+            if not validators:
+                entry = None
+            else:
+                headers = dict(kwargs.get("headers") or {})
+                headers.update(validators)
+                kwargs["headers"] = headers
+
+        response = self._send(method, url, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            entry = entry.touch()
+            self.cache.set(key, entry)
+            return decoding.attach(entry.response(), self.loads)
+
+        if response.status_code == 200:
+            self.cache.set(key, CacheEntry.from_response(response))
+        return response
+
+    def _send(self, method, url, **kwargs):
+        attempt = 0
+        while True:
+            if self.rate_limit is not None:
+                self.rate_limit.acquire()
+            try:
+                return self._send_once(method, url, **kwargs)
+
+            except requests.exceptions.RequestException as e:
+                if (self.retry is None or
+                        not self.retry.should_retry(method, e, attempt)):
+                    raise
+                delay = self.retry.delay(attempt, getattr(e, "response", None))
+                self.log.warning("%s %s failed (%s), retrying in %.2fs",
+                                 method.upper(), url, e, delay)
+                self.retry.sleep(delay)
+                attempt = attempt + 1
+                for file_ in (kwargs.get("files") or {}).values():
+                    if hasattr(file_, "seek"):
+                        file_.seek(0)
+                # streamed bodies, e.g. multipart.MultipartEncoder
+                if hasattr(kwargs.get("data"), "seek"):
+                    kwargs["data"].seek(0)
+
+    def _send_once(self, method, url, **kwargs):
+        start = time.time()
+        response = error = None
+        try:
+            response = self.session.request(method, url, **kwargs)
+            decoding.attach(response, self.loads)
+            self._check(response, kwargs.get("stream"))
+            return response
+
+        except Exception as e:
+            error = e
+            raise
+
+        finally:
+            if self.listeners:
+                if response is None:
+                    response = getattr(error, "response", None)
+                self._notify(method, url, start, response, error)
+
+    def _check(self, response, stream):
+        if self.rate_limit is not None:
+            pause = rate_limit_pause(response)
+            if pause:
+                self.rate_limit.pause(pause)
         response.raise_for_status()
+        if stream and (stream == decoding.STREAM_JSON or
+                       not _is_json(response)):
+            # don't buffer streamed downloads just to look for a code;
+            # incrementally parsed listings check it themselves
+            return
+
         try:
             jres = response.json()
-            code = jres["code"]
-            message = jres["message"]
 
         except:
             self.log.debug(traceback.format_exc())
 
         else:
-            if 400 <= code < 500:
-                message = '%s Client Error: %s' % (code, message)
-            if 500 <= code < 600:
-                message = '%s Server Error: %s' % (code, message)
-            if 400 <= code < 600:
-                raise requests.exceptions.HTTPError(message,
-                                                    response=response)
+            raise_for_code(jres, response)
 
-        return response
 
+def _is_json(response):
+    ctype = response.headers.get("Content-Type", "")
+    return "json" in ctype or "javascript" in ctype
+
+
+def raise_for_code(jres, response):
+    """ Raises an HTTPError if the decoded API response jres reports a 4xx
+        or 5xx code.
+    """
+    try:
+        code = jres["code"]
+        message = jres["message"]
+
+    except (KeyError, TypeError):
+        return
+
+    if 400 <= code < 500:
+        message = '%s Client Error: %s' % (code, message)
+    if 500 <= code < 600:
+        message = '%s Server Error: %s' % (code, message)
+    if 400 <= code < 600:
+        error = requests.exceptions.HTTPError(message, response=response)
+        error.code = code
+        raise error
@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+""" Columnar storage of photo listings, for analytics over large libraries.
+
+    A PhotoCollection keeps the common fields of many photos in typed
+    column arrays (numpy arrays if numpy is installed, array.array
+    otherwise) instead of one Photo object per photo. Filtering, sorting and
+    grouping return views sharing the columns; Photo objects are only built
+    when a photo is accessed.
+"""
+import array
+import collections
+import functools
+import operator
+import time
+from .compat import (OrderedDict,
+                     stringcls)
+from .models import (Base,
+                     Photo)
+
+try:
+    import numpy
+
+except ImportError:  # pragma: nocover
+    numpy = None
+
+
+# column -> kind; missing values are None (object columns), MISSING (int
+# columns) or NaN (float columns)
+COLUMNS = OrderedDict([
+    ("id", "object"),
+    ("hash", "object"),
+    ("dateTaken", "int"),
+    ("dateUploaded", "int"),
+    ("size", "int"),
+    ("width", "int"),
+    ("height", "int"),
+    ("latitude", "float"),
+    ("longitude", "float"),
+    ("permission", "int"),
+])
+MISSING = -1
+PERIODS = {"year": ("%Y", "Y"), "month": ("%Y-%m", "M"),
+           "day": ("%Y-%m-%d", "D")}
+
+try:
+    array.array("q")
+    _INT = "q"
+
+except ValueError:  # pragma: nocover (python 2)
+    _INT = "l"
+
+_COMPARISONS = {
+    "lt": operator.lt,
+    "le": operator.le,
+    "gt": operator.gt,
+    "ge": operator.ge,
+}
+
+
+def _int(value):
+    try:
+        return int(float(value))
+
+    except (TypeError, ValueError):
+        return MISSING
+
+
+def _float(value):
+    try:
+        return float(value)
+
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _is_missing(kind, value):
+    if kind == "object":
+        return value is None
+    if kind == "int":
+        return value == MISSING
+    return value != value
+
+
+def _raw(client, data):
+    return data
+
+
+class PhotoCollection(object):
+    """ Photos (or listing dictionaries) stored by column.
+
+        Unless keep_data is True only the COLUMNS values are kept, and the
+        Photo objects built on access carry just those fields (the others
+        are loaded by view() as usual). use_numpy forces (True) or disables
+        (False) the numpy backend, by default it is used when available.
+
+        Column names may be given in snake_case, like model attributes.
+    """
+
+    def __init__(self, photos=(), client=None, keep_data=False,
+                 use_numpy=None):
+        if use_numpy and numpy is None:
+            raise ImportError("numpy is not available")
+        self.client = client
+        self.numpy = numpy if use_numpy is not False else None
+        self._index = None
+        self._records = [] if keep_data else None
+
+        columns = dict((name, [] if kind == "object" else
+                        array.array(_INT if kind == "int" else "d"))
+                       for name, kind in COLUMNS.items())
+        for photo in photos:
+            data = photo.data if isinstance(photo, Photo) else photo
+            if self.client is None and isinstance(photo, Photo):
+                self.client = photo.client
+            for name, kind in COLUMNS.items():
+                value = data.get(name)
+                if kind == "int":
+                    value = _int(value)
+                elif kind == "float":
+                    value = _float(value)
+                columns[name].append(value)
+            if keep_data:
+                self._records.append(photo)
+
+        if self.numpy is not None:
+            for name, kind in COLUMNS.items():
+                if kind == "object":
+                    column = numpy.empty(len(columns[name]), dtype=object)
+                    column[:] = columns[name]
+                else:
+                    column = numpy.frombuffer(columns[name],
+                                              dtype=columns[name].typecode)
+                columns[name] = column
+        self._columns = columns
+
+    @classmethod
+    def fetch(cls, client, keep_data=False, use_numpy=None, prefetch=None,
+              **kwargs):
+        """ Builds a collection from the photo listing, filtered by kwargs
+            as in Photo.all, without building Photo objects.
+        """
+        url = "{0}/list.json".format(Photo.collection_path)
+        partial = functools.partial(client.request, "get", url, params=kwargs)
+        listing = Photo.iterate(client, partial, klass=_raw,
+                                prefetch=prefetch)
+        return cls(listing, client=client, keep_data=keep_data,
+                   use_numpy=use_numpy)
+
+    def _view(self, index):
+        view = object.__new__(type(self))
+        view.client = self.client
+        view.numpy = self.numpy
+        view._records = self._records
+        view._columns = self._columns
+        view._index = index
+        return view
+
+    @property
+    def rows(self):
+        """ Positions of the photos of this view in the underlying columns """
+        if self._index is not None:
+            return self._index
+        size = len(self._columns["id"])
+        if self.numpy is not None:
+            return self.numpy.arange(size)
+        return range(size)
+
+    def __len__(self):
+        if self._index is not None:
+            return len(self._index)
+        return len(self._columns["id"])
+
+    @staticmethod
+    def _name(name):
+        name = Base._convert_attr(name)
+        if name not in COLUMNS:
+            raise KeyError("Unknown column {0}".format(name))
+        return name
+
+    def column(self, name):
+        """ Returns the values of column name for the photos of this view """
+        name = self._name(name)
+        column = self._columns[name]
+        if self._index is None:
+            return column
+        if self.numpy is not None:
+            return column[self._index]
+        if COLUMNS[name] == "object":
+            return [column[i] for i in self._index]
+        return array.array(column.typecode, (column[i] for i in self._index))
+
+    def missing(self, name):
+        """ Returns a boolean sequence, True where column name is missing """
+        name = self._name(name)
+        kind = COLUMNS[name]
+        values = self.column(name)
+        if self.numpy is None:
+            return [_is_missing(kind, v) for v in values]
+        if kind == "object":
+            return self.numpy.fromiter((v is None for v in values), bool,
+                                       len(values))
+        if kind == "int":
+            return values == MISSING
+        return self.numpy.isnan(values)
+
+    def _condition(self, key, value):
+        name, _, op = key.rpartition("__")
+        if op not in _COMPARISONS and op not in ("in", "range", "missing",
+                                                 "ne", "eq"):
+            name, op = key, "eq"
+        name = self._name(name)
+        values = self.column(name)
+        missing = self.missing(name)
+
+        if op == "missing":
+            if self.numpy is not None:
+                return missing if value else ~missing
+            return [m == bool(value) for m in missing]
+
+        if self.numpy is not None:
+            np = self.numpy
+            if op == "eq":
+                return np.equal(values, value)
+            if op == "ne":
+                return np.not_equal(values, value)
+            if op == "in":
+                return np.isin(values, list(value))
+            if op == "range":
+                low, high = value
+                return (values >= low) & (values <= high) & ~missing
+            return _COMPARISONS[op](values, value) & ~missing
+
+        if op == "eq":
+            return [v == value for v in values]
+        if op == "ne":
+            return [v != value for v in values]
+        if op == "in":
+            value = set(value)
+            return [v in value for v in values]
+        if op == "range":
+            low, high = value
+            return [not m and low <= v <= high
+                    for v, m in zip(values, missing)]
+        compare = _COMPARISONS[op]
+        return [not m and compare(v, value) for v, m in zip(values, missing)]
+
+    def filter(self, mask=None, **conditions):
+        """ Returns a view of the photos matching all the conditions.
+
+            mask is a boolean sequence as long as the collection. Conditions
+            are column=value or column__op=value, op being one of eq, ne, lt,
+            le, gt, ge, in, range (an inclusive (low, high) pair) and missing
+            (a boolean). Missing values never satisfy a comparison.
+        """
+        masks = [] if mask is None else [mask]
+        masks.extend(self._condition(key, value)
+                     for key, value in sorted(conditions.items()))
+        rows = self.rows
+        if self.numpy is not None:
+            selected = self.numpy.ones(len(self), dtype=bool)
+            for mask in masks:
+                selected &= self.numpy.asarray(mask, dtype=bool)
+            return self._view(rows[selected])
+
+        if not masks:
+            return self._view(array.array(_INT, rows))
+        selected = (row for row, ok in zip(rows, zip(*masks)) if all(ok))
+        return self._view(array.array(_INT, selected))
+
+    def sort(self, by, reverse=False):
+        """ Returns a view sorted by one column, or by a list of columns
+            (the first being the primary key). The sort is stable.
+        """
+        names = [by] if isinstance(by, stringcls) else list(by)
+        columns = [self.column(name) for name in names]
+        rows = self.rows
+        if self.numpy is not None:
+            if reverse:
+                # sorting the reversed rows and reversing the result keeps
+                # equal keys in their original order, like sorted()
+                columns = [column[::-1] for column in columns]
+            if len(columns) == 1:
+                order = self.numpy.argsort(columns[0], kind="stable")
+            else:
+                order = self.numpy.lexsort(columns[::-1])
+            if reverse:
+                order = (len(self) - 1 - order)[::-1]
+            return self._view(rows[order])
+
+        if len(columns) == 1:
+            key = columns[0].__getitem__
+        else:
+            key = lambda i: tuple(column[i] for column in columns)
+        order = sorted(range(len(self)), key=key, reverse=reverse)
+        return self._view(array.array(_INT, (rows[i] for i in order)))
+
+    def _keys(self, name, period):
+        kind = COLUMNS[name]
+        values = self.column(name)
+        missing = self.missing(name)
+        if period is None:
+            if self.numpy is not None and kind != "object":
+                values = values.tolist()
+            return [None if m else v for v, m in zip(values, missing)]
+
+        fmt, unit = PERIODS[period]
+        if self.numpy is None:
+            return [None if m else time.strftime(fmt, time.gmtime(v))
+                    for v, m in zip(values, missing)]
+
+        dates = values.astype("datetime64[s]").astype(
+            "datetime64[{0}]".format(unit)).astype(str)
+        keys = dates.astype(object)
+        keys[missing] = None
+        return keys
+
+    def group_by(self, by, period=None):
+        """ Returns an OrderedDict mapping every distinct value of column by
+            to the view of its photos, sorted by value; photos missing the
+            value are grouped under None, last. For date columns period can
+            be "year", "month" or "day": keys are then "2013", "2013-05" or
+            "2013-05-21" (UTC).
+        """
+        name = self._name(by)
+        if period is not None and period not in PERIODS:
+            raise ValueError("Invalid period {0}".format(period))
+        keys = self._keys(name, period)
+        rows = self.rows
+        groups = OrderedDict()
+
+        if self.numpy is not None:
+            np = self.numpy
+            keys = np.asarray(keys, dtype=object)
+            missing = np.fromiter((k is None for k in keys), bool, len(keys))
+            present = ~missing
+            if present.any():
+                unique, inverse = np.unique(keys[present].tolist(),
+                                            return_inverse=True)
+                order = np.argsort(inverse, kind="stable")
+                bounds = np.cumsum(np.bincount(inverse))[:-1]
+                for key, index in zip(unique.tolist(),
+                                      np.split(rows[present][order], bounds)):
+                    groups[key] = self._view(index)
+            if missing.any():
+                groups[None] = self._view(rows[missing])
+            return groups
+
+        buckets = collections.defaultdict(lambda: array.array(_INT))
+        for row, key in zip(rows, keys):
+            buckets[key].append(row)
+        for key in sorted(k for k in buckets if k is not None):
+            groups[key] = self._view(buckets[key])
+        if None in buckets:
+            groups[None] = self._view(buckets[None])
+        return groups
+
+    def sum(self, name):
+        """ Sum of the (non missing) values of a numeric column """
+        name = self._name(name)
+        values = self.column(name)
+        if self.numpy is not None:
+            values = values[~self.missing(name)]
+            return values.sum().item() if len(values) else 0
+        return sum(v for v, m in zip(values, self.missing(name)) if not m)
+
+    # -- photos
+    def photo(self, position):
+        """ Returns the Photo at position in this view """
+        row = int(self.rows[position])
+        if self._records is not None:
+            record = self._records[row]
+            if isinstance(record, Photo):
+                return record
+            return Photo(self.client, dict(record))
+
+        data = {}
+        for name, kind in COLUMNS.items():
+            value = self._columns[name][row]
+            if not _is_missing(kind, value):
+                data[name] = value.item() if hasattr(value, "item") else value
+        return Photo(self.client, data)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            rows = self.rows[key]
+            if self.numpy is None:
+                rows = array.array(_INT, rows)
+            return self._view(rows)
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return self.photo(key)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self.photo(position)
+
+    def __repr__(self):
+        return "<PhotoCollection {0} photos>".format(len(self))
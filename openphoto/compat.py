@@ -1,13 +1,40 @@
 #!/usr/bin/env python
 import sys
 
+try:
+    from collections.abc import Iterable
+
+except ImportError:  # pragma: no cover
+    from collections import Iterable
+
+try:
+    from collections import OrderedDict
+
+except ImportError:  # pragma: no cover
+    # python 2.6: the ordereddict backport
+    from ordereddict import OrderedDict
+
+try:
+    import queue
+
+except ImportError:  # pragma: no cover
+    import Queue as queue
+
 PY3 = sys.version_info[0] == 3
 
 if PY3:  # pragma: no cover
     stringcls = str
+    unichr = chr
 
 else:  # pragma: no cover
     stringcls = basestring
+    unichr = unichr
+
+
+def with_metaclass(meta, *bases):
+    """ Returns a base class with metaclass meta, for both python 2 and 3 """
+    return meta("NewBase", bases, {"__slots__": ()})
 
 
-__all__ = ["stringcls"]
+__all__ = ["Iterable", "OrderedDict", "queue", "stringcls", "unichr",
+           "with_metaclass"]
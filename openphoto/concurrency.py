@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+import collections
+import sys
+import threading
+from concurrent import futures
+from .compat import queue
+from .instrument import (current_operations,
+                         operations_context)
+
+
+def _in_context(fn, operations):
+    def call(item):
+        with operations_context(operations):
+            return fn(item)
+    return call
+
+
+def bounded_map(fn, iterable, workers=4, window=None, executor=None,
+                ordered=True):
+    """ Lazily map fn over iterable on a thread pool.
+
+        At most ``window`` calls (default: ``workers``) are in flight at any
+        time, and the input iterable is consumed only as results are
+        yielded.  If ordered is True results are yielded in input order,
+        otherwise as soon as they complete.  Exceptions raised by fn are
+        re-raised when the corresponding result is yielded.
+        Requests made by fn are attributed to the caller's model operations.
+    """
+    window = window or workers
+    operations = current_operations()
+    if operations:
+        fn = _in_context(fn, operations)
+    own_executor = executor is None
+    if own_executor:
+        executor = futures.ThreadPoolExecutor(max_workers=workers)
+
+    iterator = iter(iterable)
+    pending = collections.deque()
+    try:
+        for item in iterator:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= window:
+                break
+
+        while pending:
+            if ordered:
+                future = pending.popleft()
+                result = future.result()
+            else:
+                done, _ = futures.wait(pending,
+                                       return_when=futures.FIRST_COMPLETED)
+                future = done.pop()
+                pending.remove(future)
+                result = future.result()
+
+            for item in iterator:
+                pending.append(executor.submit(fn, item))
+                break
+
+            yield result
+
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
+_DONE = object()
+
+
+def read_ahead(iterable, window=4):
+    """ Iterates over iterable on a background thread, keeping up to window
+        items ready ahead of the consumer; useful when producing each item
+        depends on the previous one, so bounded_map can't help.
+
+        Exceptions are re-raised in the consumer, and closing the returned
+        generator stops the background thread.
+    """
+    items = queue.Queue(maxsize=window)
+    stopped = threading.Event()
+    operations = current_operations()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            with operations_context(operations):
+                for item in iterator:
+                    if not put((item, None)):
+                        return
+            put((_DONE, None))
+
+        except Exception:
+            put((_DONE, sys.exc_info()[1]))
+
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+
+    finally:
+        stopped.set()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+""" JSON decoding of API responses.
+
+    The body of a response is decoded at most once: the client checks the
+    API code of every response, and the models then read the result from
+    the same decoded object. orjson or ujson are used when installed, as
+    they are several times faster than the json module on listing pages.
+
+    Listings can also be parsed incrementally with iter_items, yielding
+    every element of the result as soon as it has been received.
+"""
+import codecs
+import json
+import re
+import requests
+from .compat import OrderedDict
+
+try:
+    import orjson
+
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+
+except ImportError:  # pragma: no cover
+    ujson = None
+
+
+def _json_loads(content):
+    if isinstance(content, bytes):
+        content = content.decode("utf-8")
+    return json.loads(content)
+
+
+# available decoders, fastest first
+DECODERS = OrderedDict()
+if orjson is not None:
+    DECODERS["orjson"] = orjson.loads
+if ujson is not None:
+    DECODERS["ujson"] = ujson.loads
+DECODERS["json"] = _json_loads
+
+
+def get_decoder(decoder=None):
+    """ Returns a loads(bytes) function: decoder itself if it is callable,
+        the DECODERS entry called decoder, or the fastest available if None.
+    """
+    if decoder is None:
+        return next(iter(DECODERS.values()))
+    if callable(decoder):
+        return decoder
+    try:
+        return DECODERS[decoder]
+
+    except KeyError:
+        raise ValueError("Unknown or unavailable JSON decoder '{0}': "
+                         "available: {1}".format(decoder,
+                                                 ", ".join(DECODERS)))
+
+
+def attach(response, loads=None):
+    """ Makes response.json() decode the body with loads, the first time it
+        is called, and return the same object afterwards. Objects that are
+        not requests.Responses are returned unchanged.
+    """
+    if not isinstance(response, requests.Response):
+        return response
+    loads = loads or get_decoder()
+    state = {}
+
+    def json_(**kwargs):
+        if "result" not in state:
+            try:
+                state["result"] = loads(response.content)
+
+            except Exception:
+                # unusual encodings: let requests guess
+                state["result"] = requests.Response.json(response, **kwargs)
+        return state["result"]
+
+    response.json = json_
+    return response
+
+
+# value of Client.request(stream=...) for JSON bodies parsed incrementally:
+# the client does not buffer them to check the API code
+STREAM_JSON = "json"
+
+_WHITESPACE = re.compile(r"[ \t\n\r,]*")
+_NUMBER = frozenset("0123456789.eE+-")
+_decoder = json.JSONDecoder()
+
+
+class _Buffer(object):
+    """ Text decoded from chunks of bytes, read as needed """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.pos = 0
+        self.exhausted = False
+
+    def more(self):
+        """ Reads one more chunk; returns False at the end of the body """
+        for chunk in self.chunks:
+            self.text = self.text[self.pos:] + self.decoder.decode(chunk)
+            self.pos = 0
+            return True
+        self.exhausted = True
+        return False
+
+    def skip(self, chars=None):
+        """ Skips whitespace and commas, returns the next character """
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                char = self.text[self.pos]
+                if chars is not None and char not in chars:
+                    raise ValueError("Expected {0!r} at {1!r}".format(
+                        chars, self.text[self.pos:self.pos + 20]))
+                return char
+            if not self.more():
+                raise ValueError("Truncated JSON")
+
+    def value(self):
+        """ Decodes the next complete JSON value """
+        self.skip()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+                # a number may continue in the next chunk ("-1" of "-1.5")
+                if self.exhausted or (end < len(self.text) and
+                                      self.text[end] not in _NUMBER):
+                    self.pos = end
+                    return value
+
+            except ValueError:
+                if self.exhausted:
+                    raise
+            self.more()
+
+
+def iter_items(chunks, key="result", fields=None):
+    """ Parses a JSON object from chunks of bytes (e.g.
+        response.iter_content()) and yields the elements of its key array
+        as soon as they are complete, without buffering the whole body.
+
+        The other members of the object are stored in fields, if given, once
+        the object has been parsed.
+    """
+    buf = _Buffer(chunks)
+    buf.skip("{")
+    buf.pos += 1
+    while buf.skip() != "}":
+        name = buf.value()
+        buf.skip(":")
+        buf.pos += 1
+        if name == key and buf.skip() == "[":
+            buf.pos += 1
+            while buf.skip() != "]":
+                yield buf.value()
+            buf.pos += 1
+        elif fields is not None:
+            fields[name] = buf.value()
+        else:
+            buf.value()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+import collections
+import logging
+import os
+import shutil
+import threading
+import time
+import requests
+from .compat import stringcls
+from .concurrency import bounded_map
+
+try:
+    from urlparse import urlparse
+
+except ImportError:  # pragma: nocover
+    from urllib.parse import urlparse
+
+
+DownloadResult = collections.namedtuple("DownloadResult",
+                                        "photo size path bytes elapsed error")
+
+
+def _range_start(response):
+    """ First byte of the Content-Range of response, None if missing """
+    try:
+        unit, range_ = response.headers["Content-Range"].split(None, 1)
+        return int(range_.split("-", 1)[0]) if unit == "bytes" else None
+
+    except (KeyError, ValueError):
+        return None
+
+
+def _range_total(response):
+    """ Complete length in the Content-Range of response (e.g. the
+        "bytes */<total>" of a 416), None if missing or unknown
+    """
+    try:
+        unit, range_ = response.headers["Content-Range"].split(None, 1)
+        return int(range_.rsplit("/", 1)[1]) if unit == "bytes" else None
+
+    except (KeyError, ValueError, IndexError):
+        return None
+
+
+class DownloadStats(object):
+    """ Counters updated by a DownloadManager while it runs """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = 0
+        self.resumed = 0
+        self.errors = 0
+        self.bytes = 0
+        self.started = None
+        self.finished = None
+
+    def add(self, result, resumed):
+        with self.lock:
+            if result.error is not None:
+                self.errors += 1
+            else:
+                self.files += 1
+            if resumed:
+                self.resumed += 1
+            self.bytes += result.bytes
+            self.finished = time.time()
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def throughput(self):
+        """ Downloaded bytes per second """
+        elapsed = self.elapsed
+        return self.bytes / elapsed if elapsed else 0.0
+
+    def __repr__(self):
+        return ("<DownloadStats files={0.files} errors={0.errors} "
+                "resumed={0.resumed} bytes={0.bytes} "
+                "throughput={0.throughput:.0f}B/s>".format(self))
+
+
+class DownloadManager(object):
+    """ Downloads many photo sizes concurrently.
+
+        Files are written to "<destination>.part" and renamed when
+        complete; a .part file left over by an interrupted download is
+        resumed with an HTTP Range request.
+    """
+    log = logging.getLogger(__name__)
+
+    def __init__(self, workers=8, chunk_size=1024 * 1024, overwrite=False):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.overwrite = overwrite
+        self.stats = DownloadStats()
+
+    @staticmethod
+    def filename(photo, size, url):
+        """ Default name of the downloaded file: <id>_<size><ext> """
+        ext = os.path.splitext(urlparse(url).path)[1] or ".jpg"
+        return "{0}_{1}{2}".format(photo.id, size, ext)
+
+    def download(self, photos, sizes, directory):
+        """ Downloads the given sizes of every photo into directory.
+
+            Returns a generator of DownloadResult(photo, size, path, bytes,
+            elapsed, error), yielded as files complete.
+        """
+        if isinstance(sizes, stringcls):
+            sizes = [sizes]
+
+        if self.stats.started is None:
+            self.stats.started = time.time()
+
+        def fetch_photo(photo):
+            try:
+                photo_sizes = photo.sizes.get_sizes(sizes)
+
+            except Exception as e:
+                self.log.error("Cannot get sizes of %s: %s", photo, e)
+                return [DownloadResult(photo, size, None, 0, 0.0, e)
+                        for size in sizes]
+
+            results = []
+            for size, photo_size in zip(sizes, photo_sizes):
+                name = self.filename(photo, size, photo_size.url)
+                path = os.path.join(directory, name)
+                results.append(self.fetch(photo, size, photo_size, path))
+            return results
+
+        for results in bounded_map(fetch_photo, photos, workers=self.workers,
+                                   ordered=False):
+            for result in results:
+                yield result
+
+    def fetch(self, photo, size, photo_size, path):
+        """ Downloads photo_size to path, resuming path.part if present """
+        start = time.time()
+        part = path + ".part"
+        offset = 0
+        written = 0
+        try:
+            if os.path.exists(path) and not self.overwrite:
+                result = DownloadResult(photo, size, path, 0, 0.0, None)
+                self.stats.add(result, False)
+                return result
+
+            if os.path.exists(part):
+                offset = os.path.getsize(part)
+
+            written, offset = self._fetch(photo_size, part, offset)
+            if os.path.exists(path):
+                os.unlink(path)
+            os.rename(part, path)
+            result = DownloadResult(photo, size, path, written,
+                                    time.time() - start, None)
+
+        except Exception as e:
+            self.log.error("Error downloading %s: %s", photo_size.url, e)
+            result = DownloadResult(photo, size, path, written,
+                                    time.time() - start, e)
+
+        self.stats.add(result, offset > 0)
+        return result
+
+    def _fetch(self, photo_size, part, offset):
+        """ Downloads photo_size to part, appending from offset if the server
+            sends that range; returns (bytes written, offset resumed from)
+        """
+        headers = {}
+        if offset:
+            headers["Range"] = "bytes={0}-".format(offset)
+
+        try:
+            response = photo_size.client.request_full_url(
+                "get", photo_size.url, stream=True, headers=headers)
+
+        except requests.exceptions.HTTPError as e:
+            if not offset or e.response.status_code != 416:
+                raise
+            total = _range_total(e.response)
+            if total == offset:
+                # the .part file already holds the whole content
+                return 0, offset
+            # larger than the resource, or left from a different one
+            self.log.warning("%s has %s bytes, not the %d of the .part file, "
+                             "restarting", photo_size.url, total, offset)
+            return self._fetch(photo_size, part, 0)
+
+        try:
+            if offset and response.status_code != 206:
+                self.log.debug("%s does not support ranges", photo_size.url)
+                offset = 0
+
+            elif offset and _range_start(response) != offset:
+                self.log.warning("%s sent the wrong range (%s), restarting",
+                                 photo_size.url,
+                                 response.headers.get("Content-Range"))
+                response.close()
+                return self._fetch(photo_size, part, 0)
+
+            mode = "ab" if offset else "wb"
+            response.raw.decode_content = True
+            with open(part, mode, self.chunk_size) as file_:
+                shutil.copyfileobj(response.raw, file_, self.chunk_size)
+            return os.path.getsize(part) - offset, offset
+
+        finally:
+            response.close()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+""" Model change events.
+
+    Successful model operations that change the library are reported as
+    ModelEvents to the callables added with Client.add_model_listener, so
+    that local state (e.g. an index.CatalogueIndex) can follow them.
+"""
+import collections
+import logging
+
+log = logging.getLogger(__name__)
+
+ModelEvent = collections.namedtuple("ModelEvent", [
+    "action",   # "created", "updated", "deleted", "added" or "removed"
+    "obj",      # the model object (the album, for added / removed)
+    "changes",  # dict: the parameters of a batch update, or the "photos"
+                # ids added to / removed from an album
+])
+
+
+def emit(client, action, obj, **changes):
+    """ Reports a ModelEvent to the model listeners of client, if any """
+    listeners = getattr(client, "model_listeners", None)
+    if not isinstance(listeners, list) or not listeners:
+        return
+
+    event = ModelEvent(action, obj, changes)
+    for listener in list(listeners):
+        try:
+            listener(event)
+        except Exception:
+            log.exception("Error in model listener %s", listener)
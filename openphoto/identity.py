@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+import threading
+import weakref
+from .compat import OrderedDict
+
+
+class IdentityMap(object):
+    """ Maps (model class, id) to the one instance of that object used by a
+        client.
+
+        Pass it to Client(identity_map=...): every model built for that
+        client with an id in its data resolves to the canonical instance,
+        whose data is merged with the new fields.
+
+        max_size bounds the number of instances kept alive by the map (least
+        recently used first out). If weak is True, instances are also kept
+        in the map, without keeping them alive, as long as something else
+        references them.
+    """
+
+    def __init__(self, max_size=None, weak=False):
+        self.max_size = max_size
+        self.lock = threading.RLock()
+        self.strong = OrderedDict()
+        self.weak = weakref.WeakValueDictionary() if weak else None
+
+    @staticmethod
+    def key(cls, id_):
+        return cls, str(id_)
+
+    def __len__(self):
+        with self.lock:
+            if self.weak is not None:
+                return len(self.weak)
+            return len(self.strong)
+
+    def __contains__(self, key):
+        return self.get(*key) is not None
+
+    def get(self, cls, id_):
+        key = self.key(cls, id_)
+        with self.lock:
+            obj = self.strong.pop(key, None)
+            if obj is None and self.weak is not None:
+                obj = self.weak.get(key)
+            if obj is not None:
+                self._keep(key, obj)
+            return obj
+
+    def add(self, obj):
+        key = self.key(type(obj), obj.data["id"])
+        with self.lock:
+            if self.weak is not None:
+                self.weak[key] = obj
+            self.strong.pop(key, None)
+            self._keep(key, obj)
+
+    def _keep(self, key, obj):
+        if self.weak is not None and not self.max_size:
+            return
+        self.strong[key] = obj
+        if self.max_size:
+            while len(self.strong) > self.max_size:
+                self.strong.popitem(last=False)
+
+    def discard(self, obj):
+        try:
+            key = self.key(type(obj), obj.data["id"])
+        except KeyError:
+            return
+        with self.lock:
+            self.strong.pop(key, None)
+            if self.weak is not None:
+                self.weak.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.strong.clear()
+            if self.weak is not None:
+                self.weak.clear()
+
+
+def identity_map(client):
+    """ Returns the IdentityMap of client, or None """
+    imap = getattr(client, "identity_map", None)
+    return imap if isinstance(imap, IdentityMap) else None
+
+
+class ModelMeta(type):
+    """ Metaclass of the models: resolves Model(client, data) through the
+        client identity map, if any.
+    """
+
+    def __call__(cls, client, data, *args, **kwargs):
+        imap = identity_map(client)
+        if imap is None or not isinstance(data, dict) or "id" not in data:
+            return super(ModelMeta, cls).__call__(client, data, *args,
+                                                  **kwargs)
+
+        with imap.lock:
+            obj = imap.get(cls, data["id"])
+            if obj is None:
+                obj = super(ModelMeta, cls).__call__(client, data, *args,
+                                                     **kwargs)
+                imap.add(obj)
+            else:
+                obj._merge_data(data)
+            return obj
@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+""" Offline query index over photos, tags and albums.
+
+    A CatalogueIndex answers faceted queries ("photos with tags a and b,
+    taken in 2019, within 10km of X") from memory: an inverted index from
+    tags and albums to photo ids, sorted date indexes and a latitude /
+    longitude grid. Attached to a client it follows the changes made through
+    the models (Photo.create / update, Album.add / remove, deletions).
+"""
+import bisect
+import math
+import threading
+from .compat import unichr
+from .models import (Album,
+                     Photo)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# sorts after any photo id
+_LAST_ID = unichr(0xffff)
+
+
+def _timestamp(value):
+    try:
+        return int(float(value))
+
+    except (TypeError, ValueError):
+        return None
+
+
+def _coordinate(value):
+    try:
+        value = float(value)
+
+    except (TypeError, ValueError):
+        return None
+
+    return None if value != value else value
+
+
+def _tags(value):
+    if not value:
+        return set()
+    if isinstance(value, (list, tuple, set)):
+        return set(str(t) for t in value)
+    return set(t.strip() for t in str(value).split(",") if t.strip())
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """ Great circle distance in km """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class _SortedIndex(object):
+    """ (value, id) pairs kept sorted, for range queries """
+
+    def __init__(self):
+        self.keys = []
+
+    def add(self, value, id_):
+        if value is not None:
+            bisect.insort(self.keys, (value, id_))
+
+    def discard(self, value, id_):
+        if value is None:
+            return
+        pos = bisect.bisect_left(self.keys, (value, id_))
+        if pos < len(self.keys) and self.keys[pos] == (value, id_):
+            del self.keys[pos]
+
+    def range(self, start=None, end=None):
+        """ Ids whose value is in [start, end], None meaning unbounded """
+        low = 0 if start is None else bisect.bisect_left(self.keys,
+                                                         (start, ""))
+        if end is None:
+            high = len(self.keys)
+        else:
+            high = bisect.bisect_right(self.keys, (end, _LAST_ID))
+        return set(id_ for _, id_ in self.keys[low:high])
+
+
+class CatalogueIndex(object):
+    """ In-memory index of photos, queried with query().
+
+        cell_size is the side, in degrees, of the cells of the geographic
+        grid. Photo data is stored as returned by the API, so query() can
+        return Photo objects without requests.
+    """
+    date_fields = ("dateTaken", "dateUploaded")
+
+    def __init__(self, client=None, cell_size=0.1):
+        self.client = client
+        self.cell_size = cell_size
+        self.lock = threading.RLock()
+        self.photos = {}
+        self.tags = {}
+        self.albums = {}
+        self.album_names = {}
+        self.dates = dict((field, _SortedIndex())
+                          for field in self.date_fields)
+        self.grid = {}
+
+    # -- building
+    def _cell(self, lat, lon):
+        return (int(math.floor(lat / self.cell_size)),
+                int(math.floor(lon / self.cell_size)))
+
+    def add_photo(self, photo):
+        """ Indexes (or re-indexes) a Photo or its data dictionary """
+        data = photo.data if isinstance(photo, Photo) else photo
+        data = dict(data)
+        if isinstance(photo, Photo) and photo._paths:
+            data.update(("path" + k, v) for k, v in photo._paths.items())
+        id_ = str(data["id"])
+        with self.lock:
+            self._unindex(id_)
+            self.photos[id_] = data
+            for tag in _tags(data.get("tags")):
+                self.tags.setdefault(tag, set()).add(id_)
+            for field, index in self.dates.items():
+                index.add(_timestamp(data.get(field)), id_)
+            lat = _coordinate(data.get("latitude"))
+            lon = _coordinate(data.get("longitude"))
+            if lat is not None and lon is not None:
+                self.grid.setdefault(self._cell(lat, lon), set()).add(id_)
+
+    def _unindex(self, id_):
+        data = self.photos.pop(id_, None)
+        if data is None:
+            return
+        for tag in _tags(data.get("tags")):
+            self._discard(self.tags, tag, id_)
+        for field, index in self.dates.items():
+            index.discard(_timestamp(data.get(field)), id_)
+        lat = _coordinate(data.get("latitude"))
+        lon = _coordinate(data.get("longitude"))
+        if lat is not None and lon is not None:
+            self._discard(self.grid, self._cell(lat, lon), id_)
+
+    def remove_photo(self, photo):
+        """ Removes a Photo (or photo id) from the index and its albums """
+        id_ = str(photo.id if isinstance(photo, Photo) else photo)
+        with self.lock:
+            self._unindex(id_)
+            for photos in self.albums.values():
+                photos.discard(id_)
+
+    @staticmethod
+    def _discard(mapping, key, id_):
+        ids = mapping.get(key)
+        if ids is not None:
+            ids.discard(id_)
+            if not ids:
+                del mapping[key]
+
+    def add_album(self, album, photos=None):
+        """ Indexes an Album (or its data); its members are photos (Photos
+            or ids) if given, otherwise the "photos" of its data, if any.
+        """
+        data = album.data if isinstance(album, Album) else album
+        id_ = str(data["id"])
+        if photos is None:
+            photos = data.get("photos") or ()
+        ids = set(str(p["id"] if isinstance(p, dict) else
+                      getattr(p, "id", p)) for p in photos)
+        with self.lock:
+            self.albums.setdefault(id_, set()).update(ids)
+            if data.get("name") is not None:
+                self.album_names[data["name"]] = id_
+
+    def remove_album(self, album):
+        id_ = str(album.id if isinstance(album, Album) else album)
+        with self.lock:
+            self.albums.pop(id_, None)
+            for name, album_id in list(self.album_names.items()):
+                if album_id == id_:
+                    del self.album_names[name]
+
+    def update(self, photos=(), albums=()):
+        """ Indexes many photos and albums, e.g. from Photo.all() or a
+            sync.Mirror
+        """
+        for photo in photos:
+            self.add_photo(photo)
+        for album in albums:
+            self.add_album(album)
+        return self
+
+    def __len__(self):
+        return len(self.photos)
+
+    def __contains__(self, photo):
+        return str(photo.id if isinstance(photo, Photo) else photo) in \
+            self.photos
+
+    # -- following the client
+    def attach(self, client=None):
+        """ Keeps the index up to date with the changes made through client
+            (default: the index client).
+        """
+        client = client or self.client
+        self.client = self.client or client
+        client.add_model_listener(self.handle)
+        return self
+
+    def detach(self, client=None):
+        (client or self.client).remove_model_listener(self.handle)
+
+    def handle(self, event):
+        """ Applies an events.ModelEvent """
+        obj = event.obj
+        if isinstance(obj, Photo):
+            if event.action == "deleted":
+                self.remove_photo(obj)
+            elif event.changes:
+                # batch updates only tell what was sent
+                self._apply_changes(str(obj.id), event.changes)
+            elif len(obj.data) > 1:
+                self.add_photo(obj)
+
+        elif isinstance(obj, Album):
+            if event.action == "deleted":
+                self.remove_album(obj)
+            elif event.action == "added":
+                self.add_album(obj, event.changes.get("photos", ()))
+            elif event.action == "removed":
+                with self.lock:
+                    photos = self.albums.get(str(obj.id), set())
+                    photos.difference_update(event.changes.get("photos", ()))
+            else:
+                self.add_album(obj)
+
+    def _apply_changes(self, id_, changes):
+        """ Applies the parameters of a batch update to an indexed photo """
+        with self.lock:
+            data = self.photos.get(id_)
+            if data is None:
+                return
+            data = dict(data)
+            tags = _tags(data.get("tags"))
+            for key, value in changes.items():
+                if key == "tags":
+                    tags = _tags(value)
+                elif key == "tagsAdd":
+                    tags |= _tags(value)
+                elif key == "tagsRemove":
+                    tags -= _tags(value)
+                else:
+                    data[key] = value
+            data["tags"] = sorted(tags)
+            self.add_photo(data)
+
+    # -- queries
+    def _near(self, lat, lon, radius):
+        lat_span = radius / KM_PER_DEGREE
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        lon_span = min(180.0, lat_span / cos_lat)
+        south, west = self._cell(lat - lat_span, lon - lon_span)
+        north, east = self._cell(lat + lat_span, lon + lon_span)
+        cells = (north - south + 1) * (east - west + 1)
+
+        if cells > len(self.grid):
+            candidates = [ids for cell, ids in self.grid.items()
+                          if south <= cell[0] <= north and
+                          west <= cell[1] <= east]
+        else:
+            candidates = [self.grid[(y, x)]
+                          for y in range(south, north + 1)
+                          for x in range(west, east + 1)
+                          if (y, x) in self.grid]
+
+        result = set()
+        for ids in candidates:
+            for id_ in ids:
+                data = self.photos[id_]
+                if distance(lat, lon, _coordinate(data["latitude"]),
+                            _coordinate(data["longitude"])) <= radius:
+                    result.add(id_)
+        return result
+
+    def _bbox(self, south, west, north, east):
+        low_y, low_x = self._cell(south, west)
+        high_y, high_x = self._cell(north, east)
+        result = set()
+        for cell, ids in self.grid.items():
+            if low_y <= cell[0] <= high_y and low_x <= cell[1] <= high_x:
+                for id_ in ids:
+                    data = self.photos[id_]
+                    lat = _coordinate(data["latitude"])
+                    lon = _coordinate(data["longitude"])
+                    if south <= lat <= north and west <= lon <= east:
+                        result.add(id_)
+        return result
+
+    def query(self, tags=None, any_tags=None, album=None, taken=None,
+              uploaded=None, near=None, bbox=None, sort_by="dateTaken",
+              reverse=True, limit=None, ids=False):
+        """ Returns the photos matching all the given criteria:
+
+            tags: all of these tags; any_tags: at least one of these;
+            album: in this album (Album, id or name); taken / uploaded: a
+            (start, end) pair of timestamps, either None for unbounded;
+            near: (latitude, longitude, radius in km); bbox: (south, west,
+            north, east) in degrees.
+
+            Results are sorted by sort_by (newest first unless reverse is
+            False) and are Photo objects, or ids if ids is True.
+        """
+        with self.lock:
+            sets = []
+            for tag in tags or ():
+                sets.append(self.tags.get(tag, set()))
+            if any_tags:
+                sets.append(set().union(*[self.tags.get(tag, set())
+                                          for tag in any_tags]))
+            if album is not None:
+                if isinstance(album, Album):
+                    album = album.id
+                album = self.album_names.get(album, album)
+                sets.append(self.albums.get(str(album), set()))
+            if taken is not None:
+                sets.append(self.dates["dateTaken"].range(*taken))
+            if uploaded is not None:
+                sets.append(self.dates["dateUploaded"].range(*uploaded))
+            if near is not None:
+                sets.append(self._near(*near))
+            if bbox is not None:
+                sets.append(self._bbox(*bbox))
+
+            if sets:
+                sets.sort(key=len)
+                result = set(sets[0])
+                for other in sets[1:]:
+                    if not result:
+                        break
+                    result &= other
+                # album members may not be indexed photos
+                result = set(id_ for id_ in result if id_ in self.photos)
+            else:
+                result = set(self.photos)
+
+            def key(id_):
+                value = _timestamp(self.photos[id_].get(sort_by))
+                return (value is not None, value or 0, id_)
+
+            result = sorted(result, key=key, reverse=reverse)
+            if limit is not None:
+                result = result[:limit]
+            if ids:
+                return result
+            data = [dict(self.photos[id_]) for id_ in result]
+
+        return [Photo(self.client, d) for d in data]
@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+""" Pipelined ingestion of many files.
+
+    Files go through three stages connected by bounded queues, so that
+    hashing (CPU), uploads (network) and album updates overlap:
+
+    prepare: hash and EXIF metadata, on a pool of processes
+    upload:  Photo.create, on a pool of threads
+    attach:  adds the new photos to albums, in batches
+
+    A full queue blocks the stage feeding it, so memory does not grow with
+    the number of files.
+"""
+import collections
+import datetime
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent import futures
+from .compat import (OrderedDict,
+                     queue)
+from .concurrency import bounded_map
+from .models import Photo
+from .models.photo import UploadOnce
+from .utils import hash_
+
+try:
+    from PIL import Image
+
+except ImportError:  # pragma: no cover
+    Image = None
+
+IngestResult = collections.namedtuple("IngestResult",
+                                      "path photo skipped sha1 metadata error")
+
+EXIF_DATE_TAKEN = 36867  # DateTimeOriginal
+EXIF_GPS_INFO = 34853
+
+_DONE = object()
+
+
+def _rational(value):
+    if isinstance(value, tuple):
+        return float(value[0]) / float(value[1])
+    return float(value)
+
+
+def _coordinate(dms, ref):
+    degrees, minutes, seconds = [_rational(v) for v in dms]
+    value = degrees + minutes / 60 + seconds / 3600
+    return -value if ref in ("S", "W") else value
+
+
+def extract_metadata(path):
+    """ Returns the date_taken (datetime), latitude and longitude found in
+        the EXIF data of path, as Photo.create keyword arguments. Needs PIL;
+        returns an empty dictionary without it, or without EXIF data.
+    """
+    metadata = {}
+    if Image is None:
+        return metadata
+
+    try:
+        image = Image.open(path)
+
+    except Exception:
+        return metadata
+
+    try:
+        exif = image._getexif() or {}
+
+    except Exception:
+        return metadata
+
+    finally:
+        image.close()
+
+    try:
+        metadata["date_taken"] = datetime.datetime.strptime(
+            exif[EXIF_DATE_TAKEN], "%Y:%m:%d %H:%M:%S")
+    except (KeyError, TypeError, ValueError):
+        pass
+
+    try:
+        gps = exif[EXIF_GPS_INFO]
+        metadata["latitude"] = _coordinate(gps[2], gps[1])
+        metadata["longitude"] = _coordinate(gps[4], gps[3])
+    except (KeyError, IndexError, TypeError, ValueError, ZeroDivisionError):
+        pass
+
+    return metadata
+
+
+def prepare(path, extract=extract_metadata):
+    """ The prepare stage of a file, run in a worker process: returns
+        (path, sha1, metadata, error, elapsed)
+    """
+    start = time.time()
+    try:
+        return path, hash_(path), extract(path), None, time.time() - start
+
+    except Exception as e:
+        return path, None, {}, e, time.time() - start
+
+
+class StageStats(object):
+    """ Counters of a pipeline stage """
+
+    def __init__(self, name):
+        self.lock = threading.Lock()
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        # seconds spent working on items, summed over the workers
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+
+    def add(self, elapsed, error=None, items=1):
+        with self.lock:
+            now = time.time()
+            if self.started is None:
+                self.started = now - elapsed
+            if error is not None:
+                self.errors += items
+            else:
+                self.items += items
+            self.busy += elapsed
+            self.finished = now
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def throughput(self):
+        """ Items per second """
+        elapsed = self.elapsed
+        return self.items / elapsed if elapsed else 0.0
+
+    def __repr__(self):
+        return ("<StageStats {0.name} items={0.items} errors={0.errors} "
+                "busy={0.busy:.2f}s throughput={0.throughput:.1f}/s>"
+                .format(self))
+
+
+class IngestPipeline(object):
+    """ Uploads many files with client, overlapping the stages.
+
+        prepare_workers processes hash the files and extract their metadata
+        with extract (a picklable function of the path); upload_workers
+        threads upload them with Photo.create, called with create_kwargs
+        and, where those don't say otherwise, the extracted metadata (tags
+        among them: they are sent with the upload, costing no request). New
+        photos are then added to albums attach_batch at a time. Queues
+        between stages hold up to queue_size files.
+
+        If skip_existing is True, files whose hash is already on the server,
+        or earlier in the same run, are not uploaded.
+    """
+    log = logging.getLogger(__name__)
+    stages = ("prepare", "upload", "attach")
+
+    def __init__(self, client, albums=None, prepare_workers=None,
+                 upload_workers=4, queue_size=16, attach_batch=50,
+                 skip_existing=True, extract=extract_metadata,
+                 **create_kwargs):
+        self.client = client
+        self.albums = list(albums or ())
+        self.prepare_workers = prepare_workers
+        self.upload_workers = upload_workers
+        self.queue_size = queue_size
+        self.attach_batch = attach_batch
+        self.skip_existing = skip_existing
+        self.extract = extract
+        self.create_kwargs = create_kwargs
+        self.stats = OrderedDict(
+            (name, StageStats(name)) for name in self.stages)
+
+    def run(self, paths):
+        """ Ingests paths; returns a generator of IngestResult(path, photo,
+            skipped, sha1, metadata, error) yielded as files complete. A
+            failing file does not stop the others: its exception, or the
+            one raised adding it to the albums, is reported in error. If
+            the prepare stage fails as a whole (e.g. its process pool
+            breaks), every file not prepared yet is reported with that
+            error. Closing the generator stops the pipeline.
+        """
+        prepared = queue.Queue(maxsize=self.queue_size)
+        uploaded = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue(maxsize=self.queue_size)
+        stopped = threading.Event()
+        once = UploadOnce()
+        lock = threading.Lock()
+        remaining = [self.upload_workers]
+
+        def put(q, item):
+            while not stopped.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(q, timeout=None):
+            """ The next item of q, _DONE if stopped, None on timeout """
+            deadline = None if timeout is None else time.time() + timeout
+            while not stopped.is_set():
+                wait = 0.1
+                if deadline is not None:
+                    wait = min(wait, deadline - time.time())
+                    if wait <= 0:
+                        return None
+                try:
+                    return q.get(timeout=wait)
+                except queue.Empty:
+                    pass
+            return _DONE
+
+        def prepare_stage():
+            pool = futures.ProcessPoolExecutor(
+                max_workers=self.prepare_workers)
+            source = iter(paths)
+            # submitted to the pool, not prepared yet
+            pending = []
+
+            def submitted():
+                for path in source:
+                    pending.append(path)
+                    yield path
+
+            try:
+                fn = _Prepare(self.extract)
+                workers = self.prepare_workers or multiprocessing.cpu_count()
+                for item in bounded_map(fn, submitted(), workers=workers,
+                                        executor=pool, ordered=False):
+                    path, sha1, metadata, error, elapsed = item
+                    pending.remove(path)
+                    self.stats["prepare"].add(elapsed, error)
+                    if not put(prepared, item):
+                        return
+
+            except Exception as e:
+                self.log.exception("Prepare stage failed: %s", e)
+                for path in itertools.chain(pending, source):
+                    self.stats["prepare"].add(0.0, e)
+                    if not put(prepared, (path, None, {}, e, 0.0)):
+                        return
+
+            finally:
+                pool.shutdown(wait=False)
+                for _ in range(self.upload_workers):
+                    put(prepared, _DONE)
+
+        def upload_stage():
+            while True:
+                item = get(prepared)
+                if item is _DONE:
+                    break
+                result = self._upload(item, once)
+                if not put(uploaded, result):
+                    return
+            with lock:
+                remaining[0] -= 1
+                last = not remaining[0]
+            if last:
+                put(uploaded, _DONE)
+
+        def attach_stage():
+            batch = []
+            # nothing to attach: don't hold the results back
+            size = self.attach_batch if self.albums else 1
+            while True:
+                item = get(uploaded, 0.05 if batch else None)
+                if item is not None and item is not _DONE:
+                    batch.append(item)
+                if batch and (item is None or item is _DONE or
+                              len(batch) >= size):
+                    for result in self._attach(batch):
+                        if not put(results, result):
+                            return
+                    batch = []
+                if item is _DONE:
+                    put(results, _DONE)
+                    return
+
+        threads = [threading.Thread(target=prepare_stage),
+                   threading.Thread(target=attach_stage)]
+        threads.extend(threading.Thread(target=upload_stage)
+                       for _ in range(self.upload_workers))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            while True:
+                result = results.get()
+                if result is _DONE:
+                    return
+                yield result
+
+        finally:
+            stopped.set()
+
+    def _upload(self, item, once):
+        path, sha1, metadata, error, _ = item
+        if error is not None:
+            return IngestResult(path, None, False, sha1, metadata, error)
+
+        start = time.time()
+
+        def create():
+            try:
+                if (self.skip_existing and sha1 is not None and
+                        Photo.exists(self.client, sha1)):
+                    return skip()
+
+                kwargs = dict(metadata)
+                kwargs.update((k, v) for k, v in self.create_kwargs.items()
+                              if v is not None)
+                photo = Photo.create(self.client, path, **kwargs)
+                self.stats["upload"].add(time.time() - start)
+                return IngestResult(path, photo, False, sha1, metadata, None)
+
+            except Exception as e:
+                self.log.error("Error uploading %s: %s", path, e)
+                self.stats["upload"].add(time.time() - start, e)
+                return IngestResult(path, None, False, sha1, metadata, e)
+
+        def skip():
+            self.log.info("Skipping %s: already uploaded", path)
+            self.stats["upload"].add(time.time() - start)
+            return IngestResult(path, None, True, sha1, metadata, None)
+
+        if not self.skip_existing:
+            return create()
+        return once(sha1, create, skip)
+
+    def _attach(self, batch):
+        photos = [r.photo for r in batch if r.photo is not None]
+        if not self.albums or not photos:
+            return batch
+
+        start = time.time()
+        error = None
+        for album in self.albums:
+            try:
+                album.add(photos)
+
+            except Exception as e:
+                self.log.error("Error adding %d photos to %s: %s",
+                               len(photos), album, e)
+                error = e
+        self.stats["attach"].add(time.time() - start, error, len(photos))
+        if error is None:
+            return batch
+        return [r._replace(error=error) if r.photo is not None else r
+                for r in batch]
+
+
+class _Prepare(object):
+    """ prepare() bound to an extract function, picklable for the pool """
+
+    def __init__(self, extract):
+        self.extract = extract
+
+    def __call__(self, path):
+        return prepare(path, self.extract)
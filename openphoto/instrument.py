@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+""" Instrumentation of the API calls.
+
+    Every request made by a Client is reported as a RequestEvent to the
+    listeners added with Client.add_listener. Events carry the model
+    operations (e.g. "Photo.create", "Album.photos") that caused the
+    request; Metrics aggregates them into per endpoint latency histograms
+    and per operation counters.
+"""
+import bisect
+import collections
+import contextlib
+import functools
+import threading
+import types
+
+try:
+    from urlparse import urlsplit
+
+except ImportError:  # pragma: nocover
+    from urllib.parse import urlsplit
+
+
+RequestEvent = collections.namedtuple("RequestEvent", [
+    "method",      # upper case HTTP method
+    "url",         # full url, without query string
+    "endpoint",    # url path template, e.g. /photo/{id}/view.json
+    "status",      # HTTP status, None if no response was received
+    "bytes_out",   # request body size
+    "bytes_in",    # response body size
+    "ttfb",        # seconds until the response headers were received
+    "elapsed",     # total seconds, body included
+    "operations",  # tuple of the model operations, outermost first
+    "error",       # exception raised, if any
+    "cached",      # True if served from the client cache
+])
+
+
+def endpoint_template(url):
+    """ Returns the path of url with object ids, listing filters and file
+        names (of images) replaced by {id}, {filter} and {file}.
+    """
+    segments = urlsplit(url).path.split("/")
+    if not segments[-1].endswith(".json"):
+        segments[-1] = "{file}"
+    # segments[0] is the empty string before the leading slash
+    if len(segments) > 3:
+        if segments[1].endswith("s"):
+            segments[2:-1] = ["{filter}"]
+        else:
+            segments[2] = "{id}"
+    return "/".join(segments)
+
+
+_local = threading.local()
+
+
+def current_operations():
+    """ Returns the model operations running in this thread """
+    return getattr(_local, "operations", ())
+
+
+@contextlib.contextmanager
+def operations_context(operations):
+    """ Runs the block as part of operations, e.g. in a worker thread """
+    previous = current_operations()
+    _local.operations = operations
+    try:
+        yield
+    finally:
+        _local.operations = previous
+
+
+def _wrap_generator(generator, operations):
+    try:
+        while True:
+            with operations_context(operations):
+                item = next(generator, _local)
+            if item is _local:
+                return
+            yield item
+    finally:
+        generator.close()
+
+
+def instrumented(fn):
+    """ Marks fn as a model operation, named <class>.<function name>.
+        Requests made while it runs (or while the generator it returns is
+        consumed) are attributed to it.
+    """
+    names = {}
+
+    @functools.wraps(fn)
+    def wrapper(owner, *args, **kwargs):
+        cls = owner if isinstance(owner, type) else type(owner)
+        try:
+            name = names[cls]
+
+        except KeyError:
+            name = names[cls] = "{0}.{1}".format(cls.__name__, fn.__name__)
+
+        previous = getattr(_local, "operations", ())
+        # super() calls of overridden operations count once
+        if previous[-1:] == (name, ):
+            operations = previous
+        else:
+            operations = previous + (name, )
+        _local.operations = operations
+        try:
+            result = fn(owner, *args, **kwargs)
+        finally:
+            _local.operations = previous
+        if isinstance(result, types.GeneratorType):
+            return _wrap_generator(result, operations)
+        return result
+
+    return wrapper
+
+
+class Histogram(object):
+    """ Fixed buckets latency histogram """
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+               10.0, 30.0)
+
+    def __init__(self, buckets=None):
+        if buckets is not None:
+            self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, pct):
+        """ Upper bound of the bucket holding the pct percentile """
+        if not self.count:
+            return None
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        return dict(count=self.count, sum=self.sum, max=self.max,
+                    buckets=list(zip(self.buckets + (float("inf"), ),
+                                     self.counts)),
+                    p50=self.percentile(50), p99=self.percentile(99))
+
+
+class EndpointStats(object):
+
+    def __init__(self, buckets=None):
+        self.latency = Histogram(buckets)
+        self.ttfb = Histogram(buckets)
+        self.errors = 0
+        self.cached = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.statuses = collections.defaultdict(int)
+
+    def add(self, event):
+        self.latency.add(event.elapsed)
+        if event.ttfb is not None:
+            self.ttfb.add(event.ttfb)
+        if event.error is not None:
+            self.errors += 1
+        if event.cached:
+            self.cached += 1
+        self.bytes_in += event.bytes_in
+        self.bytes_out += event.bytes_out
+        self.statuses[event.status] += 1
+
+    def snapshot(self):
+        return dict(latency=self.latency.snapshot(),
+                    ttfb=self.ttfb.snapshot(), errors=self.errors,
+                    cached=self.cached, bytes_in=self.bytes_in,
+                    bytes_out=self.bytes_out, statuses=dict(self.statuses))
+
+
+class Metrics(object):
+    """ A listener aggregating request events.
+
+        endpoints maps "METHOD /endpoint/template" to EndpointStats,
+        operations maps every model operation to the number of requests
+        and the seconds spent in them, both directly and through nested
+        operations.
+    """
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.operations = collections.defaultdict(
+            lambda: dict(requests=0, seconds=0.0, errors=0))
+
+    def __call__(self, event):
+        key = "{0} {1}".format(event.method, event.endpoint)
+        with self.lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = EndpointStats(self.buckets)
+            stats.add(event)
+            for operation in set(event.operations or ("<none>", )):
+                counters = self.operations[operation]
+                counters["requests"] += 1
+                counters["seconds"] += event.elapsed
+                if event.error is not None:
+                    counters["errors"] += 1
+
+    def snapshot(self):
+        """ Returns the aggregated metrics as plain data, for exporting """
+        with self.lock:
+            return dict(
+                endpoints=dict((k, v.snapshot())
+                               for k, v in self.endpoints.items()),
+                operations=dict((k, dict(v))
+                                for k, v in self.operations.items()))
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+            self.operations.clear()
@@ -4,6 +4,7 @@ from ..utils import assert_kwargs_empty
 
 
 class Action(Base):
+    __slots__ = ()
 
     @classmethod
     def search(cls, client, **kwargs):
@@ -37,6 +38,7 @@ class Action(Base):
 
 
 class Favorite(Action):
+    __slots__ = ()
 
     @classmethod
     def create(cls, client, photo_id, email, message="",
@@ -46,6 +48,7 @@ class Favorite(Action):
 
 
 class Comment(Action):
+    __slots__ = ()
 
     @classmethod
     def create(cls, client, photo_id, email, message,
@@ -1,15 +1,105 @@
 #!/usr/bin/env python
 
+import collections
+import threading
+import time
+import weakref
 import requests
 from .base import Base
 from .photo import Photo
-from ..utils import is_iterable_container
+from .. import events
+from ..compat import OrderedDict
+from ..concurrency import bounded_map
+from ..instrument import instrumented
+from ..utils import (chunked,
+                     is_iterable_container)
+
+MembershipChanges = collections.namedtuple("MembershipChanges",
+                                           "added removed")
+
+_UNSET = object()
+
+
+class AlbumIndex(object):
+    """ A name -> album index of the albums of a client, built from a single
+        full listing and kept up to date by Album.create and Album.delete.
+
+        The index is rebuilt when it is older than ttl seconds (never if ttl
+        is None) or when refresh() is called. A name missing from a fresh
+        index is not looked up on the server: albums created by other
+        clients show up once the index expires, or with get(name,
+        refresh=True).
+    """
+
+    def __init__(self, client, ttl=300):
+        # indexes are stored per client, don't keep clients alive
+        self._client = weakref.ref(client)
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.albums = None
+        self.built = None
+
+    @property
+    def client(self):
+        return self._client()
+
+    @property
+    def stale(self):
+        if self.built is None:
+            return True
+        return self.ttl is not None and time.time() - self.built > self.ttl
+
+    def refresh(self):
+        albums = dict((album.name, album) for album in Album.all(self.client))
+        with self.lock:
+            self.albums = albums
+            self.built = time.time()
+
+    def get(self, name, refresh=False):
+        """ Returns the album called name, or None; the index is rebuilt
+            first if it is stale or refresh is True.
+        """
+        with self.lock:
+            if refresh or self.stale:
+                self.refresh()
+            album = self.albums.get(name)
+            if album is not None and album.name != name:
+                # renamed since it was indexed
+                self.albums.pop(name, None)
+                self.albums[album.name] = album
+                return None
+            return album
+
+    def add(self, album):
+        with self.lock:
+            if self.albums is not None:
+                self.albums[album.name] = album
+
+    def remove(self, album):
+        with self.lock:
+            if self.albums is not None:
+                self.albums.pop(album.name, None)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __len__(self):
+        with self.lock:
+            if self.stale:
+                self.refresh()
+            return len(self.albums)
 
 
 class Album(Base):
     collection_path = "/albums"
     object_path = "/album"
     create_path = "/album/create.json"
+    # photos per add / remove request
+    batch_size = 100
+    _indexes = weakref.WeakKeyDictionary()
+    _indexes_lock = threading.Lock()
+    view_params = {"photos": {"includeElements": 1}}
+    __slots__ = ("cover", "_photos")
 
     def __init__(self, client, data):
         super(Album, self).__init__(client, data)
@@ -25,21 +115,30 @@ class Album(Base):
         except KeyError:
             pass
 
+    def _merge_data(self, data):
+        super(Album, self)._merge_data(data)
+        if data.get("cover"):
+            object.__setattr__(self, "cover", Photo(self.client, data["cover"]))
+        self.data.pop("count", None)
+        if "photos" in data and self._photos is not None:
+            self._set_photos()
+
     def _set_photos(self):
         object.__setattr__(
             self, "_photos",
-            [Photo(self.client, d) for d in self.data["photos"]]
+            [Photo(self.client, d) for d in self.data.get("photos") or ()]
         )
 
     @classmethod
-    def get(cls, client, id=None, name=None, **kwargs):
+    @instrumented
+    def get(cls, client, id=None, name=None, refresh=False, **kwargs):
         if id:
             return super(Album, cls).get(client, id, **kwargs)
 
         if name:
-            for album in cls.all(client):
-                if album.name == name:
-                    return album
+            album = cls.index(client).get(name, refresh)
+            if album is not None:
+                return album
 
             response = requests.Response()
             response.status_code = 404
@@ -48,18 +147,34 @@ class Album(Base):
 
         raise TypeError("Missing one of id or name")
 
+    @classmethod
+    def index(cls, client, ttl=_UNSET):
+        """ Returns the AlbumIndex of client, creating it if needed; if ttl
+            is given (None included) it replaces the index ttl.
+        """
+        with cls._indexes_lock:
+            index = cls._indexes.get(client)
+            if index is None:
+                index = cls._indexes[client] = AlbumIndex(client)
+        if ttl is not _UNSET:
+            index.ttl = ttl
+        return index
+
+    @instrumented
     def photos(self):
         if self._photos is None:
-            self.view()
+            self.load("photos")
             self._set_photos()
 
         return self._photos
 
+    @instrumented
     def view(self):
         super(Album, self).view()
         self._set_photos()
 
     @classmethod
+    @instrumented
     def create(cls, client, name, return_existing=False):
         if return_existing:
             try:
@@ -69,24 +184,107 @@ class Album(Base):
                 if e.response.status_code != 404:
                     raise e
 
-        return super(Album, cls).create(client,
-                                        name=name)
+        album = super(Album, cls).create(client,
+                                         name=name)
+        cls.index(client).add(album)
+        return album
 
-    def _add_remove(self, action, photo):
-        if is_iterable_container(photo):
-            ids = ", ".join([str(p.id) for p in photo])
-        else:
-            ids = photo.id
+    @instrumented
+    def delete(self):
+        res = super(Album, self).delete()
+        self.index(self.client).remove(self)
+        return res
+
+    def _add_remove(self, action, photo, workers=4):
+        if not is_iterable_container(photo):
+            photo = [photo]
+        photos = OrderedDict()
+        for p in photo:
+            id_ = str(p.id if isinstance(p, Photo) else p)
+            if id_ not in photos or not isinstance(photos[id_], Photo):
+                photos[id_] = p
+        if not photos:
+            return []
 
         url = self.url("photo", action)
-        self.client.post(url, data=dict(ids=ids))
-        object.__setattr__(self, "_photos", None)
 
-    def add(self, photo):
-        self._add_remove("add", photo)
+        def send(chunk):
+            try:
+                self.client.post(url, data=dict(ids=",".join(chunk)))
+                return chunk, None
+
+            except Exception as e:
+                return chunk, e
+
+        done = []
+        error = None
+        for chunk, e in bounded_map(send, chunked(photos, self.batch_size),
+                                    workers=workers, ordered=False):
+            if e is None:
+                done.extend(chunk)
+            elif error is None:
+                error = e
+
+        # the ones the server accepted, in the order given
+        accepted = set(done)
+        done = [id_ for id_ in photos if id_ in accepted]
+        self._update_members(action, [photos[id_] for id_ in done])
+        if done:
+            events.emit(self.client,
+                        "added" if action == "add" else "removed",
+                        self, photos=done)
+        if error is not None:
+            raise error
+        return done
+
+    def _update_members(self, action, photos):
+        """ Applies an add / remove to the loaded photos, if any, rather
+            than dropping them.
+        """
+        if self._photos is None and "photos" not in self.data:
+            return
+        ids = set(str(p.id if isinstance(p, Photo) else p) for p in photos)
+        current = self._photos
+        if current is None:
+            current = [Photo(self.client, d) for d in self.data["photos"]]
+        if action == "add":
+            present = set(str(p.id) for p in current)
+            current = current + [
+                p if isinstance(p, Photo) else Photo(self.client, {"id": p})
+                for p in photos
+                if str(p.id if isinstance(p, Photo) else p) not in present]
+        else:
+            current = [p for p in current if str(p.id) not in ids]
+        object.__setattr__(self, "_photos", current)
+        self.data["photos"] = [p.data for p in current]
+
+    @instrumented
+    def add(self, photo, workers=4):
+        """ Adds photos (Photos or ids) to the album, batch_size per
+            request, up to workers requests in flight. Returns the ids
+            added.
+        """
+        return self._add_remove("add", photo, workers)
+
+    @instrumented
+    def remove(self, photo, workers=4):
+        """ Removes photos (Photos or ids) from the album, see add """
+        return self._add_remove("remove", photo, workers)
 
-    def remove(self, photo):
-        self._add_remove("remove", photo)
+    @instrumented
+    def sync_members(self, photos, workers=4):
+        """ Makes photos (Photos or ids) the members of the album, adding
+            and removing only the difference with the current members.
+            Returns a MembershipChanges(added, removed) of ids.
+        """
+        current = set(str(p.id) for p in self.photos())
+        desired = OrderedDict(
+            (str(p.id if isinstance(p, Photo) else p), p) for p in photos)
+        added = self.add([p for id_, p in desired.items()
+                          if id_ not in current], workers)
+        removed = self.remove([p for p in self.photos()
+                               if str(p.id) not in desired], workers)
+        return MembershipChanges(added, removed)
 
     def __repr__(self):
         return "<Album id={self.id} name={self.name}>".format(self=self)
@@ -1,12 +1,32 @@
 #!/usr/bin/env python
 import logging
 import functools
+from .. import (decoding,
+                events)
+from ..client import raise_for_code
+from ..compat import with_metaclass
+from ..concurrency import bounded_map
+from ..identity import (ModelMeta,
+                        identity_map)
+from ..instrument import instrumented
 from ..utils import (assert_kwargs_empty,
                      classproperty)
 
 
-class Base(object):
+class Base(with_metaclass(ModelMeta, object)):
+    """ Base of the models: attributes are read from (and written to) the
+        data dictionary returned by the API, snake_case names being mapped
+        to the camelCase API keys.
+
+        Models use __slots__, so instances carry no __dict__; subclasses
+        declare the slots of their own helper attributes.
+    """
+    __slots__ = ("client", "data", "__weakref__")
+    # snake_case -> camelCase, shared by all the models
+    _attr_names = {}
     page_size = 100
+    # lazily loaded fields -> view parameters needed to load them
+    view_params = {}
     collection_path = None
     object_path = None
     create_path = None
@@ -19,40 +39,125 @@ class Base(object):
         return cls._logger
 
     @classmethod
-    def iterate(cls, client, partial, klass=None, paginate=True):
+    def _total_pages(cls, result, page_size=None):
+        """ Returns the number of pages of a listing, as reported in the
+            first page, or None if the server did not tell; page_size is
+            the pageSize requested, cls.page_size by default.
+        """
+        try:
+            info = result[0]
+            if "totalPages" in info:
+                return int(info["totalPages"])
+            rows = int(info["totalRows"])
+            page_size = int(page_size or cls.page_size)
+            return (rows + page_size - 1) // page_size
+
+        except (IndexError, KeyError, TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _stream_result(response):
+        """ Yields the elements of the result of a streamed response as they
+            are parsed, then checks the API code.
+        """
+        fields = {}
+        try:
+            for data in decoding.iter_items(response.iter_content(65536),
+                                            fields=fields):
+                yield data
+            raise_for_code(fields, response)
+
+        finally:
+            response.close()
+
+    @classmethod
+    def iterate(cls, client, partial, klass=None, paginate=True,
+                prefetch=None, stream=False):
+        """ Iterates over a (paginated) listing, yielding klass instances.
+
+            If prefetch is a positive integer, up to that many pages are
+            requested concurrently on a thread pool while the caller consumes
+            the current page; objects are still yielded in order.
+
+            If stream is True (and prefetch is not used) every page is parsed
+            while it is received, so objects are yielded as soon as they
+            arrive and memory does not grow with the page size.
+        """
         klass = klass or cls
-        if paginate:
-            page = 1
-            result = True
-            while result:
-                data = dict(pageSize=cls.page_size, page=page)
-                if "params" in partial.keywords:
-                    data.update(partial.keywords['params'])
-                result = partial(params=data).json()['result']
-                for data in result:
-                    yield klass(client, data)
+        stream = stream and not prefetch
+        if not paginate:
+            if stream:
+                result = cls._stream_result(
+                    partial(stream=decoding.STREAM_JSON))
+            else:
+                result = partial().json()['result']
+            for data in result:
+                yield klass(client, data)
+            return
+
+        params = {}
+        if "params" in partial.keywords:
+            params = partial.keywords['params']
+        page_size = params.get("pageSize", cls.page_size)
 
+        def fetch(page):
+            data = dict(params, pageSize=page_size, page=page)
+            if stream:
+                return cls._stream_result(
+                    partial(params=data, stream=decoding.STREAM_JSON))
+            return partial(params=data).json()['result']
+
+        state = dict(total=None)
+
+        def pages():
+            page = 1
+            while state["total"] is None or page <= state["total"]:
+                yield page
                 page = page + 1
+
+        if prefetch:
+            results = bounded_map(fetch, pages(), workers=prefetch)
         else:
-            result = partial().json()['result']
+            results = (fetch(page) for page in pages())
+
+        for page, result in enumerate(results, 1):
+            count = 0
             for data in result:
+                if page == 1 and count == 0:
+                    state["total"] = cls._total_pages([data], page_size)
+                count = count + 1
                 yield klass(client, data)
+            if not count:
+                break
+
+            if state["total"] is not None and page >= state["total"]:
+                break
 
     def __init__(self, client, data):
         object.__setattr__(self, "client", client)
         object.__setattr__(self, "data", data)
 
+    def __getstate__(self):
+        return dict(client=self.client, data=self.data)
+
     def __setstate__(self, state):
-        object.__setattr__(self, "client", state['client'])
-        object.__setattr__(self, "data", state['data'])
+        self.__init__(state['client'], state['data'])
+
+    @classmethod
+    def _convert_attr(cls, attr):
+        try:
+            return cls._attr_names[attr]
+
+        except KeyError:
+            pass
 
-    def _convert_attr(self, attr):
         if "_" in attr:
             attrname = attr.replace("_", " ").title().replace(" ", "")
             attrname = attrname[0].lower() + attrname[1:]
         else:
             attrname = attr
 
+        cls._attr_names[attr] = attrname
         return attrname
 
     def __getattr__(self, attr):
@@ -68,6 +173,7 @@ class Base(object):
         self.data[attr] = value
 
     @classmethod
+    @instrumented
     def create(cls, client, path=None, requests_args=None,
                **kwargs):
         requests_args = requests_args or {}
@@ -77,9 +183,12 @@ class Base(object):
         path = path or cls.create_path
         response = client.post(path, data=kwargs, params=params,
                                **requests_args)
-        return cls(client, response.json()['result'])
+        obj = cls(client, response.json()['result'])
+        events.emit(client, "created", obj)
+        return obj
 
     @classmethod
+    @instrumented
     def get(cls, client, id, **kwargs):
         obj = cls(client, {"id": id})
         obj.view(**kwargs)
@@ -88,6 +197,48 @@ class Base(object):
     def _update_data(self, data):
         object.__setattr__(self, "data", data)
 
+    def _merge_data(self, data):
+        """ Merges data, usually newer, into the object data """
+        self.data.update(data)
+
+    def loaded(self, field):
+        """ Returns True if field is already in the object data """
+        return self._convert_attr(field) in self.data
+
+    @instrumented
+    def load(self, *fields, **kwargs):
+        """ Loads the fields that are not loaded yet with a single view,
+            sending only the parameters they need (see view_params) plus
+            kwargs, and merges the result into the object data. Unlike
+            view, fields already loaded are kept.
+        """
+        missing = [f for f in fields if not self.loaded(f)]
+        if fields and not missing and not kwargs:
+            return self
+
+        params = {}
+        for field in missing:
+            params.update(self.view_params.get(field, {}))
+        params.update(kwargs)
+        response = self.client.get(self.url("view"), params=params)
+        self._merge_data(response.json()['result'])
+        return self
+
+    @classmethod
+    @instrumented
+    def prefetch(cls, objs, fields=(), workers=4, **kwargs):
+        """ Loads fields of many objects, up to workers views in flight;
+            objects that have them all are skipped. Returns objs as a list.
+        """
+        objs = list(objs)
+        pending = [obj for obj in objs
+                   if kwargs or not all(obj.loaded(f) for f in fields)]
+        for _ in bounded_map(lambda obj: obj.load(*fields, **kwargs),
+                             pending, workers=workers):
+            pass
+        return objs
+
+    @instrumented
     def view(self, **kwargs):
         params = dict(includeElements=1)
         params.update(kwargs)
@@ -99,11 +250,14 @@ class Base(object):
     refresh = view
 
     @classmethod
-    def all(cls, client, paginate=True, **kwargs):
+    @instrumented
+    def all(cls, client, paginate=True, prefetch=None, stream=False,
+            **kwargs):
         url = "{0}/list.json".format(cls.collection_path)
         params = kwargs
         partial = functools.partial(client.request, "get", url, params=params)
-        return cls.iterate(client, partial, paginate=paginate)
+        return cls.iterate(client, partial, paginate=paginate,
+                           prefetch=prefetch, stream=stream)
 
     list = all
 
@@ -115,11 +269,20 @@ class Base(object):
         return "{0}/{1}/{2}{3}".format(self.object_path, self.id, path,
                                        extension)
 
+    @instrumented
     def delete(self):
-        return self.client.post(self.url("delete")).json()
+        res = self.client.post(self.url("delete")).json()
+        imap = identity_map(self.client)
+        if imap is not None:
+            imap.discard(self)
+        events.emit(self.client, "deleted", self)
+        return res
 
+    @instrumented
     def update(self):
-        return self.client.post(self.url("update"), data=self.data).json()
+        res = self.client.post(self.url("update"), data=self.data).json()
+        events.emit(self.client, "updated", self)
+        return res
 
     def __repr__(self):
         return "<{0} {1}>".format(self.__class__.__name__, self.id)
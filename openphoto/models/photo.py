@@ -1,11 +1,55 @@
 #!/usr/bin/env python
 
+import collections
 import os
+import threading
+from concurrent import futures
 from time import mktime
+import requests
 from .base import Base
+from .. import events
 from .action import (Comment,
                      Favorite)
 from ..compat import stringcls
+from ..concurrency import (bounded_map,
+                           read_ahead)
+from ..instrument import instrumented
+from ..multipart import MultipartEncoder
+from ..utils import (_hash_or_none,
+                     chunked)
+
+
+UploadResult = collections.namedtuple("UploadResult",
+                                      "path photo skipped error")
+
+
+class UploadOnce(object):
+    """ Uploads every content (sha1) at most once, from concurrent threads.
+
+        Copies of a file are uploaded one at a time, each only if the
+        previous ones failed: a hash counts as uploaded once an upload
+        returns a result whose error is None.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hash_locks = {}
+        self.uploaded = set()
+
+    def __call__(self, sha1, upload, skip):
+        """ Returns skip() if sha1 was already uploaded, upload() otherwise
+        """
+        if sha1 is None:
+            return upload()
+        with self.lock:
+            hash_lock = self.hash_locks.setdefault(sha1, threading.Lock())
+        with hash_lock:
+            if sha1 in self.uploaded:
+                return skip()
+            result = upload()
+            if result.error is None:
+                self.uploaded.add(sha1)
+            return result
 
 
 class PhotoSizeManager(object):
@@ -13,21 +57,25 @@ class PhotoSizeManager(object):
     def __init__(self, photo):
         self.client = photo.client
         self.photo = photo
+        self._cache = {}
 
     def get_sizes(self, sizes):
         if isinstance(sizes, stringcls):
             sizes = [sizes]
-        returnSizes = ",".join(sizes)
-        if self.photo._paths is None:
-            self.photo.view(returnSizes=returnSizes)
+        missing = self.photo._missing_sizes(sizes)
+        if missing:
+            # only ask for the sizes we don't have, and keep the others
+            self.photo.load(returnSizes=",".join(missing))
 
-        else:
-            sizes_set = set(sizes)
-            if sizes_set & set(self.photo._paths) != sizes_set:
-                self.photo.view(returnSizes=returnSizes)
+        paths = self.photo.paths()
+        return [self._size(s, paths[s]) for s in sizes]
 
-        return [PhotoSize(self.photo.paths()[s], self.client, self.photo)
-                for s in sizes]
+    def _size(self, size, url):
+        cached = self._cache.get(size)
+        if cached is None or cached.url != url:
+            cached = self._cache[size] = PhotoSize(url, self.client,
+                                                   self.photo)
+        return cached
 
     def __getitem__(self, size):
         return self.get_sizes(size)[0]
@@ -39,6 +87,7 @@ class PhotoSize(object):
         self.photo = photo
         self.url = url
 
+    @instrumented
     def download(self, destination=None, mode="wb", chunk_size=4096):
         close_file = False
         file_ = destination
@@ -74,27 +123,52 @@ class Photo(Base):
     collection_path = "/photos"
     object_path = "/photo"
     create_path = "/photo/upload.json"
+    batch_size = 100
+    view_params = {"paths": {}, "tags": {}}
+    __slots__ = ("_sizes", "_paths", "_tags")
 
     def __init__(self, client, data):
         super(Photo, self).__init__(client, data)
-        size_mgr = PhotoSizeManager(self)
-        object.__setattr__(self, "sizes", size_mgr)
+        object.__setattr__(self, "_sizes", None)
         self._update_data(self.data)
-        if not self._tags:
-            object.__setattr__(self, "_tags", None)
+
+    def __getstate__(self):
+        state = super(Photo, self).__getstate__()
+        state["paths"] = self._paths
+        return state
+
+    def __setstate__(self, state):
+        super(Photo, self).__setstate__(state)
+        object.__setattr__(self, "_paths", state.get("paths"))
+
+    @property
+    def sizes(self):
+        if self._sizes is None:
+            object.__setattr__(self, "_sizes", PhotoSizeManager(self))
+        return self._sizes
 
     def _update_data(self, data):
         super(Photo, self)._update_data(data)
         self._set_paths()
-        self._set_tags()
+        # Tag objects are built by tags(), when needed
+        object.__setattr__(self, "_tags", None)
+
+    def _merge_data(self, data):
+        super(Photo, self)._merge_data(data)
+        self._set_paths(merge=True)
+        if "tags" in data:
+            object.__setattr__(self, "_tags", None)
 
-    def _set_paths(self):
+    def _set_paths(self, merge=False):
         paths_keys = [k for k in self.data.keys() if k.startswith("path")]
         if not paths_keys:
-            object.__setattr__(self, "_paths", None)
+            if not merge:
+                object.__setattr__(self, "_paths", None)
             return
 
         paths = {}
+        if merge and self._paths:
+            paths.update(self._paths)
         for k in paths_keys:
             key = k.replace("path", "").lower()
             paths[key] = self.data[k].replace("\\", "")
@@ -102,6 +176,30 @@ class Photo(Base):
 
         object.__setattr__(self, "_paths", paths)
 
+    def loaded(self, field):
+        if field == "paths":
+            return self._paths is not None
+        return super(Photo, self).loaded(field)
+
+    def _missing_sizes(self, sizes):
+        paths = self._paths or {}
+        return [size for size in sizes if size not in paths]
+
+    @classmethod
+    @instrumented
+    def resolve_sizes(cls, photos, sizes, workers=4):
+        """ Returns, for each photo, the list of its PhotoSizes for sizes.
+
+            The missing paths of all the photos are fetched at once with
+            prefetch (batched listings, or concurrent views), rather than
+            with a view per photo; PhotoSizes are cached on the photos.
+        """
+        if isinstance(sizes, stringcls):
+            sizes = [sizes]
+        photos = cls.prefetch(photos, fields=(), sizes=sizes,
+                              workers=workers)
+        return [photo.sizes.get_sizes(sizes) for photo in photos]
+
     def _set_tags(self):
         from .tag import Tag  # avoid circular imports
         if "tags" in self.data:
@@ -114,19 +212,95 @@ class Photo(Base):
     def albums(self):
         raise NotImplementedError("Remote API does not provide this information")
 
+    @instrumented
     def paths(self):
         if self._paths is None:
-            self.view()
+            self.load("paths")
 
         return self._paths
 
+    @instrumented
     def tags(self):
         if self._tags is None:
-            self.view()
+            self.load("tags")
             self._set_tags()
 
         return self._tags
 
+    @classmethod
+    @instrumented
+    def prefetch(cls, photos, fields=("paths", "tags"), sizes=None,
+                 workers=4):
+        """ Loads fields, and the paths of sizes, of many photos.
+
+            Photos are listed batch_size at a time by id
+            (/photos/ids-<ids>/list.json), up to workers requests in flight;
+            if the server does not filter listings by ids, photos are viewed
+            concurrently instead. Returns photos as a list.
+        """
+        if isinstance(sizes, stringcls):
+            sizes = [sizes]
+        sizes = list(sizes or ())
+        photos = list(photos)
+        pending = [p for p in photos
+                   if not all(p.loaded(f) for f in fields) or
+                   p._missing_sizes(sizes)]
+        if not pending:
+            return photos
+
+        client = pending[0].client
+        params = {}
+        if sizes:
+            params["returnSizes"] = ",".join(sizes)
+        state = dict(batch=True)
+
+        def fetch(chunk):
+            if not state["batch"]:
+                return chunk, None
+            ids = [str(p.id) for p in chunk]
+            url = "{0}/ids-{1}/list.json".format(cls.collection_path,
+                                                 ",".join(ids))
+            try:
+                result = client.get(url, params=dict(params,
+                                                     pageSize=len(ids))
+                                    ).json()["result"]
+
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code not in (404, 405, 501):
+                    raise
+                result = None
+
+            found = dict((str(data["id"]), data) for data in result or ())
+            if (result is None or not set(found) <= set(ids) or
+                    cls._total_pages(result, len(ids)) not in
+                    (None, 0, 1)):
+                # the filter was ignored: don't try again
+                state["batch"] = False
+                return chunk, None
+            return chunk, found
+
+        fallback = []
+        for chunk, found in bounded_map(fetch, chunked(pending,
+                                                       cls.batch_size),
+                                        workers=workers):
+            if found is None:
+                fallback.extend(chunk)
+                continue
+            for photo in chunk:
+                data = found.get(str(photo.id))
+                if data is None:
+                    fallback.append(photo)
+                else:
+                    photo._merge_data(data)
+
+        if fallback:
+            cls.log.info("Listing by ids not available, viewing %d photos",
+                         len(fallback))
+        for _ in bounded_map(lambda p: p.load(*fields, **params), fallback,
+                             workers=workers):
+            pass
+        return photos
+
     @staticmethod
     def _create_params_dict(private, title, description, tags,
                             date_uploaded, date_taken, license,
@@ -154,12 +328,24 @@ class Photo(Base):
                 params["longitude"] = longitude
         return params
 
-    def update(self, private=False, title=None,
-               description=None, tags=None, tags_action="replace",
-               date_uploaded=None, date_taken=None, license=None,
-               latitude=None, longitude=None, albums=None):
+    @classmethod
+    def _upload_params(cls, private, title, description, tags,
+                       date_uploaded, date_taken, license, latitude,
+                       longitude, return_sizes, allow_duplicate):
+        params = cls._create_params_dict(private, title, description,
+                                         tags, date_uploaded, date_taken,
+                                         license, latitude, longitude)
+        if return_sizes:
+            params["returnSizes"] = ",".join(return_sizes)
+        if allow_duplicate:
+            params["allowDuplicate"] = 1
+        return params
 
-        params = self._create_params_dict(private, title, description,
+    @classmethod
+    def _update_params(cls, private, title, description, tags, tags_action,
+                       date_uploaded, date_taken, license, latitude,
+                       longitude):
+        params = cls._create_params_dict(private, title, description,
                                          tags, date_uploaded, date_taken,
                                          license, latitude, longitude)
 
@@ -176,40 +362,63 @@ class Photo(Base):
             params["tagsRemove"] = params["tags"]
             del params["tags"]
 
+        return params
+
+    @instrumented
+    def update(self, private=False, title=None,
+               description=None, tags=None, tags_action="replace",
+               date_uploaded=None, date_taken=None, license=None,
+               latitude=None, longitude=None, albums=None):
+
+        params = self._update_params(private, title, description, tags,
+                                     tags_action, date_uploaded, date_taken,
+                                     license, latitude, longitude)
+
         res = self.client.post(self.url("update"), data=params).json()
 
         if albums:
             self.add_to(albums)
 
         self._update_data(res["result"])
+        events.emit(self.client, "updated", self)
 
     @classmethod
+    @instrumented
     def create(cls, client, photo, private=False, title=None,
                description=None, tags=None, date_uploaded=None,
                date_taken=None, license=None, latitude=None,
                longitude=None, return_sizes=None, albums=None,
-               allow_duplicate=False):
+               allow_duplicate=False, progress=None, chunk_size=65536):
+        """ Uploads photo (a path or a binary file object).
+
+            The file is streamed chunk_size bytes at a time, never loaded
+            in memory, and progress(sent, total) is called as it is sent.
+        """
         photo_f = None
         close_f = False
         try:
             if isinstance(photo, stringcls):
                 close_f = True
-                photo_f = open(photo)
+                photo_f = open(photo, "rb")
             else:
                 photo_f = photo
-            params = cls._create_params_dict(private, title, description,
-                                             tags, date_uploaded, date_taken,
-                                             license, latitude, longitude)
-            if return_sizes:
-                params["returnSizes"] = ",".join(return_sizes)
-            if allow_duplicate:
-                params["allowDuplicate"] = 1
-
+            params = cls._upload_params(private, title, description, tags,
+                                        date_uploaded, date_taken, license,
+                                        latitude, longitude, return_sizes,
+                                        allow_duplicate)
             cls.log.info("Uploading from %s", photo)
-            response = client.post(cls.create_path,
-                                    files={"photo": photo_f}, params=params)
-
-            obj = cls(client, response.json()["result"])
+            body = MultipartEncoder(files={"photo": photo_f},
+                                    chunk_size=chunk_size, progress=progress)
+            response = client.post(cls.create_path, data=body, params=params,
+                                   headers={"Content-Type": body.content_type})
+
+            result = response.json()["result"]
+            sha1 = body.sha1("photo")
+            if result.get("hash") and sha1 and result["hash"] != sha1:
+                cls.log.warning("Hash mismatch uploading %s: sent %s, "
+                                "stored %s", photo, sha1, result["hash"])
+            obj = cls(client, result)
+            events.emit(client, "created", obj)
             if albums:
                 obj.add_to(albums)
             return obj
@@ -218,6 +427,69 @@ class Photo(Base):
             if photo_f and close_f:
                 photo_f.close()
 
+    @classmethod
+    @instrumented
+    def exists(cls, client, sha1):
+        """ Returns True if a photo with the given sha1 hash is on the
+            server.
+        """
+        url = "{0}/hash-{1}/list.json".format(cls.collection_path, sha1)
+        response = client.get(url, params=dict(pageSize=1))
+        return bool(response.json()["result"])
+
+    @classmethod
+    @instrumented
+    def create_many(cls, client, paths, workers=4, hash_workers=None,
+                    skip_existing=True, **kwargs):
+        """ Uploads many files concurrently, using up to workers uploads in
+            flight at once. Other keyword arguments are passed to create.
+
+            If skip_existing is True, files are hashed in a pool of
+            hash_workers processes and files whose hash is already on the
+            server (or earlier in paths) are not uploaded.
+
+            Returns a generator of UploadResult(path, photo, skipped, error)
+            yielded as uploads complete; a failing upload does not stop the
+            others, its exception is reported in error.
+        """
+        def upload(item):
+            path, sha1 = item
+            try:
+                if sha1 is not None and cls.exists(client, sha1):
+                    cls.log.info("Skipping %s: already uploaded", path)
+                    return UploadResult(path, None, True, None)
+                return UploadResult(path, cls.create(client, path, **kwargs),
+                                    False, None)
+
+            except Exception as e:
+                cls.log.error("Error uploading %s: %s", path, e)
+                return UploadResult(path, None, False, e)
+
+        paths = list(paths)
+        if not skip_existing:
+            for result in bounded_map(upload, [(p, None) for p in paths],
+                                      workers=workers, ordered=False):
+                yield result
+            return
+
+        once = UploadOnce()
+
+        def skip(path):
+            cls.log.info("Skipping %s: already uploaded", path)
+            return UploadResult(path, None, True, None)
+
+        def upload_once(item):
+            path = item[0]
+            return once(item[1], lambda: upload(item), lambda: skip(path))
+
+        with futures.ProcessPoolExecutor(max_workers=hash_workers) as pool:
+            # unreadable files are reported by the upload, not by the pool
+            hashes = pool.map(_hash_or_none, paths)
+            items = ((path, next(hashes)) for path in paths)
+            for result in bounded_map(upload_once, items,
+                                      workers=workers, ordered=False):
+                yield result
+
     def add_to(self, albums):
         from .album import Album  # avoid circular imports
         if isinstance(albums, Album):
@@ -242,6 +514,7 @@ class Photo(Base):
         """ Shortcut to download original photo """
         return self.sizes['original'].download(destination, mode, chunk_size)
 
+    @instrumented
     def nextprevious(self):
         """ Get next/previous photo(s) at once """
         cls = self.__class__
@@ -261,24 +534,43 @@ class Photo(Base):
     def get_previous(self):
         return self.nextprevious()['previous']
 
-    def stream(self, reverse=False):
-        """ Returns an iterator to iterate over next/previous """
-        key = "next"
-        if reverse:
-            key = "previous"
-
+    def _walk(self, key):
         current = self
         while True:
-            nxpv = current.nextprevious()
-            if not nxpv[key]:
-                raise StopIteration()
-            yield nxpv[key][0]
-            current = nxpv[key][0]
+            photos = current.nextprevious()[key]
+            if not photos:
+                return
+            # the API may return more than one photo: use them all
+            for photo in photos:
+                yield photo
+            current = photos[-1]
+
+    def stream(self, reverse=False, window=0, size=None, workers=4):
+        """ Returns an iterator to iterate over next/previous.
+
+            If window is positive, up to window photos are fetched ahead on
+            a background thread while the caller consumes the current one.
+            If size is given, the content of that size of each photo is
+            downloaded too, up to workers at once, and the iterator yields
+            (photo, content) pairs.
+        """
+        key = "previous" if reverse else "next"
+        photos = self._walk(key)
+        if window:
+            photos = read_ahead(photos, window)
+        if size is None:
+            return photos
+
+        def fetch(photo):
+            return photo, b"".join(photo.sizes[size].download())
+
+        return bounded_map(fetch, photos, workers=workers)
 
     def replace(self, source):
         """ Replace the binary image file (and hash) """
         raise NotImplementedError()
 
+    @instrumented
     def transform(self, **kwargs):
         """ Transform a photo by rotating/BW/etc """
         url = self.url("transform")
@@ -287,11 +579,96 @@ class Photo(Base):
         return self
 
     @classmethod
-    def update_batch(self, client, photos, data):
-        """ Updates multiple photos at once """
-        raise NotImplementedError()
+    def _batch(cls, client, action, photos, params, workers):
+        ids = []
+        seen = set()
+        for photo in photos:
+            id_ = str(photo.id if isinstance(photo, Photo) else photo)
+            if id_ not in seen:
+                seen.add(id_)
+                ids.append(id_)
+
+        url = "{0}/{1}.json".format(cls.collection_path, action)
+        results = {}
+        fallback = []
+        # ids of failed batches: one bad id is enough to fail a batch
+        retry = []
+
+        def send_chunk(chunk):
+            data = dict(params, ids=",".join(chunk))
+            try:
+                ok = client.post(url, data=data).json()["result"]
+
+            except requests.exceptions.RequestException as e:
+                status = getattr(e.response, "status_code", None)
+                if status in (404, 405, 501):
+                    return chunk, None
+                ok = e
+
+            if ok is True or ok == 1:
+                ok = True
+            elif not isinstance(ok, Exception):
+                ok = False
+            return chunk, ok
+
+        for chunk, ok in bounded_map(send_chunk, chunked(ids, cls.batch_size),
+                                     workers=workers, ordered=False):
+            if ok is None:
+                fallback.extend(chunk)
+            elif ok is not True and len(chunk) > 1:
+                retry.extend(chunk)
+            else:
+                results.update((id_, ok) for id_ in chunk)
+
+        if fallback:
+            cls.log.info("Batch %s not supported, sending %d requests",
+                         action, len(fallback))
+        if retry:
+            cls.log.info("Batch %s failed, resending %d ids one by one",
+                         action, len(retry))
+
+        def send_one(id_):
+            url = cls(client, {"id": id_}).url(action)
+            try:
+                client.post(url, data=params).json()
+                return id_, True
+
+            except requests.exceptions.RequestException as e:
+                return id_, e
+
+        results.update(bounded_map(send_one, fallback + retry,
+                                   workers=workers, ordered=False))
+
+        action = "deleted" if action == "delete" else "updated"
+        for id_, ok in sorted(results.items()):
+            if ok is True:
+                events.emit(client, action, cls(client, {"id": id_}),
+                            **params)
+        return results
 
     @classmethod
-    def delete_batch(self, client, photos):
-        """ Deletes multiple photos at once """
-        raise NotImplementedError()
+    @instrumented
+    def update_batch(cls, client, photos, private=False, title=None,
+                     description=None, tags=None, tags_action="replace",
+                     date_uploaded=None, date_taken=None, license=None,
+                     latitude=None, longitude=None, workers=4):
+        """ Updates multiple photos (or photo ids) at once.
+
+            Photos are sent batch_size at a time to the batch endpoint, up to
+            workers requests in flight; if the server has no batch endpoint
+            every photo is updated on its own, and so are the photos of a
+            failed batch, as one bad id fails all of them. Returns a
+            dictionary mapping each photo id to True, False or the HTTPError
+            raised for it.
+        """
+        params = cls._update_params(private, title, description, tags,
+                                    tags_action, date_uploaded, date_taken,
+                                    license, latitude, longitude)
+        return cls._batch(client, "update", photos, params, workers)
+
+    @classmethod
+    @instrumented
+    def delete_batch(cls, client, photos, workers=4):
+        """ Deletes multiple photos (or photo ids) at once, see update_batch
+        """
+        return cls._batch(client, "delete", photos, {}, workers)
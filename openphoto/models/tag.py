@@ -3,21 +3,26 @@
 import functools
 from .base import Base
 from .photo import Photo
+from ..instrument import instrumented
 
 
 class Tag(Base):
     collection_path = "/tags"
     object_path = "/tag"
     create_path = "/tag/create.json"
+    __slots__ = ()
 
     @classmethod
+    @instrumented
     def all(cls, client):
         return super(Tag, cls).all(client, paginate=False)
 
     @classmethod
+    @instrumented
     def create(cls, client, id):
         return super(Tag, cls).create(client, id=id)
 
+    @instrumented
     def photos(self, **kwargs):
         url = "{0}/tags-{1}/list.json".format(Photo.collection_path, self.id)
         partial = functools.partial(self.client.request, "get", url, **kwargs)
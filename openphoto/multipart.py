@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+""" Streaming multipart/form-data bodies.
+
+    requests builds multipart bodies in memory; a MultipartEncoder is a
+    file-like body that reads the files chunk by chunk while it is sent, so
+    uploading a large file costs chunk_size bytes of memory.
+"""
+import hashlib
+import io
+import os
+import uuid
+from .compat import stringcls
+
+
+def _file_size(file_):
+    """ Bytes left to read in file_, None if unknown """
+    try:
+        return os.fstat(file_.fileno()).st_size - file_.tell()
+
+    except (AttributeError, IOError, OSError, ValueError):
+        pass
+
+    try:
+        pos = file_.tell()
+        file_.seek(0, io.SEEK_END)
+        end = file_.tell()
+        file_.seek(pos)
+        return end - pos
+
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, stringcls):
+        value = str(value)
+    return value.encode("utf-8")
+
+
+class MultipartEncoder(object):
+    """ A multipart/form-data body made of fields (name -> value) and files
+        (name -> binary file object, or (filename, file object)).
+
+        Pass it as data to requests along with content_type. Its length,
+        len, is known (and sent as Content-Length) if every file is
+        seekable; if it is None the body is sent with chunked transfer
+        encoding.
+
+        The SHA1 of every file is computed while it is read (see sha1), and
+        progress(sent, total) is called after every chunk; total is None if
+        unknown. seek(0) rewinds the body, e.g. to retry a request.
+    """
+
+    def __init__(self, fields=None, files=None, chunk_size=65536,
+                 progress=None):
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.parts = []
+        for name, value in sorted((fields or {}).items()):
+            self.parts.append((name, self._header(name), _encode(value)))
+        for name, file_ in sorted((files or {}).items()):
+            if isinstance(file_, tuple):
+                filename, file_ = file_
+            else:
+                filename = os.path.basename(getattr(file_, "name", None) or
+                                            name)
+            self.parts.append((name, self._header(name, filename), file_))
+        # where the files start, to rewind them
+        self.starts = {}
+        for name, _, value in self.parts:
+            try:
+                self.starts[name] = value.tell()
+            except (AttributeError, IOError, OSError):
+                pass
+        self.closing = "--{0}--\r\n".format(self.boundary).encode("ascii")
+        self.len = self._length()
+        self._reset()
+
+    @property
+    def content_type(self):
+        return "multipart/form-data; boundary={0}".format(self.boundary)
+
+    def _header(self, name, filename=None):
+        disposition = 'form-data; name="{0}"'.format(name)
+        header = "--{0}\r\nContent-Disposition: {1}".format(self.boundary,
+                                                             disposition)
+        if filename is not None:
+            header += ('; filename="{0}"\r\n'
+                       'Content-Type: application/octet-stream'
+                       .format(filename))
+        return (header + "\r\n\r\n").encode("utf-8")
+
+    def _length(self):
+        total = len(self.closing)
+        for _, header, value in self.parts:
+            size = _file_size(value) if hasattr(value, "read") else len(value)
+            if size is None:
+                return None
+            total += len(header) + size + 2
+        return total
+
+    def _reset(self):
+        self.sent = 0
+        self.hashes = {}
+        self.buffer = b""
+        self.offset = 0
+        self.chunks = self._chunks()
+
+    def _chunks(self):
+        for name, header, value in self.parts:
+            yield header
+            if not hasattr(value, "read"):
+                yield value
+            else:
+                sha1 = self.hashes[name] = hashlib.sha1()
+                while True:
+                    chunk = value.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    sha1.update(chunk)
+                    yield chunk
+            yield b"\r\n"
+        yield self.closing
+
+    def sha1(self, name):
+        """ Hex SHA1 of the file sent as name, None until it has been read
+        """
+        sha1 = self.hashes.get(name)
+        return None if sha1 is None else sha1.hexdigest()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = float("inf")
+        while len(self.buffer) - self.offset < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer = self.buffer[self.offset:] + chunk
+            self.offset = 0
+        if size >= len(self.buffer) - self.offset:
+            data = self.buffer[self.offset:]
+            self.buffer, self.offset = b"", 0
+        else:
+            data = self.buffer[self.offset:self.offset + size]
+            self.offset += size
+        if data:
+            self.sent += len(data)
+            if self.progress is not None:
+                self.progress(self.sent, self.len)
+        return data
+
+    def __iter__(self):
+        while True:
+            data = self.read(self.chunk_size)
+            if not data:
+                return
+            yield data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """ Only rewinding (seek(0)) is supported """
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("MultipartEncoder can only be "
+                                          "rewound")
+        for name, _, value in self.parts:
+            if name in self.starts:
+                value.seek(self.starts[name])
+            elif hasattr(value, "read"):
+                raise io.UnsupportedOperation("{0} can't be rewound"
+                                              .format(name))
+        self._reset()
+        return 0
+
+    def tell(self):
+        return self.sent
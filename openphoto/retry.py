@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+import calendar
+import email.utils
+import random
+import threading
+import time
+import requests
+
+
+class RetryPolicy(object):
+    """ When and how long to wait before retrying a failed request.
+
+        Idempotent requests are retried on connection errors, timeouts and
+        the retry_statuses HTTP or API codes. Other requests (POST) are only
+        retried when the server did not process them: connection timeouts,
+        429 and 503.
+
+        The delay before retry n (0 based) is the server Retry-After, if
+        any, otherwise backoff * 2 ** n capped to max_backoff; with jitter
+        a random delay between 0 and that is used instead.
+    """
+    idempotent_methods = frozenset(["GET", "HEAD", "PUT", "DELETE",
+                                    "OPTIONS"])
+    retry_statuses = frozenset([429, 500, 502, 503, 504])
+    unprocessed_statuses = frozenset([429, 503])
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30.0,
+                 jitter=True):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    @staticmethod
+    def status(error):
+        """ The API code or HTTP status of a failed request, if any """
+        code = getattr(error, "code", None)
+        if code is None and getattr(error, "response", None) is not None:
+            code = error.response.status_code
+        return code
+
+    def should_retry(self, method, error, attempt):
+        if attempt >= self.retries:
+            return False
+
+        idempotent = method.upper() in self.idempotent_methods
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, requests.exceptions.HTTPError):
+            status = self.status(error)
+            if idempotent:
+                return status in self.retry_statuses
+            return status in self.unprocessed_statuses
+        if isinstance(error, (requests.exceptions.ConnectionError,
+                              requests.exceptions.Timeout)):
+            return idempotent
+        return False
+
+    def delay(self, attempt, response=None):
+        retry_after = retry_after_seconds(response)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+def retry_after_seconds(response):
+    """ Returns the seconds to wait according to the Retry-After header of
+        response, or None.
+    """
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+
+    except ValueError:
+        date = email.utils.parsedate(value)
+        if date is None:
+            return None
+        return max(0.0, calendar.timegm(date) - time.time())
+
+
+def rate_limit_pause(response):
+    """ Returns the seconds to wait before the next request if the
+        X-RateLimit-* headers of response say that the limit is exhausted,
+        or None.
+    """
+    headers = response.headers
+    if headers.get("X-RateLimit-Remaining") != "0":
+        return None
+    try:
+        reset = float(headers.get("X-RateLimit-Reset"))
+
+    except (TypeError, ValueError):
+        return retry_after_seconds(response)
+
+    # either an epoch timestamp or a number of seconds
+    if reset > 1e9:
+        reset = reset - time.time()
+    return max(0.0, reset)
+
+
+class TokenBucket(object):
+    """ Client side rate limiter: allows rate requests per second on
+        average, with bursts of up to burst requests. It is shared by all the
+        threads using the client.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = burst or max(1, int(rate))
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self.paused_until = 0.0
+
+    def acquire(self, tokens=1):
+        """ Takes tokens, sleeping until they are available. Returns the
+            time slept.
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            wait = max(-self.tokens / self.rate, self.paused_until - now, 0)
+
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """ Holds every request for the next seconds """
+        with self.lock:
+            self.paused_until = max(self.paused_until,
+                                    self.clock() + seconds)
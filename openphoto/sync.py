@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+""" Local mirror of a library, kept up to date incrementally.
+
+    A Mirror stores photos, albums and tags in a SQLite database. The first
+    sync lists everything; later syncs list photos by upload date, newest
+    first, and stop at the last upload already mirrored, so that a sync
+    costs a few requests when little changed. A full sync compares every
+    photo against the mirror (by a digest of its data, which includes the
+    file hash) and is the only way to notice edits and deletions of older
+    photos.
+"""
+import collections
+import functools
+import hashlib
+import json
+import sqlite3
+import time
+from .models import (Album,
+                     Photo,
+                     Tag)
+
+
+Change = collections.namedtuple("Change", [
+    "kind",    # "photo", "album" or "tag"
+    "action",  # "added", "updated" or "deleted"
+    "id",
+    "data",    # the new data, None if deleted
+])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS photos (
+    id TEXT PRIMARY KEY,
+    hash TEXT,
+    date_uploaded INTEGER,
+    digest TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS photos_date_uploaded ON photos (date_uploaded);
+CREATE TABLE IF NOT EXISTS albums (
+    id TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tags (
+    id TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+# per listing fields, not part of the object
+PAGINATION_KEYS = ("totalRows", "totalPages", "currentPage", "currentRows")
+
+
+def _raw(client, data):
+    for key in PAGINATION_KEYS:
+        data.pop(key, None)
+    return data
+
+
+def _dump(data):
+    """ Returns the serialized data and its digest """
+    dump = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return dump, hashlib.sha1(dump.encode("utf-8")).hexdigest()
+
+
+def _timestamp(value):
+    try:
+        return int(float(value))
+
+    except (TypeError, ValueError):
+        return None
+
+
+class Mirror(object):
+    """ A SQLite mirror of the library of client, stored at path.
+
+        sync() brings it up to date and returns the list of Changes it
+        applied. page_size and prefetch tune the listings as in Photo.all.
+    """
+    tables = (("album", "albums", Album, True),
+              ("tag", "tags", Tag, False))
+
+    def __init__(self, client, path=":memory:", page_size=100,
+                 prefetch=None):
+        self.client = client
+        self.path = path
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -- state
+    def _get_state(self, key):
+        row = self.db.execute("SELECT value FROM state WHERE key = ?",
+                              (key, )).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _set_state(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO state (key, value) "
+                        "VALUES (?, ?)", (key, json.dumps(value)))
+
+    @property
+    def last_sync(self):
+        """ Time of the last sync, None if never synced """
+        return self._get_state("last_sync")
+
+    @property
+    def last_full_sync(self):
+        return self._get_state("last_full_sync")
+
+    # -- sync
+    def _listing(self, cls, paginate=True, prefetch=None, **params):
+        url = "{0}/list.json".format(cls.collection_path)
+        if paginate:
+            params.setdefault("pageSize", self.page_size)
+        partial = functools.partial(self.client.request, "get", url,
+                                    params=params)
+        return cls.iterate(self.client, partial, klass=_raw,
+                           paginate=paginate, prefetch=prefetch)
+
+    def sync(self, full=None):
+        """ Updates the mirror and returns the list of Changes.
+
+            Photos are synced incrementally unless full is True, or the
+            mirror was never fully synced; albums and tags (small listings)
+            are always compared in full.
+        """
+        if full is None:
+            full = self.last_full_sync is None
+
+        started = time.time()
+        with self.db:
+            if full:
+                changes = self._sync_photos_full()
+                self._set_state("last_full_sync", started)
+            else:
+                changes = self._sync_photos_delta()
+            for kind, table, cls, paginate in self.tables:
+                changes.extend(self._sync_table(kind, table, cls, paginate))
+            self._set_state("last_sync", started)
+        return changes
+
+    def _store_photo(self, data, digest=None):
+        """ Stores data, returns the Change or None if nothing changed """
+        dump, new_digest = _dump(data)
+        if digest == new_digest:
+            return None
+        self.db.execute("INSERT OR REPLACE INTO photos "
+                        "(id, hash, date_uploaded, digest, data) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (str(data["id"]), data.get("hash"),
+                         _timestamp(data.get("dateUploaded")), new_digest,
+                         dump))
+        action = "added" if digest is None else "updated"
+        return Change("photo", action, str(data["id"]), data)
+
+    def _sync_photos_delta(self):
+        row = self.db.execute("SELECT MAX(date_uploaded) FROM photos"
+                              ).fetchone()
+        watermark = row[0]
+        changes = []
+        listing = self._listing(Photo, sortBy="dateUploaded,desc")
+        try:
+            for data in listing:
+                uploaded = _timestamp(data.get("dateUploaded"))
+                # same second uploads may straddle the watermark, so stop
+                # only past it
+                if (watermark is not None and uploaded is not None and
+                        uploaded < watermark):
+                    break
+                row = self.db.execute("SELECT digest FROM photos "
+                                      "WHERE id = ?",
+                                      (str(data["id"]), )).fetchone()
+                change = self._store_photo(data, row and row[0])
+                if change is not None:
+                    changes.append(change)
+
+        finally:
+            listing.close()
+        return changes
+
+    def _sync_photos_full(self):
+        digests = dict(self.db.execute("SELECT id, digest FROM photos"))
+        changes = []
+        for data in self._listing(Photo, prefetch=self.prefetch):
+            id_ = str(data["id"])
+            change = self._store_photo(data, digests.pop(id_, None))
+            if change is not None:
+                changes.append(change)
+
+        for id_ in sorted(digests):
+            self.db.execute("DELETE FROM photos WHERE id = ?", (id_, ))
+            changes.append(Change("photo", "deleted", id_, None))
+        return changes
+
+    def _sync_table(self, kind, table, cls, paginate):
+        digests = dict(self.db.execute(
+            "SELECT id, digest FROM {0}".format(table)))
+        changes = []
+        for data in self._listing(cls, paginate=paginate):
+            id_ = str(data["id"])
+            digest = digests.pop(id_, None)
+            dump, new_digest = _dump(data)
+            if digest == new_digest:
+                continue
+            self.db.execute("INSERT OR REPLACE INTO {0} (id, digest, data) "
+                            "VALUES (?, ?, ?)".format(table),
+                            (id_, new_digest, dump))
+            action = "added" if digest is None else "updated"
+            changes.append(Change(kind, action, id_, data))
+
+        for id_ in sorted(digests):
+            self.db.execute("DELETE FROM {0} WHERE id = ?".format(table),
+                            (id_, ))
+            changes.append(Change(kind, "deleted", id_, None))
+        return changes
+
+    # -- reading
+    def _objects(self, cls, table, where="", args=()):
+        query = "SELECT data FROM {0} {1} ORDER BY id".format(table, where)
+        for row in self.db.execute(query, args):
+            yield cls(self.client, json.loads(row[0]))
+
+    def photo(self, id):
+        """ Returns the mirrored Photo id, or None """
+        for photo in self._objects(Photo, "photos", "WHERE id = ?",
+                                   (str(id), )):
+            return photo
+
+    def photos(self, hash=None):
+        """ Iterates over the mirrored photos, optionally only those with
+            the given hash.
+        """
+        if hash is not None:
+            return self._objects(Photo, "photos", "WHERE hash = ?", (hash, ))
+        return self._objects(Photo, "photos")
+
+    def albums(self):
+        return self._objects(Album, "albums")
+
+    def tags(self):
+        return self._objects(Tag, "tags")
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM photos").fetchone()[0]
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+import socket
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import (HTTPConnectionPool,
+                                    HTTPSConnectionPool)
+
+
+class PoolStats(object):
+    """ Connection pool counters of a TransportAdapter """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.opened = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def reused(self):
+        """ Number of requests served by an already open connection """
+        return self.requests - self.opened
+
+    def record(self, wait, opened):
+        with self.lock:
+            self.requests += 1
+            if opened:
+                self.opened += 1
+            self.wait_time += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(requests=self.requests, opened=self.opened,
+                        reused=self.reused, wait_time=self.wait_time,
+                        max_wait=self.max_wait)
+
+    def __repr__(self):
+        return ("<PoolStats requests={0} opened={1} reused={2} "
+                "wait_time={3:.3f}s>".format(self.requests, self.opened,
+                                             self.reused, self.wait_time))
+
+
+class _StatsPoolMixin(object):
+    stats = None
+
+    def _get_conn(self, timeout=None):
+        start = time.time()
+        conn = super(_StatsPoolMixin, self)._get_conn(timeout=timeout)
+        opened = getattr(conn, "sock", None) is None
+        self.stats.record(time.time() - start, opened)
+        return conn
+
+
+def keepalive_options(idle):
+    """ Socket options enabling TCP keep-alive probes after idle seconds """
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle))
+    elif hasattr(socket, "TCP_KEEPALIVE"):  # pragma: nocover (osx)
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL,
+                        max(1, idle // 4)))
+    if hasattr(socket, "TCP_KEEPCNT"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 4))
+    return options
+
+
+class TransportAdapter(HTTPAdapter):
+    """ requests transport adapter used by Client.
+
+        pool_connections is the number of hosts whose pools are kept,
+        pool_maxsize the number of connections kept open per host; if
+        pool_block is True no more than pool_maxsize connections per host
+        are ever opened and requests wait for a free one. timeout is the
+        default (connect, read) timeout, keepalive the idle time in seconds
+        before TCP keep-alive probes are sent (None leaves the OS default).
+    """
+    __attrs__ = HTTPAdapter.__attrs__ + ["timeout", "keepalive"]
+
+    def __init__(self, pool_connections=10, pool_maxsize=10,
+                 pool_block=False, timeout=None, keepalive=None,
+                 max_retries=0):
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.stats = PoolStats()
+        super(TransportAdapter, self).__init__(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+            max_retries=max_retries, pool_block=pool_block)
+
+    def init_poolmanager(self, connections, maxsize, block=False,
+                         **pool_kwargs):
+        if self.keepalive:
+            pool_kwargs["socket_options"] = (
+                HTTPConnection.default_socket_options +
+                keepalive_options(int(self.keepalive)))
+
+        super(TransportAdapter, self).init_poolmanager(connections, maxsize,
+                                                       block, **pool_kwargs)
+        attrs = dict(stats=self.stats)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("HTTPConnectionPool",
+                         (_StatsPoolMixin, HTTPConnectionPool), attrs),
+            "https": type("HTTPSConnectionPool",
+                          (_StatsPoolMixin, HTTPSConnectionPool), attrs),
+        }
+
+    def __setstate__(self, state):
+        self.stats = PoolStats()
+        super(TransportAdapter, self).__setstate__(state)
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        return super(TransportAdapter, self).send(request, timeout=timeout,
+                                                  **kwargs)
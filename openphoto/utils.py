@@ -1,8 +1,13 @@
 #!/usr/bin/env python
 
+import functools
 import hashlib
-from collections import Iterable
-from .compat import stringcls
+import mmap
+import multiprocessing
+import os
+from concurrent import futures
+from .compat import (Iterable,
+                     stringcls)
 
 
 class classproperty(property):
@@ -33,21 +38,87 @@ def assert_kwargs_empty(kwargs):
                         .format(fmt))
 
 
-def hash_(target):
+def chunked(iterable, size):
+    """ Yields lists of at most size items from iterable """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def hash_(target, chunk_size=65536, mmap_threshold=None):
     """ Utility functions that returns the hash of the file using the
-        same hash function of the API.
+        same hash function of the API. The file is read chunk_size bytes
+        at a time, so memory usage does not depend on the file size.
+
+        If mmap_threshold is given, files of at least that many bytes are
+        memory mapped and hashed without copying them into python buffers.
     """
     close_f = False
     photo_f = target
     if isinstance(target, stringcls):
         close_f = True
-        photo_f = open(target)
+        photo_f = open(target, "rb")
 
     try:
         sha1 = hashlib.sha1()
-        sha1.update(photo_f.read())
+        if mmap_threshold is not None:
+            try:
+                fileno = photo_f.fileno()
+                size = os.fstat(fileno).st_size
+
+            except (AttributeError, IOError, OSError, ValueError):
+                size = None
+
+            if size and size >= mmap_threshold and photo_f.tell() == 0:
+                mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, size, chunk_size):
+                        sha1.update(view[offset:offset + chunk_size])
+                finally:
+                    view.release()
+                    mapped.close()
+                return sha1.hexdigest()
+
+        while True:
+            chunk = photo_f.read(chunk_size)
+            if not chunk:
+                break
+            sha1.update(chunk)
         return sha1.hexdigest()
 
     finally:
         if close_f:
             photo_f.close()
+
+
+def _hash_or_none(path, **kwargs):
+    try:
+        return hash_(path, **kwargs)
+
+    except (IOError, OSError):
+        return None
+
+
+def hash_tree(directory, workers=None, chunk_size=65536, mmap_threshold=None):
+    """ Hashes every file under directory using a pool of workers
+        processes (default: one per cpu). Returns a dictionary mapping
+        each file path to its sha1, or to None if it could not be read
+        (e.g. a broken symlink).
+    """
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files))
+
+    hasher = functools.partial(_hash_or_none, chunk_size=chunk_size,
+                               mmap_threshold=mmap_threshold)
+    with futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        procs = workers or multiprocessing.cpu_count()
+        chunksize = max(1, len(paths) // (4 * procs))
+        return dict(zip(paths, pool.map(hasher, paths, chunksize=chunksize)))
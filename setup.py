@@ -7,6 +7,18 @@ try:
 except ImportError:
     requires.append('argparse')
 
+try:
+    from collections import OrderedDict
+
+except ImportError:
+    requires.append('ordereddict')
+
+try:
+    import concurrent.futures
+
+except ImportError:
+    requires.append('futures')
+
 try:
     from setuptools import setup
     kw = {
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+import os
+import tempfile
+import requests
+from openphoto.models import Album, Photo
+from openphoto.models.photo import PhotoSize
+from compat import unittest
+from benchmarks.server import FakeOpenPhoto
+
+try:
+    import asyncio
+    from openphoto.aio import AsyncClient
+
+except (ImportError, SyntaxError):
+    AsyncClient = None
+
+
+@unittest.skipIf(AsyncClient is None, "asyncio/aiohttp not available")
+class TestAsyncClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto(photos=5).start()
+        self.loop = asyncio.new_event_loop()
+        self.client = AsyncClient(self.server.host, "ckey", "csecret",
+                                  "otoken", "osecret", scheme="http")
+
+    def tearDown(self):
+        self.wait(self.client.close())
+        self.loop.close()
+        self.server.stop()
+
+    def wait(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def collect(self, aiter):
+        items = []
+        while True:
+            try:
+                items.append(self.wait(aiter.__anext__()))
+            except StopAsyncIteration:
+                return items
+
+    def test_request_signed(self):
+        response = self.wait(self.client.get("/photos/list.json",
+                                            params=dict(pageSize=1)))
+        self.assertEqual(len(response.json()["result"]), 1)
+        method, path, params, headers = self.server.requests[-1]
+        self.assertEqual(params, dict(pageSize="1"))
+        self.assertTrue(headers["Authorization"].startswith("OAuth "))
+        self.assertIn('oauth_consumer_key="ckey"', headers["Authorization"])
+
+        with self.assertRaises(ValueError):
+            self.wait(self.client.get("/photos/list.json", auth=True))
+
+    def test_request_error(self):
+        with self.assertRaises(requests.exceptions.HTTPError) as cm:
+            self.wait(self.client.get("/photo/nope/view.json"))
+        self.assertEqual(cm.exception.response.status_code, 404)
+
+    def test_view(self):
+        photo = Photo(self.client, {"id": "2"})
+        res = self.wait(self.client.view(photo, returnSizes="100x100"))
+        self.assertIs(res, photo)
+        self.assertEqual(photo.title, "photo 2")
+        self.assertIn("100x100", photo._paths)
+
+    def test_all(self):
+        old = Photo.page_size
+        try:
+            Photo.page_size = 2
+            photos = self.collect(self.client.all(Photo, prefetch=2))
+            self.assertEqual([p.id for p in photos],
+                             ["1", "2", "3", "4", "5"])
+            pages = [r[2]["page"] for r in self.server.requests]
+            self.assertEqual(sorted(pages), ["1", "2", "3"])
+
+            photos = self.collect(self.client.all(Photo, paginate=False))
+            self.assertEqual(len(photos), 5)
+        finally:
+            Photo.page_size = old
+
+    def test_create(self):
+        album = self.wait(self.client.create(Album, name="holidays"))
+        self.assertIsInstance(album, Album)
+        self.assertEqual(album.name, "holidays")
+        self.assertIs(album.client, self.client)
+
+    def test_create_photo_and_download(self):
+        fd, path = tempfile.mkstemp()
+        os.write(fd, b"\x00\xffimage data")
+        os.close(fd)
+        try:
+            photo = self.wait(self.client.create_photo(
+                path, title="title", return_sizes=["50x50"]))
+            self.assertEqual(photo.title, "title")
+            self.assertEqual(photo.size, 12)
+            self.assertIn("50x50", photo._paths)
+
+            size = PhotoSize(photo._paths["50x50"], self.client, photo)
+            self.wait(self.client.download(size, path))
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(),
+                                 self.server.content(photo.id, "50x50"))
+
+            chunks = self.collect(self.wait(self.client.download(size)))
+            self.assertEqual(b"".join(chunks),
+                             self.server.content(photo.id, "50x50"))
+        finally:
+            os.unlink(path)
@@ -1,7 +1,10 @@
 #!/usr/bin/env python
+import requests
+from openphoto import Client
 from openphoto.models import Album, Photo, Base
 from compat import (mock,
                     unittest)
+from benchmarks.server import FakeOpenPhoto
 
 
 class TestAlbum(unittest.TestCase):
@@ -39,3 +42,121 @@ class TestAlbum(unittest.TestCase):
         self.album.remove(objs[0])
         self.assertTrue(self.client.post.called_with(remove_url,
                                                      data={"ids": "1"}))
+
+    @mock.patch.object(Album, "all")
+    def test_get_by_name(self, all_mock):
+        albums = [Album(self.client, dict(id=str(i), name="album%d" % i))
+                  for i in range(3)]
+        all_mock.return_value = albums
+        self.assertIs(Album.get(self.client, name="album1"), albums[1])
+        self.assertIs(Album.get(self.client, name="album2"), albums[2])
+        self.assertEqual(all_mock.call_count, 1)
+
+        # a miss on a fresh index is not looked up
+        with self.assertRaises(requests.exceptions.HTTPError) as cm:
+            Album.get(self.client, name="nope")
+        self.assertEqual(cm.exception.response.status_code, 404)
+        self.assertEqual(all_mock.call_count, 1)
+
+        all_mock.return_value = albums + [
+            Album(self.client, dict(id="new", name="nope"))]
+        self.assertEqual(Album.get(self.client, name="nope",
+                                   refresh=True).id, "new")
+        self.assertEqual(all_mock.call_count, 2)
+
+        with self.assertRaises(TypeError):
+            Album.get(self.client)
+
+    @mock.patch.object(Album, "all")
+    def test_index(self, all_mock):
+        all_mock.return_value = [self.album]
+        index = Album.index(self.client, ttl=-1)
+        self.assertIs(index, Album.index(self.client))
+        self.assertIsNot(index, Album.index(mock.MagicMock()))
+        self.assertIn("myalbum", index)
+        self.assertIn("myalbum", index)
+        # ttl expired
+        self.assertEqual(all_mock.call_count, 2)
+
+        self.assertIs(Album.index(self.client, ttl=None), index)
+        self.assertIsNone(index.ttl)
+        self.assertEqual(Album.index(self.client).ttl, None)
+        self.client.post.return_value.json.return_value = dict(
+            result=dict(id="new", name="new"))
+        new = Album.create(self.client, "new")
+        self.assertIs(Album.get(self.client, name="new"), new)
+        new.delete()
+        self.assertNotIn("new", index.albums)
+        self.assertEqual(len(index), 1)
+        self.assertEqual(all_mock.call_count, 2)
+
+    @mock.patch.object(Album, "all")
+    def test_create_return_existing(self, all_mock):
+        all_mock.return_value = [self.album]
+        self.assertIs(Album.create(self.client, "myalbum",
+                                   return_existing=True), self.album)
+        self.assertFalse(self.client.post.called)
+        Album.create(self.client, "other", return_existing=True)
+        self.assertTrue(self.client.post.called)
+
+
+class TestAlbumMembers(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto(photos=30).start()
+        self.client = Client(self.server.host, "ckey", "csecret", "otoken",
+                             "osecret", scheme="http")
+        self.album = Album.create(self.client, "members")
+        self.old_batch_size = Album.batch_size
+        Album.batch_size = 4
+
+    def tearDown(self):
+        Album.batch_size = self.old_batch_size
+        self.server.stop()
+
+    def members(self):
+        return sorted(self.server.albums[self.album.id]["photos"], key=int)
+
+    def posts(self):
+        return [r for r in self.server.requests if r[0] == "POST"]
+
+    def test_add_remove(self):
+        ids = [str(i) for i in range(1, 11)]
+        added = self.album.add(ids + [Photo(self.client, {"id": "1"})])
+        self.assertEqual(added, ids)
+        self.assertEqual(self.members(), ids)
+        # album creation, then 10 ids 4 at a time
+        self.assertEqual(len(self.posts()), 1 + 3)
+
+        photos = self.album.photos()
+        del self.server.requests[:]
+        self.assertEqual(self.album.remove(["2", "3"]), ["2", "3"])
+        self.album.add(Photo(self.client, {"id": "20"}))
+        # the loaded photos are updated, not reloaded
+        self.assertEqual(sorted((p.id for p in self.album.photos()), key=int),
+                         ["1"] + ids[3:] + ["20"])
+        first = [p for p in photos if p.id == "1"][0]
+        self.assertEqual(first.title, "photo 1")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_failure(self):
+        self.server.fail("/album/.*/photo/add.json", 500)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.album.add([str(i) for i in range(1, 9)], workers=1)
+        self.assertEqual(self.members(), [str(i) for i in range(5, 9)])
+
+    def test_sync_members(self):
+        self.album.add([str(i) for i in range(1, 21)])
+        del self.server.requests[:]
+        desired = [str(i) for i in range(11, 31)]
+        changes = self.album.sync_members(desired)
+        self.assertEqual(changes.added, desired[10:])
+        self.assertEqual(sorted(changes.removed, key=int),
+                         [str(i) for i in range(1, 11)])
+        self.assertEqual(self.members(), desired)
+        self.assertEqual(sorted((p.id for p in self.album.photos()), key=int),
+                         desired)
+        # one view, then 10 adds and 10 removes 4 at a time
+        self.assertEqual(len(self.server.requests), 1 + 3 + 3)
+
+        self.assertEqual(self.album.sync_members(desired), ([], []))
@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+import pickle
 from openphoto.models import Base
 from compat import (mock,
                      unittest)
@@ -19,6 +20,19 @@ class TestBase(unittest.TestCase):
         for attr in data:
             self.assertEqual(getattr(obj, attr), data[attr])
 
+    def test_compact(self):
+        obj = Base(self.client, dict(date_taken=1, dateTaken=2))
+        self.assertFalse(hasattr(obj, "__dict__"))
+        self.assertEqual(obj.date_taken, 2)
+        self.assertEqual(Base._attr_names["date_taken"], "dateTaken")
+        with self.assertRaises(AttributeError):
+            object.__setattr__(obj, "other", 1)
+
+    def test_pickle(self):
+        obj = pickle.loads(pickle.dumps(Base(None, dict(id=1, attr=2))))
+        self.assertEqual(obj.data, dict(id=1, attr=2))
+        self.assertIsNone(obj.client)
+
     def test_setattr(self):
         data = {}
         obj = Base(self.client, data)
@@ -145,3 +159,74 @@ class TestBase(unittest.TestCase):
         self.assertIs(res1, klass.return_value)
         self.assertIs(res2, klass.return_value)
 
+
+    def test_iterate_total_pages(self):
+        pages = {1: [dict(id=1, totalPages=2), dict(id=2, totalPages=2)],
+                 2: [dict(id=3, totalPages=2)]}
+        calls = []
+
+        def partial(params):
+            calls.append(params['page'])
+            resmock = mock.MagicMock()
+            resmock.json.return_value = dict(result=pages[params['page']])
+            return resmock
+        partial = mock.MagicMock(side_effect=partial, keywords={})
+
+        ids = [o.id for o in Base.iterate(self.client, partial)]
+        self.assertEqual(ids, [1, 2, 3])
+        # no empty page probe when totalPages is known
+        self.assertEqual(calls, [1, 2])
+
+    def test_iterate_total_rows_page_size(self):
+        rows, page_size = 120, 50
+        calls = []
+
+        def partial(params):
+            calls.append((params['page'], params['pageSize']))
+            start = (params['page'] - 1) * page_size
+            resmock = mock.MagicMock()
+            resmock.json.return_value = dict(result=[
+                dict(id=i, totalRows=rows)
+                for i in range(start, min(start + page_size, rows))])
+            return resmock
+        partial = mock.MagicMock(side_effect=partial,
+                                 keywords=dict(params=dict(pageSize=50)))
+
+        ids = [o.id for o in Base.iterate(self.client, partial)]
+        self.assertEqual(ids, list(range(rows)))
+        # the page count follows the pageSize asked, not Base.page_size
+        self.assertEqual(calls, [(1, 50), (2, 50), (3, 50)])
+
+    def test_iterate_prefetch(self):
+        rows = 250
+        page_size = Base.page_size
+
+        def partial(params):
+            page = params['page']
+            start = (page - 1) * page_size
+            result = [dict(id=i, totalRows=rows)
+                      for i in range(start, min(start + page_size, rows))]
+            resmock = mock.MagicMock()
+            resmock.json.return_value = dict(result=result)
+            return resmock
+        partial = mock.MagicMock(side_effect=partial,
+                                 keywords=dict(params=dict(tags="a")))
+
+        ids = [o.id for o in Base.iterate(self.client, partial, prefetch=4)]
+        self.assertEqual(ids, list(range(rows)))
+        requested = sorted(c[1]['params']['page']
+                           for c in partial.call_args_list)
+        self.assertEqual(requested[:3], [1, 2, 3])
+        for c in partial.call_args_list:
+            self.assertEqual(c[1]['params']['tags'], "a")
+
+        # without page information the first empty page stops the listing
+        def partial(params):
+            page = params['page']
+            resmock = mock.MagicMock()
+            result = [dict(id=page)] if page <= 3 else []
+            resmock.json.return_value = dict(result=result)
+            return resmock
+        partial = mock.MagicMock(side_effect=partial, keywords={})
+        ids = [o.id for o in Base.iterate(self.client, partial, prefetch=2)]
+        self.assertEqual(ids, [1, 2, 3])
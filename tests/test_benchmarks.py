@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+from benchmarks.harness import (Result,
+                                compare,
+                                load_baseline,
+                                measure,
+                                percentile,
+                                save_baseline)
+from benchmarks.suite import (Options,
+                              run)
+from compat import unittest
+
+
+class TestHarness(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "baseline.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 99), 3)
+        self.assertIsNone(percentile([], 50))
+
+    def test_measure(self):
+        calls = []
+        result = measure("noop", lambda: calls.append(1), 10, warmup=2)
+        self.assertEqual(len(calls), 13)
+        self.assertEqual(result.ops, 10)
+        self.assertGreater(result.ops_per_sec, 0)
+        self.assertLessEqual(result.p50, result.p99)
+
+    def test_baseline(self):
+        self.assertEqual(load_baseline(self.path), {})
+        old = Result("a", 10, 100.0, 0.01, 0.02, 1000)
+        save_baseline(self.path, [old, Result("b", 1, 1.0, 1, 1, None)])
+        save_baseline(self.path, [old._replace(ops=20)])
+        baseline = load_baseline(self.path)
+        self.assertEqual(sorted(baseline), ["a", "b"])
+        self.assertEqual(baseline["a"], old._replace(ops=20))
+
+        new = Result("a", 10, 70.0, 0.011, 0.03, None)
+        regressions = compare([new], baseline, tolerance=0.2)
+        self.assertEqual([(r.metric, r.baseline, r.value)
+                          for r in regressions],
+                         [("ops_per_sec", 100.0, 70.0), ("p99", 0.02, 0.03)])
+        self.assertEqual(compare([new], baseline, tolerance=0.6), [])
+        self.assertEqual(compare([new._replace(name="c")], baseline), [])
+
+
+class TestSuite(unittest.TestCase):
+
+    def test_run(self):
+        options = Options(photos=20, photo_size=1024, page_size=5,
+                          max_page_size=3, error_rate=0.05, scale=0.02,
+                          warmup=0)
+        results = run(options)
+        self.assertEqual([r.name for r in results],
+                         ["iterate", "iterate_prefetch", "upload",
+                          "download", "album_photos", "attributes",
+                          "models", "collection", "sync_delta",
+                          "decode_100", "decode_500"])
+        self.assertTrue(all(r.ops == 1 for r in results))
+        results = run(options, ["upload"])
+        self.assertEqual([r.name for r in results], ["upload"])
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+from openphoto import Client
+from openphoto.cache import (CacheEntry,
+                             MemoryCache,
+                             SQLiteCache,
+                             cache_key,
+                             invalidation_prefixes)
+from openphoto.models import (Photo,
+                              Tag)
+from compat import (mock,
+                    unittest)
+from benchmarks.server import FakeOpenPhoto
+
+
+def entry(content=b"{}", url="http://h/photo/1/view.json", stored=None,
+          **headers):
+    e = CacheEntry(url, 200, headers, content, 0)
+    return e.touch() if stored is None else e._replace(stored=stored)
+
+
+class TestHelpers(unittest.TestCase):
+
+    def test_cache_key(self):
+        self.assertEqual(cache_key("http://h/a.json", dict(b=2, a="x y")),
+                         "http://h/a.json?b=2&a=x+y")
+        self.assertEqual(cache_key("http://h/a.json"), "http://h/a.json")
+
+    def test_invalidation_prefixes(self):
+        related = ["http://h/album/", "http://h/albums/", "http://h/tags/"]
+        self.assertEqual(
+            sorted(invalidation_prefixes("http://h/photo/1/update.json")),
+            sorted(related + ["http://h/photo/1/", "http://h/photos/"]))
+        self.assertEqual(
+            sorted(invalidation_prefixes("http://h/photo/upload.json")),
+            sorted(related + ["http://h/photos/"]))
+        self.assertEqual(
+            sorted(invalidation_prefixes("http://h/photos/delete.json")),
+            sorted(related + ["http://h/photo/", "http://h/photos/"]))
+        self.assertEqual(
+            sorted(invalidation_prefixes("http://h/album/2/photo/add.json")),
+            ["http://h/album/2/", "http://h/albums/", "http://h/photo/",
+             "http://h/photos/"])
+        self.assertEqual(
+            sorted(invalidation_prefixes("http://h/album/2/update.json")),
+            ["http://h/album/2/", "http://h/albums/"])
+        self.assertEqual(
+            sorted(invalidation_prefixes("http://h/tag/a/delete.json")),
+            ["http://h/photo/", "http://h/photos/", "http://h/tag/a/",
+             "http://h/tags/"])
+
+    def test_entry(self):
+        e = entry(ETag='"x"', **{"Last-Modified": "yesterday"})
+        self.assertEqual(e.validators, {"If-None-Match": '"x"',
+                                        "If-Modified-Since": "yesterday"})
+        self.assertTrue(e.is_fresh(10))
+        self.assertFalse(e._replace(stored=0).is_fresh(10))
+        response = e.response()
+        self.assertEqual(response.json(), {})
+        self.assertTrue(response.from_cache)
+
+
+class BackendTests(object):
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.set("a", entry(b"1"))
+        self.assertEqual(self.cache.get("a").content, b"1")
+        self.cache.set("a", entry(b"2"))
+        self.assertEqual(self.cache.get("a").content, b"2")
+        self.assertEqual(len(self.cache), 1)
+        self.cache.delete("a")
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_invalidate(self):
+        for key in ("http://h/photo/1/view.json", "http://h/photo/1/x.json",
+                    "http://h/photo/10/view.json", "http://h/photos/l.json"):
+            self.cache.set(key, entry())
+        self.cache.invalidate("http://h/photo/1/")
+        self.assertIsNone(self.cache.get("http://h/photo/1/view.json"))
+        self.assertIsNone(self.cache.get("http://h/photo/1/x.json"))
+        self.assertIsNotNone(self.cache.get("http://h/photo/10/view.json"))
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+
+class TestMemoryCache(BackendTests, unittest.TestCase):
+
+    def setUp(self):
+        self.cache = MemoryCache(max_entries=3, max_bytes=10)
+
+    def test_bounds(self):
+        for key in "abc":
+            self.cache.set(key, entry(b"1"))
+        self.cache.get("a")
+        self.cache.set("d", entry(b"1"))
+        # b is the least recently used
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(len(self.cache), 3)
+
+        self.cache.set("e", entry(b"123456789"))
+        self.assertEqual(list(self.cache.entries), ["d", "e"])
+        self.assertEqual(self.cache.size, 10)
+        self.cache.set("f", entry(b"12345678901"))
+        self.assertIsNone(self.cache.get("f"))
+
+
+class TestSQLiteCache(BackendTests, unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = SQLiteCache(os.path.join(self.dir, "cache.db"),
+                                 max_entries=3, max_bytes=10)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir)
+
+    def test_bounds(self):
+        for i, key in enumerate("abcd"):
+            self.cache.set(key, entry(b"1", stored=1e10 + i))
+        # a is the least recently stored
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(len(self.cache), 3)
+
+        self.cache.set("e", entry(b"123456789", stored=1e10 + 10))
+        self.assertIsNone(self.cache.get("c"))
+        self.assertIsNotNone(self.cache.get("d"))
+        self.assertEqual(len(self.cache), 2)
+        self.cache.set("f", entry(b"12345678901"))
+        self.assertIsNone(self.cache.get("f"))
+
+    def test_expired(self):
+        self.cache.ttl = 10
+        self.cache.set("old", entry(stored=0))
+        self.cache.set("etag", entry(stored=0, ETag='"x"'))
+        self.cache.set("new", entry())
+        # expired entries are kept only if they can be revalidated
+        self.assertIsNone(self.cache.get("old"))
+        self.assertIsNotNone(self.cache.get("etag"))
+        self.assertEqual(len(self.cache), 2)
+
+    def test_persistent(self):
+        self.cache.set("a", entry(b"\x00\xff", ETag="x"))
+        other = SQLiteCache(os.path.join(self.dir, "cache.db"))
+        try:
+            self.assertEqual(other.get("a").content, b"\x00\xff")
+            self.assertEqual(other.get("a").headers, {"ETag": "x"})
+        finally:
+            other.close()
+
+
+class TestClientCache(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto(photos=2).start()
+        self.cache = MemoryCache(ttl=60)
+        self.client = Client(self.server.host, "ckey", "csecret", "otoken",
+                             "osecret", scheme="http", cache=self.cache)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_fresh(self):
+        Photo.get(self.client, "1")
+        photo = Photo.get(self.client, "1")
+        self.assertEqual(photo.title, "photo 1")
+        self.assertEqual(len(self.server.requests), 1)
+        # different parameters are different entries
+        Photo.get(self.client, "1", returnSizes="10x10")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_revalidate(self):
+        Photo.get(self.client, "1")
+        self.cache.ttl = 0
+        photo = Photo.get(self.client, "1")
+        self.assertEqual(photo.title, "photo 1")
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertIn("If-None-Match", self.server.requests[1][3])
+
+        self.server.photos["1"]["title"] = "changed"
+        photo = Photo.get(self.client, "1")
+        self.assertEqual(photo.title, "changed")
+
+    def test_invalidate_on_write(self):
+        photo = Photo.get(self.client, "1")
+        Photo.get(self.client, "2")
+        photo.update(title="updated")
+        self.assertEqual(Photo.get(self.client, "1").title, "updated")
+        self.assertEqual(len(self.server.requests), 4)
+        Photo.get(self.client, "2")
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_invalidate_tags_on_update(self):
+        self.assertEqual(list(Tag.all(self.client)), [])
+        Photo.get(self.client, "1").update(tags=["new"])
+        self.assertEqual([t.id for t in Tag.all(self.client)], ["new"])
+
+    def test_invalidate_after_write(self):
+        photo = Photo.get(self.client, "1")
+        send = self.client._send
+
+        def racing_send(method, url, **kwargs):
+            if method == "post":
+                # a GET completing while the write is in flight
+                Photo.get(self.client, "1")
+            return send(method, url, **kwargs)
+
+        with mock.patch.object(self.client, "_send", racing_send):
+            photo.update(title="updated")
+        self.assertEqual(Photo.get(self.client, "1").title, "updated")
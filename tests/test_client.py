@@ -1,9 +1,15 @@
 #!/usr/bin/env python
 
+import pickle
+import socket
 import requests
 from openphoto import Client
+from openphoto.retry import (RetryPolicy,
+                             TokenBucket)
+from openphoto.transport import TransportAdapter
 from compat import (mock,
                      unittest)
+from benchmarks.server import FakeOpenPhoto
 
 
 class TestClient(unittest.TestCase):
@@ -86,3 +92,167 @@ class TestClient(unittest.TestCase):
                 self.client.not_existing
 
 
+
+
+class TestClientTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto(photos=1).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def client(self, **kwargs):
+        return Client(self.server.host, "ckey", "csecret", "otoken",
+                      "osecret", scheme="http", **kwargs)
+
+    def test_pool_stats(self):
+        client = self.client()
+        self.assertIsInstance(client.transport, TransportAdapter)
+        for _ in range(5):
+            client.get("/photos/list.json")
+        stats = client.pool_stats.snapshot()
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["opened"], 1)
+        self.assertEqual(stats["reused"], 4)
+        self.assertTrue(stats["wait_time"] >= 0)
+
+    def test_options(self):
+        client = self.client(pool_maxsize=3, pool_block=True, timeout=(1, 2),
+                             keepalive=30)
+        adapter = client.session.get_adapter("http://host")
+        self.assertIs(adapter, client.transport)
+        self.assertEqual(adapter.timeout, (1, 2))
+        pool_kw = adapter.poolmanager.connection_pool_kw
+        self.assertEqual(pool_kw["maxsize"], 3)
+        self.assertTrue(pool_kw["block"])
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+                      pool_kw["socket_options"])
+
+        with mock.patch("requests.adapters.HTTPAdapter.send") as send:
+            client.transport.send(mock.Mock())
+            self.assertEqual(send.call_args[1]["timeout"], (1, 2))
+            client.transport.send(mock.Mock(), timeout=5)
+            self.assertEqual(send.call_args[1]["timeout"], 5)
+
+        adapter = pickle.loads(pickle.dumps(client.transport))
+        self.assertEqual(adapter.timeout, (1, 2))
+        self.assertEqual(adapter.keepalive, 30)
+
+    def test_custom_adapter(self):
+        adapter = requests.adapters.HTTPAdapter()
+        client = self.client(adapter=adapter)
+        self.assertIs(client.session.get_adapter("https://host"), adapter)
+        self.assertIsNone(client.pool_stats)
+        client.get("/photos/list.json")
+
+
+class TestClientRetry(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto(photos=1).start()
+        self.policy = RetryPolicy(retries=2, backoff=0.001)
+        self.client = Client(self.server.host, "ckey", "csecret", "otoken",
+                             "osecret", scheme="http", retry=self.policy)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def count(self, path):
+        return len([r for r in self.server.requests if r[1] == path])
+
+    def test_retry_get(self):
+        self.server.fail("/photos/list.json", 503)
+        self.server.fail("/photos/list.json", "reset")
+        res = self.client.get("/photos/list.json")
+        self.assertEqual(len(res.json()["result"]), 1)
+        self.assertEqual(self.count("/photos/list.json"), 3)
+
+    def test_give_up(self):
+        self.server.fail("/photos/list.json", 500, times=3)
+        with self.assertRaises(requests.exceptions.HTTPError) as cm:
+            self.client.get("/photos/list.json")
+        self.assertEqual(cm.exception.response.status_code, 500)
+        self.assertEqual(self.count("/photos/list.json"), 3)
+
+    def test_no_retry_client_error(self):
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.client.get("/photo/nope/view.json")
+        self.assertEqual(self.count("/photo/nope/view.json"), 1)
+
+    def test_post(self):
+        # a 500 may have been processed, don't repeat it
+        self.server.fail("/album/create.json", 500)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.client.post("/album/create.json", data=dict(name="a"))
+        self.server.fail("/album/create.json", 429,
+                         headers={"Retry-After": "0"})
+        self.client.post("/album/create.json", data=dict(name="a"))
+        self.assertEqual(self.count("/album/create.json"), 3)
+        self.assertEqual(len(self.server.albums), 1)
+
+    def test_rate_limit_headers(self):
+        bucket = TokenBucket(1000)
+        bucket.pause = mock.Mock()
+        client = Client(self.server.host, "ckey", "csecret", "otoken",
+                        "osecret", scheme="http", rate_limit=bucket)
+        self.server.fail("/photos/list.json", 200, headers={
+            "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "2"})
+        client.get("/photos/list.json")
+        self.assertEqual(bucket.pause.call_args[0][0], 2.0)
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def error(self, status, code=None):
+        response = requests.Response()
+        response.status_code = status
+        error = requests.exceptions.HTTPError(response=response)
+        if code:
+            error.code = code
+        return error
+
+    def test_should_retry(self):
+        policy = RetryPolicy(retries=2)
+        self.assertTrue(policy.should_retry("get", self.error(502), 0))
+        self.assertFalse(policy.should_retry("get", self.error(502), 2))
+        self.assertFalse(policy.should_retry("get", self.error(404), 0))
+        self.assertTrue(policy.should_retry("get", self.error(200, 503), 0))
+        self.assertFalse(policy.should_retry("post", self.error(502), 0))
+        self.assertTrue(policy.should_retry("post", self.error(503), 0))
+        conn = requests.exceptions.ConnectionError()
+        self.assertTrue(policy.should_retry("get", conn, 0))
+        self.assertFalse(policy.should_retry("post", conn, 0))
+        timeout = requests.exceptions.ConnectTimeout()
+        self.assertTrue(policy.should_retry("post", timeout, 0))
+        self.assertFalse(policy.should_retry("get", ValueError(), 0))
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5, jitter=False)
+        self.assertEqual([policy.delay(i) for i in range(4)], [1, 2, 4, 5])
+        policy.jitter = True
+        for i in range(4):
+            self.assertTrue(0 <= policy.delay(i) <= 5)
+
+        response = requests.Response()
+        response.headers["Retry-After"] = "3"
+        self.assertEqual(policy.delay(0, response), 3)
+        response.headers["Retry-After"] = "Wed, 21 Oct 2015 07:28:00 GMT"
+        self.assertEqual(policy.delay(0, response), 0)
+
+    def test_token_bucket(self):
+        now = [0.0]
+        slept = []
+
+        def sleep(seconds):
+            slept.append(seconds)
+            now[0] += seconds
+        bucket = TokenBucket(2, burst=2, clock=lambda: now[0], sleep=sleep)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0.5)
+        now[0] += 1
+        self.assertEqual(bucket.acquire(), 0)
+        bucket.pause(10)
+        self.assertEqual(bucket.acquire(), 10)
+        self.assertEqual(slept, [0.5, 10])
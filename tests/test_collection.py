@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+from openphoto import Client
+from openphoto.collection import (PhotoCollection,
+                                  numpy)
+from openphoto.models import Photo
+from compat import (mock,
+                    unittest)
+from benchmarks.server import FakeOpenPhoto
+
+DAY = 86400
+JAN_2013 = 1356998400
+
+
+def photos(count=10):
+    return [dict(id=str(i), hash="h{0}".format(i),
+                 dateTaken=str(JAN_2013 + i * 10 * DAY), size=i * 10,
+                 latitude=None if i % 3 else 45.0 + i, permission=i % 2,
+                 title="photo {0}".format(i))
+            for i in range(count)]
+
+
+class TestPhotoCollection(unittest.TestCase):
+    use_numpy = False
+
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.collection = PhotoCollection(photos(), client=self.client,
+                                          use_numpy=self.use_numpy)
+
+    def ids(self, view):
+        return list(view.column("id"))
+
+    def test_columns(self):
+        self.assertEqual(len(self.collection), 10)
+        self.assertEqual(list(self.collection.column("date_taken"))[:2],
+                         [JAN_2013, JAN_2013 + 10 * DAY])
+        self.assertEqual(list(self.collection.missing("latitude"))[:4],
+                         [False, True, True, False])
+        with self.assertRaises(KeyError):
+            self.collection.column("title")
+
+    def test_filter(self):
+        without_gps = self.collection.filter(latitude__missing=True)
+        self.assertEqual(self.ids(without_gps), ["1", "2", "4", "5", "7", "8"])
+        self.assertEqual(self.ids(without_gps.filter(permission=1)),
+                         ["1", "5", "7"])
+        self.assertEqual(self.ids(self.collection.filter(size__gt=50,
+                                                         permission=1)),
+                         ["7", "9"])
+        self.assertEqual(self.ids(self.collection.filter(latitude__lt=100)),
+                         ["0", "3", "6", "9"])
+        self.assertEqual(self.ids(self.collection.filter(size__range=(20, 40),
+                                                         id__ne="3")),
+                         ["2", "4"])
+        self.assertEqual(self.ids(self.collection.filter(hash__in=["h1",
+                                                                   "h8"])),
+                         ["1", "8"])
+        mask = [i % 5 == 0 for i in range(10)]
+        self.assertEqual(self.ids(self.collection.filter(mask)), ["0", "5"])
+        self.assertEqual(len(self.collection.filter(id="none")), 0)
+
+    def test_sort(self):
+        by_size = self.collection.sort("size", reverse=True)
+        self.assertEqual(self.ids(by_size[:3]), ["9", "8", "7"])
+        by_permission = self.collection.filter(size__lt=50).sort(
+            ["permission", "size"])
+        self.assertEqual(self.ids(by_permission), ["0", "2", "4", "1", "3"])
+
+    def test_sort_stable(self):
+        by_permission = self.collection.sort("permission", reverse=True)
+        self.assertEqual(self.ids(by_permission),
+                         ["1", "3", "5", "7", "9", "0", "2", "4", "6", "8"])
+        data = photos()
+        for photo in data:
+            photo["size"] = int(photo["id"]) // 4
+        collection = PhotoCollection(data, use_numpy=self.use_numpy)
+        by_size = collection.sort(["size", "permission"], reverse=True)
+        self.assertEqual(self.ids(by_size),
+                         ["9", "8", "5", "7", "4", "6", "1", "3", "0", "2"])
+
+    def test_group_by(self):
+        months = self.collection.group_by("date_taken", period="month")
+        self.assertEqual(list(months), ["2013-01", "2013-02", "2013-03",
+                                        "2013-04"])
+        self.assertEqual(dict((k, v.sum("size")) for k, v in months.items()),
+                         {"2013-01": 60, "2013-02": 90, "2013-03": 210,
+                          "2013-04": 90})
+        self.assertEqual(self.ids(months["2013-03"]), ["6", "7", "8"])
+
+        latitudes = self.collection.filter(size__ge=30).group_by("latitude")
+        self.assertEqual(list(latitudes), [48.0, 51.0, 54.0, None])
+        self.assertEqual(self.ids(latitudes[None]), ["4", "5", "7", "8"])
+        with self.assertRaises(ValueError):
+            self.collection.group_by("date_taken", period="week")
+
+    def test_photos(self):
+        view = self.collection.filter(permission=1)
+        photo = view[1]
+        self.assertIsInstance(photo, Photo)
+        self.assertIs(photo.client, self.client)
+        self.assertEqual(photo.data, dict(id="3", hash="h3",
+                                          dateTaken=JAN_2013 + 30 * DAY,
+                                          size=30, latitude=48.0,
+                                          permission=1))
+        self.assertEqual(view[-1].id, "9")
+        self.assertEqual([p.id for p in view], ["1", "3", "5", "7", "9"])
+        with self.assertRaises(IndexError):
+            view[5]
+
+    def test_keep_data(self):
+        objects = [Photo(self.client, data) for data in photos(3)]
+        collection = PhotoCollection(objects, keep_data=True,
+                                     use_numpy=self.use_numpy)
+        self.assertIs(collection.client, self.client)
+        self.assertIs(collection.sort("size", reverse=True)[0], objects[2])
+
+        collection = PhotoCollection(photos(3), keep_data=True,
+                                     use_numpy=self.use_numpy)
+        self.assertEqual(collection[1].title, "photo 1")
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestPhotoCollectionNumpy(TestPhotoCollection):
+    use_numpy = True
+
+
+class TestPhotoCollectionFetch(unittest.TestCase):
+
+    def test_fetch(self):
+        with FakeOpenPhoto(photos=25) as server:
+            client = Client(server.host, "ckey", "csecret", "otoken",
+                            "osecret", scheme="http")
+            collection = PhotoCollection.fetch(client, pageSize=10)
+        self.assertEqual(len(collection), 25)
+        self.assertEqual(collection.sum("date_uploaded"),
+                         sum(2000 + i for i in range(1, 26)))
+        self.assertIs(collection.client, client)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+import json
+import requests
+from openphoto import Client
+from openphoto.decoding import (DECODERS,
+                                attach,
+                                get_decoder,
+                                iter_items)
+from openphoto.models import (Base,
+                              Photo)
+from compat import (mock,
+                    unittest)
+from benchmarks.server import FakeOpenPhoto
+
+
+E_GRAVE = b"\xc3\xa8".decode("utf-8")
+
+
+def response(content):
+    res = requests.Response()
+    res.status_code = 200
+    res._content = content
+    return res
+
+
+class CountingLoads(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, content):
+        self.calls = self.calls + 1
+        return json.loads(content.decode("utf-8"))
+
+
+class TestDecoding(unittest.TestCase):
+
+    def test_get_decoder(self):
+        self.assertIs(get_decoder(), list(DECODERS.values())[0])
+        self.assertIs(get_decoder("json"), DECODERS["json"])
+        self.assertIs(get_decoder(len), len)
+        with self.assertRaises(ValueError):
+            get_decoder("nope")
+
+    def test_decoders(self):
+        content = b'{"result": [{"id": "1", "title": "\\u00e8"}], "code": 200}'
+        for name, loads in DECODERS.items():
+            self.assertEqual(loads(content)["result"],
+                             [{"id": "1", "title": E_GRAVE}], name)
+
+    def test_attach(self):
+        loads = CountingLoads()
+        res = attach(response(b'{"result": [1, 2]}'), loads)
+        self.assertEqual(res.json(), {"result": [1, 2]})
+        self.assertIs(res.json(), res.json())
+        self.assertEqual(loads.calls, 1)
+
+    def test_attach_fallback(self):
+        res = response(('{"result": "' + E_GRAVE + '"}').encode("utf-16"))
+        res.encoding = "utf-16"
+        self.assertEqual(attach(res, DECODERS["json"]).json(),
+                         {"result": E_GRAVE})
+
+
+def chunks(content, size):
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+class TestIterItems(unittest.TestCase):
+
+    def test_items(self):
+        body = json.dumps(dict(code=200, result=[
+            dict(id="1", title="caff" + E_GRAVE, tags=["a", "b"]),
+            12345, -1.5e3, None, [], b"\xe2\x82\xac".decode("utf-8"),
+        ], message="ok, [done]"), ensure_ascii=False).encode("utf-8")
+        expected = json.loads(body.decode("utf-8"))
+        for size in (1, 2, 7, len(body)):
+            fields = {}
+            items = list(iter_items(chunks(body, size), fields=fields))
+            self.assertEqual(items, expected["result"])
+            self.assertEqual(fields, dict(code=200, message="ok, [done]"))
+
+    def test_lazy(self):
+        def body():
+            yield b'{"result": [{"id": 1}, '
+            raise AssertionError("read too far")
+        self.assertEqual(next(iter_items(body())), {"id": 1})
+
+    def test_errors(self):
+        fields = {}
+        self.assertEqual(list(iter_items([b'{"code": 500, "result": null}'],
+                                         fields=fields)), [])
+        self.assertEqual(fields, dict(code=500, result=None))
+        with self.assertRaises(ValueError):
+            list(iter_items([b'{"result": [1, 2']))
+        with self.assertRaises(ValueError):
+            list(iter_items([b'[1, 2]']))
+
+    def test_stream_result(self):
+        res = mock.Mock()
+        res.iter_content.return_value = [b'{"code": 404, "message": "nope", ',
+                                         b'"result": []}']
+        with self.assertRaises(requests.exceptions.HTTPError):
+            list(Base._stream_result(res))
+        self.assertTrue(res.close.called)
+
+
+class TestClientDecoding(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto(photos=3).start()
+        self.loads = CountingLoads()
+        self.client = Client(self.server.host, "ckey", "csecret", "otoken",
+                             "osecret", scheme="http", decoder=self.loads)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_single_parse(self):
+        photo = Photo.get(self.client, "1")
+        self.assertEqual(photo.title, "photo 1")
+        self.assertEqual(len(list(Photo.all(self.client))), 3)
+        self.assertEqual(self.loads.calls, len(self.server.requests))
+
+    def test_stream_listing(self):
+        self.server.max_page_size = 2
+        photos = list(Photo.all(self.client, stream=True))
+        self.assertEqual([p.id for p in photos], ["1", "2", "3"])
+        self.assertEqual(self.loads.calls, 0)
+        self.assertEqual([p.data for p in photos],
+                         [p.data for p in Photo.all(self.client)])
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+from openphoto import Client
+from openphoto.download import DownloadManager
+from openphoto.models import Photo
+from compat import unittest
+from benchmarks.server import FakeOpenPhoto
+
+
+class TestDownloadManager(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto(photos=4, photo_size=100000).start()
+        self.client = Client(self.server.host, "ckey", "csecret", "otoken",
+                             "osecret", scheme="http")
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def content(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_download(self):
+        photos = list(Photo.all(self.client))
+        manager = DownloadManager(workers=3, chunk_size=8192)
+        results = list(manager.download(photos, ["100x100", "original"],
+                                        self.dir))
+        self.assertEqual(len(results), 8)
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertEqual(result.bytes, 100000)
+            self.assertEqual(self.content(result.path),
+                             self.server.content(result.photo.id,
+                                                 result.size))
+        self.assertEqual(manager.stats.files, 8)
+        self.assertEqual(manager.stats.bytes, 800000)
+        self.assertTrue(manager.stats.throughput > 0)
+        self.assertFalse([n for n in os.listdir(self.dir)
+                          if n.endswith(".part")])
+
+        # existing files are not downloaded again
+        results = list(manager.download(photos[:1], "original", self.dir))
+        self.assertEqual(results[0].bytes, 0)
+
+    def test_resume(self):
+        photo = Photo.get(self.client, "2")
+        expected = self.server.content("2", "original")
+        path = os.path.join(self.dir, "2_original.jpg")
+        with open(path + ".part", "wb") as f:
+            f.write(expected[:30000])
+
+        manager = DownloadManager()
+        result, = manager.download([photo], "original", self.dir)
+        self.assertIsNone(result.error)
+        self.assertEqual(result.bytes, 70000)
+        self.assertEqual(self.content(path), expected)
+        self.assertEqual(manager.stats.resumed, 1)
+        headers = self.server.requests[-1][3]
+        self.assertEqual(headers["Range"], "bytes=30000-")
+
+        # a complete .part file is just renamed
+        os.rename(path, path + ".part")
+        manager = DownloadManager()
+        result, = manager.download([photo], "original", self.dir)
+        self.assertIsNone(result.error)
+        self.assertEqual(self.content(path), expected)
+
+    def test_resume_restarted(self):
+        photo = Photo.get(self.client, "2")
+        expected = self.server.content("2", "original")
+        path = os.path.join(self.dir, "2_original.jpg")
+        for ranges, skew in ((False, 0), (True, 10)):
+            with open(path + ".part", "wb") as f:
+                f.write(expected[:30000])
+            self.server.ranges = ranges
+            self.server.range_skew = skew
+            manager = DownloadManager(overwrite=True)
+            result, = manager.download([photo], "original", self.dir)
+            self.assertIsNone(result.error)
+            self.assertEqual(result.bytes, 100000)
+            self.assertEqual(self.content(path), expected)
+            # downloaded again from the start: not a resume
+            self.assertEqual(manager.stats.resumed, 0)
+
+    def test_resume_larger_part(self):
+        photo = Photo.get(self.client, "2")
+        expected = self.server.content("2", "original")
+        path = os.path.join(self.dir, "2_original.jpg")
+        with open(path + ".part", "wb") as f:
+            f.write(expected + b"stale")
+
+        manager = DownloadManager()
+        result, = manager.download([photo], "original", self.dir)
+        self.assertIsNone(result.error)
+        self.assertEqual(result.bytes, 100000)
+        self.assertEqual(self.content(path), expected)
+        self.assertEqual(manager.stats.resumed, 0)
+
+    def test_error_keeps_part(self):
+        photo = Photo(self.client, {"id": "nope"})
+        object.__setattr__(photo, "_paths", {
+            "original": "http://{0}/nothing/here.jpg".format(self.server.host)
+        })
+        manager = DownloadManager()
+        result, = manager.download([photo], "original", self.dir)
+        self.assertIsNotNone(result.error)
+        self.assertEqual(manager.stats.errors, 1)
+        self.assertFalse(os.path.exists(result.path))
+
+        # a failed resume keeps what was downloaded
+        part = os.path.join(self.dir, "2_original.jpg.part")
+        with open(part, "wb") as f:
+            f.write(b"partial")
+        photo = Photo.get(self.client, "2")
+        self.server.fail("/photo/2/original.jpg", 500)
+        result, = manager.download([photo], "original", self.dir)
+        self.assertIsNotNone(result.error)
+        self.assertEqual(self.content(part), b"partial")
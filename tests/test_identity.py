@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+import gc
+from openphoto.identity import IdentityMap
+from openphoto.models import Album, Photo, Tag
+from compat import (mock,
+                    unittest)
+
+
+class TestIdentityMap(unittest.TestCase):
+
+    def setUp(self):
+        self.client = mock.MagicMock()
+
+    def photo(self, id_):
+        return Photo(self.client, {"id": id_})
+
+    def test_strong(self):
+        imap = IdentityMap()
+        photo = self.photo(1)
+        imap.add(photo)
+        self.assertIs(imap.get(Photo, 1), photo)
+        self.assertIs(imap.get(Photo, "1"), photo)
+        self.assertIsNone(imap.get(Tag, 1))
+        self.assertIn((Photo, 1), imap)
+        del photo
+        gc.collect()
+        self.assertEqual(len(imap), 1)
+        imap.discard(imap.get(Photo, 1))
+        self.assertEqual(len(imap), 0)
+
+    def test_max_size(self):
+        imap = IdentityMap(max_size=2)
+        photos = [self.photo(i) for i in range(3)]
+        imap.add(photos[0])
+        imap.add(photos[1])
+        imap.get(Photo, 0)
+        imap.add(photos[2])
+        self.assertIsNone(imap.get(Photo, 1))
+        self.assertIs(imap.get(Photo, 0), photos[0])
+        self.assertEqual(len(imap), 2)
+
+    def test_weak(self):
+        imap = IdentityMap(weak=True)
+        photo = self.photo(1)
+        imap.add(photo)
+        self.assertIs(imap.get(Photo, 1), photo)
+        del photo
+        gc.collect()
+        self.assertIsNone(imap.get(Photo, 1))
+
+        imap = IdentityMap(weak=True, max_size=1)
+        imap.add(self.photo(1))
+        imap.add(self.photo(2))
+        gc.collect()
+        # the most recent one is kept alive
+        self.assertIsNone(imap.get(Photo, 1))
+        self.assertIsNotNone(imap.get(Photo, 2))
+        imap.clear()
+        self.assertEqual(len(imap), 0)
+
+
+class TestModelIdentity(unittest.TestCase):
+
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.client.identity_map = IdentityMap()
+
+    def test_canonical(self):
+        photo = Photo(self.client, {"id": "p1", "title": "title"})
+        other = Photo(self.client, {"id": "p1", "width": 10,
+                                    "pathOriginal": "/orig.jpg"})
+        self.assertIs(photo, other)
+        self.assertEqual(photo.title, "title")
+        self.assertEqual(photo.width, 10)
+        self.assertEqual(photo.paths(), {"original": "/orig.jpg"})
+
+        Photo(self.client, {"id": "p1", "path100x100": "/100.jpg"})
+        self.assertEqual(photo.paths(), {"original": "/orig.jpg",
+                                         "100x100": "/100.jpg"})
+        self.assertFalse(self.client.get.called)
+
+        # no id, no identity
+        self.assertIsNot(Photo(self.client, {}), Photo(self.client, {}))
+        # other clients have their own objects
+        self.assertIsNot(Photo(mock.MagicMock(), {"id": "p1"}), photo)
+
+    def test_album_cover_and_tags(self):
+        photo = Photo(self.client, {"id": "p1", "tags": ["a"]})
+        album = Album(self.client, {"id": "a1", "cover": {"id": "p1"}})
+        self.assertIs(album.cover, photo)
+        self.assertIs(Album(self.client, {"id": "a1", "count": 2}), album)
+        self.assertNotIn("count", album.data)
+        self.assertIs(photo.tags()[0], Tag(self.client, {"id": "a"}))
+
+    def test_nextprevious(self):
+        photo = Photo(self.client, {"id": "p1"})
+        following = Photo(self.client, {"id": "p2"})
+        self.client.get.return_value.json.return_value = {
+            "result": {"next": [{"id": "p2", "title": "next"}]}
+        }
+        self.assertIs(photo.get_next()[0], following)
+        self.assertEqual(following.title, "next")
+
+    def test_delete(self):
+        photo = Photo(self.client, {"id": "p1"})
+        photo.delete()
+        self.assertIsNot(Photo(self.client, {"id": "p1"}), photo)
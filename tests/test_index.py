@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+import io
+from openphoto import Client
+from openphoto.index import (CatalogueIndex,
+                             distance)
+from openphoto.models import (Album,
+                              Photo)
+from compat import (mock,
+                    unittest)
+from benchmarks.server import FakeOpenPhoto
+
+YEAR_2019 = (1546300800, 1577836799)
+ROME = (41.9028, 12.4964)
+MILAN = (45.4642, 9.19)
+
+
+def photo(id_, tags=(), taken=None, where=None, **data):
+    data.update(id=str(id_), tags=list(tags))
+    if taken is not None:
+        data["dateTaken"] = str(taken)
+    if where is not None:
+        data["latitude"], data["longitude"] = where
+    return data
+
+
+class TestCatalogueIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.index = CatalogueIndex(self.client).update([
+            photo(1, ["a", "b"], 1550000000, ROME, pathOriginal="/1.jpg"),
+            photo(2, ["a"], 1560000000, MILAN),
+            photo(3, ["b"], 1450000000, (41.95, 12.5)),
+            photo(4, ["a", "b"], 1570000000),
+            photo(5, [], 1580000000, ("", "")),
+        ], [dict(id="a1", name="holidays", photos=[dict(id="1"),
+                                                    dict(id="3")])])
+
+    def test_distance(self):
+        self.assertAlmostEqual(distance(*(ROME + MILAN)), 477, delta=1)
+
+    def test_query(self):
+        query = self.index.query
+        self.assertEqual(query(tags=["a", "b"], ids=True), ["4", "1"])
+        self.assertEqual(query(tags=["a"], taken=YEAR_2019, ids=True),
+                         ["4", "2", "1"])
+        self.assertEqual(query(tags=["a", "b"], taken=YEAR_2019,
+                               near=ROME + (10, ), ids=True), ["1"])
+        self.assertEqual(query(near=ROME + (10, ), ids=True), ["1", "3"])
+        self.assertEqual(query(bbox=(45, 9, 46, 10), ids=True), ["2"])
+        self.assertEqual(query(any_tags=["b", "c"], reverse=False,
+                               ids=True), ["3", "1", "4"])
+        self.assertEqual(query(taken=(None, 1550000000), ids=True),
+                         ["1", "3"])
+        self.assertEqual(query(album="holidays", ids=True), ["1", "3"])
+        self.assertEqual(query(album="a1", tags=["a"], ids=True), ["1"])
+        self.assertEqual(query(tags=["missing"]), [])
+        self.assertEqual(len(query(limit=2)), 2)
+        self.assertEqual(len(query()), 5)
+
+    def test_photos(self):
+        photos = self.index.query(tags=["a", "b"], near=ROME + (10, ))
+        self.assertEqual(len(photos), 1)
+        self.assertIsInstance(photos[0], Photo)
+        self.assertIs(photos[0].client, self.client)
+        self.assertEqual(photos[0].paths(), {"original": "/1.jpg"})
+        self.assertFalse(self.client.get.called)
+
+    def test_reindex(self):
+        self.index.add_photo(photo(1, ["c"], 1350000000))
+        self.assertEqual(self.index.query(tags=["a"], ids=True), ["4", "2"])
+        self.assertEqual(self.index.query(tags=["c"], ids=True), ["1"])
+        self.assertEqual(self.index.query(near=ROME + (10, ), ids=True),
+                         ["3"])
+        self.index.remove_photo("3")
+        self.assertNotIn("3", self.index)
+        self.assertEqual(self.index.tags["b"], set(["4"]))
+        self.assertEqual(self.index.query(album="holidays", ids=True),
+                         ["1"])
+        self.index.remove_album("a1")
+        self.assertEqual(self.index.query(album="holidays"), [])
+
+
+class TestCatalogueIndexEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto(photos=3).start()
+        self.client = Client(self.server.host, "ckey", "csecret", "otoken",
+                             "osecret", scheme="http")
+        self.index = CatalogueIndex().update(Photo.all(self.client))
+        self.index.attach(self.client)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_follows_client(self):
+        self.assertIs(self.index.client, self.client)
+        photo = Photo.create(self.client, io.BytesIO(b"content"),
+                             tags=["new"])
+        self.assertEqual(self.index.query(tags=["new"], ids=True),
+                         [photo.id])
+
+        photo.update(tags=["renamed"])
+        self.assertEqual(self.index.query(tags=["new"]), [])
+        self.assertEqual(self.index.query(tags=["renamed"], ids=True),
+                         [photo.id])
+
+        album = Album.create(self.client, "album")
+        album.add([photo, Photo(self.client, {"id": "1"})])
+        self.assertEqual(self.index.query(album="album", ids=True),
+                         sorted(["1", photo.id], key=int, reverse=True))
+        album.remove(photo)
+        self.assertEqual(self.index.query(album=album, ids=True), ["1"])
+
+        Photo.update_batch(self.client, ["1", "2"], tags=["x"],
+                           tags_action="add")
+        self.assertEqual(self.index.query(tags=["x"], ids=True), ["2", "1"])
+
+        Photo.delete_batch(self.client, ["2", photo.id])
+        self.assertEqual(self.index.query(tags=["x"], ids=True), ["1"])
+        self.assertEqual(len(self.index), 2)
+
+        self.index.detach()
+        Photo.delete_batch(self.client, ["1"])
+        self.assertIn("1", self.index)
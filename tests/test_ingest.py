@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+from openphoto import Client
+from openphoto.ingest import (IngestPipeline,
+                              extract_metadata)
+from openphoto.models import Album
+from compat import unittest
+from benchmarks.server import FakeOpenPhoto
+
+
+def crash(path):
+    os._exit(1)
+
+
+def fake_metadata(path):
+    if os.path.basename(path) in ("b.jpg", "dup.jpg"):
+        return dict(date_taken=datetime.datetime(2019, 1, 2, 3, 4, 5),
+                    latitude=41.9)
+    return {}
+
+
+class TestIngestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto().start()
+        self.client = Client(self.server.host, "ckey", "csecret", "otoken",
+                             "osecret", scheme="http")
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_run(self):
+        self.server.add_photo(hash=hashlib.sha1(b"old").hexdigest())
+        album = Album.create(self.client, "ingest")
+        paths = [self.write("{0}.jpg".format(i),
+                            ("content %d" % i).encode("ascii"))
+                 for i in range(20)]
+        paths += [self.write("b.jpg", b"b"), self.write("dup.jpg", b"b"),
+                  self.write("old.jpg", b"old"),
+                  os.path.join(self.dir, "missing.jpg")]
+
+        pipeline = IngestPipeline(self.client, albums=[album],
+                                  prepare_workers=2, upload_workers=3,
+                                  queue_size=2, attach_batch=4,
+                                  extract=fake_metadata, tags=["new"],
+                                  title="ingested")
+        results = dict((os.path.basename(r.path), r)
+                       for r in pipeline.run(paths))
+        self.assertEqual(len(results), 24)
+
+        uploaded = [r for r in results.values() if r.photo is not None]
+        self.assertEqual(len(uploaded), 21)
+        self.assertTrue(all(r.error is None for r in uploaded))
+        self.assertEqual(results["0.jpg"].photo.title, "ingested")
+        self.assertEqual(results["0.jpg"].sha1,
+                         hashlib.sha1(b"content 0").hexdigest())
+        self.assertTrue(results["old.jpg"].skipped)
+        self.assertIsNotNone(results["missing.jpg"].error)
+        # one of the two identical files is skipped
+        self.assertEqual(results["b.jpg"].skipped + results["dup.jpg"].skipped,
+                         1)
+        stored = self.server.photos[
+            (results["b.jpg"].photo or results["dup.jpg"].photo).id]
+        self.assertEqual(float(stored["latitude"]), 41.9)
+        self.assertIn("dateTaken", stored)
+
+        self.assertEqual(sorted(self.server.albums[album.id]["photos"]),
+                         sorted(r.photo.id for r in uploaded))
+        self.assertTrue(all(self.server.photos[r.photo.id]["tags"] == ["new"]
+                            for r in uploaded))
+
+        stats = pipeline.stats
+        self.assertEqual(list(stats), ["prepare", "upload", "attach"])
+        self.assertEqual(stats["prepare"].items, 23)
+        self.assertEqual(stats["prepare"].errors, 1)
+        self.assertEqual(stats["upload"].items, 23)
+        self.assertEqual(stats["attach"].items, 21)
+        self.assertGreater(stats["upload"].throughput, 0)
+
+    def test_failed_original(self):
+        paths = [self.write("a.jpg", b"a"), self.write("b.jpg", b"a")]
+        self.server.fail("/photo/upload.json", 500)
+        results = list(IngestPipeline(self.client, prepare_workers=1,
+                                      upload_workers=2, extract=fake_metadata)
+                       .run(paths))
+        self.assertEqual(len([r for r in results if r.error is not None]), 1)
+        # the copy is uploaded in place of the failed file
+        self.assertEqual([r.skipped for r in results if r.error is None],
+                         [False])
+        self.assertEqual(len(self.server.photos), 1)
+
+    def test_broken_pool(self):
+        paths = [self.write("{0}.jpg".format(i), b"x") for i in range(5)]
+        pipeline = IngestPipeline(self.client, prepare_workers=1,
+                                  extract=crash)
+        results = list(pipeline.run(paths))
+        self.assertEqual(sorted(r.path for r in results), sorted(paths))
+        self.assertTrue(all(r.error is not None for r in results))
+        self.assertEqual(pipeline.stats["prepare"].errors, 5)
+        self.assertFalse(self.server.photos)
+
+    def test_close(self):
+        paths = [self.write("{0}.jpg".format(i),
+                            ("content %d" % i).encode("ascii"))
+                 for i in range(30)]
+        self.server.latency = 0.01
+        results = IngestPipeline(self.client, prepare_workers=1,
+                                 upload_workers=1, queue_size=1).run(paths)
+        next(results)
+        results.close()
+        self.assertLess(len(self.server.photos), 30)
+
+    def test_extract_metadata(self):
+        path = self.write("plain.jpg", b"not an image")
+        self.assertEqual(extract_metadata(path), {})
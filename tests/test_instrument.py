@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+import requests
+from openphoto import Client
+from openphoto.cache import MemoryCache
+from openphoto.instrument import (Histogram,
+                                  Metrics,
+                                  RequestEvent,
+                                  current_operations,
+                                  endpoint_template,
+                                  instrumented)
+from openphoto.models import Photo
+from compat import unittest
+from benchmarks.server import FakeOpenPhoto
+
+
+def event(endpoint="/photo/{id}/view.json", elapsed=0.01, operations=(),
+          error=None, status=200):
+    return RequestEvent("GET", "http://host" + endpoint, endpoint, status,
+                        0, 10, elapsed / 2, elapsed, operations, error, False)
+
+
+class TestInstrument(unittest.TestCase):
+
+    def test_endpoint_template(self):
+        cases = {
+            "http://h/photo/abc/view.json": "/photo/{id}/view.json",
+            "http://h/photo/abc/nextprevious/list.json":
+                "/photo/{id}/nextprevious/list.json",
+            "/photos/list.json": "/photos/list.json",
+            "/photos/tags-a/list.json": "/photos/{filter}/list.json",
+            "/photos/tags-a/page-2/list.json": "/photos/{filter}/list.json",
+            "/album/a1/photo/add.json": "/album/{id}/photo/add.json",
+            "/photos/custom/abc_100x100.jpg": "/photos/{filter}/{file}",
+        }
+        for url, expected in cases.items():
+            self.assertEqual(endpoint_template(url), expected, url)
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(1, 2, 3))
+        self.assertIsNone(histogram.percentile(50))
+        for value in (0.5, 0.5, 1.5, 2.5, 10):
+            histogram.add(value)
+        self.assertEqual(histogram.counts, [2, 1, 1, 1])
+        self.assertEqual(histogram.percentile(40), 1)
+        self.assertEqual(histogram.percentile(50), 2)
+        self.assertEqual(histogram.percentile(99), 10)
+
+    def test_instrumented(self):
+        class Model(object):
+            @instrumented
+            def outer(self):
+                return self.inner()
+
+            @instrumented
+            def inner(self):
+                return current_operations()
+
+            @instrumented
+            def gen(self):
+                yield current_operations()
+                yield self.inner()
+
+        model = Model()
+        self.assertEqual(model.outer(), ("Model.outer", "Model.inner"))
+        iterator = model.gen()
+        self.assertEqual(list(iterator), [("Model.gen", ),
+                                          ("Model.gen", "Model.inner")])
+        self.assertEqual(current_operations(), ())
+
+    def test_metrics(self):
+        metrics = Metrics()
+        metrics(event(operations=("Photo.paths", "Photo.view")))
+        metrics(event(elapsed=0.2, operations=("Photo.view", )))
+        metrics(event("/photos/list.json", error=ValueError(), status=500))
+
+        snapshot = metrics.snapshot()
+        view = snapshot["endpoints"]["GET /photo/{id}/view.json"]
+        self.assertEqual(view["latency"]["count"], 2)
+        self.assertEqual(view["latency"]["p99"], 0.25)
+        self.assertEqual(view["bytes_in"], 20)
+        listing = snapshot["endpoints"]["GET /photos/list.json"]
+        self.assertEqual(listing["errors"], 1)
+        self.assertEqual(listing["statuses"], {500: 1})
+        self.assertEqual(snapshot["operations"]["Photo.view"]["requests"], 2)
+        self.assertEqual(snapshot["operations"]["Photo.paths"]["requests"], 1)
+        self.assertEqual(snapshot["operations"]["<none>"]["errors"], 1)
+
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(),
+                         dict(endpoints={}, operations={}))
+
+
+class TestClientListeners(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto(photos=3).start()
+        self.events = []
+
+    def tearDown(self):
+        self.server.stop()
+
+    def client(self, **kwargs):
+        client = Client(self.server.host, "ckey", "csecret", "otoken",
+                        "osecret", scheme="http", **kwargs)
+        client.add_listener(self.events.append)
+        return client
+
+    def test_events(self):
+        client = self.client()
+        photos = list(Photo.all(client))
+        photos[0].paths()
+        with self.assertRaises(requests.exceptions.HTTPError):
+            Photo.get(client, "missing")
+
+        self.assertEqual([e.endpoint for e in self.events],
+                         ["/photos/list.json", "/photo/{id}/view.json",
+                          "/photo/{id}/view.json"])
+        listing, view, missing = self.events
+        self.assertEqual(listing.operations, ("Photo.all", ))
+        self.assertEqual(view.operations, ("Photo.paths", "Photo.load"))
+        self.assertEqual(missing.operations, ("Photo.get", "Photo.view"))
+        self.assertEqual(listing.status, 200)
+        self.assertGreater(listing.bytes_in, 0)
+        self.assertIsNotNone(listing.ttfb)
+        self.assertGreaterEqual(listing.elapsed, listing.ttfb)
+        self.assertEqual(missing.status, 404)
+        self.assertIsInstance(missing.error, requests.exceptions.HTTPError)
+
+    def test_worker_threads_and_cache(self):
+        client = self.client(cache=MemoryCache())
+        ids = [p.id for p in Photo.all(client)]
+        Photo.delete_batch(client, ids, workers=2)
+        list(Photo.all(client))
+        list(Photo.all(client))
+
+        batch = self.events[1]
+        self.assertEqual(batch.method, "POST")
+        self.assertEqual(batch.operations, ("Photo.delete_batch", ))
+        self.assertGreater(batch.bytes_out, 0)
+        self.assertFalse(self.events[-2].cached)
+        self.assertTrue(self.events[-1].cached)
+
+    def test_listener_errors(self):
+        client = self.client()
+
+        def broken(event):
+            raise ValueError()
+
+        client.add_listener(broken)
+        with self.assertLogs(client.log.name, "ERROR"):
+            list(Photo.all(client))
+        self.assertEqual(len(self.events), 1)
+        client.remove_listener(broken)
+        self.assertEqual(client.listeners, [self.events.append])
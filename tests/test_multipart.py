@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+import hashlib
+import io
+from openphoto import Client
+from openphoto.models import Photo
+from openphoto.multipart import MultipartEncoder
+from openphoto.retry import RetryPolicy
+from compat import unittest
+from benchmarks.server import (FakeOpenPhoto,
+                               _parse_multipart)
+
+
+CAFFE = b"caff\xc3\xa8".decode("utf-8")
+
+
+class Unseekable(io.RawIOBase):
+
+    def __init__(self, content):
+        self.content = io.BytesIO(content)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        data = self.content.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+
+class TestMultipartEncoder(unittest.TestCase):
+
+    def setUp(self):
+        self.content = b"0123456789" * 1000
+        self.progress = []
+
+    def encoder(self, file_, chunk_size=4096):
+        return MultipartEncoder(
+            fields=dict(title=CAFFE, count=2),
+            files=dict(photo=("a.jpg", file_)), chunk_size=chunk_size,
+            progress=lambda sent, total: self.progress.append((sent, total)))
+
+    def test_body(self):
+        encoder = self.encoder(io.BytesIO(self.content))
+        body = b"".join(iter(lambda: encoder.read(1000), b""))
+        self.assertEqual(len(body), encoder.len)
+        self.assertEqual(_parse_multipart(body, encoder.content_type),
+                         dict(title=CAFFE, count="2",
+                              photo=self.content))
+        self.assertEqual(encoder.sha1("photo"),
+                         hashlib.sha1(self.content).hexdigest())
+        self.assertEqual(self.progress[-1], (encoder.len, encoder.len))
+        self.assertEqual(len(self.progress), (encoder.len + 999) // 1000)
+
+    def test_rewind(self):
+        file_ = io.BytesIO(b"skipped" + self.content)
+        file_.seek(7)
+        encoder = self.encoder(file_)
+        first = encoder.read()
+        encoder.read(10)
+        self.assertEqual(encoder.seek(0), 0)
+        self.assertEqual(encoder.tell(), 0)
+        self.assertEqual(b"".join(encoder), first)
+        with self.assertRaises(io.UnsupportedOperation):
+            encoder.seek(0, io.SEEK_END)
+
+    def test_unknown_length(self):
+        encoder = self.encoder(Unseekable(self.content), chunk_size=1000)
+        self.assertIsNone(encoder.len)
+        body = encoder.read()
+        self.assertEqual(_parse_multipart(body, encoder.content_type)["photo"],
+                         self.content)
+        self.assertEqual(self.progress, [(len(body), None)])
+        with self.assertRaises(io.UnsupportedOperation):
+            encoder.seek(0)
+
+
+class TestStreamingUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto().start()
+        retry = RetryPolicy(retries=2, backoff=0, jitter=False)
+        self.client = Client(self.server.host, "ckey", "csecret", "otoken",
+                             "osecret", scheme="http", retry=retry)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_create(self):
+        content = b"\xff\xd8" * 50000
+        progress = []
+        self.server.fail("/photo/upload.json", 503)
+        photo = Photo.create(self.client, io.BytesIO(content),
+                             title="streamed", chunk_size=8192,
+                             progress=lambda *args: progress.append(args))
+        self.assertEqual(photo.hash, hashlib.sha1(content).hexdigest())
+        self.assertEqual(photo.size, len(content))
+        self.assertEqual(photo.title, "streamed")
+        sent, total = progress[-1]
+        self.assertEqual(sent, total)
+        self.assertGreater(total, len(content))
+        headers = self.server.requests[-1][3]
+        self.assertEqual(int(headers["Content-Length"]), total)
@@ -1,8 +1,14 @@
 #!/usr/bin/env python
+import os
+import pickle
+import shutil
+import tempfile
+from openphoto import Client
 from openphoto.models import Photo, Comment, Favorite, Tag
 from compat import (mock,
                     unittest,
                     builtins_name)
+from benchmarks.server import FakeOpenPhoto
 
 open_name = "{0}.open".format(builtins_name)
 
@@ -108,6 +114,33 @@ class TestPhoto(unittest.TestCase):
         self.assertEqual(tags[1].id, "b")
         self.assertIs(self.photo._tags, tags)
 
+    def test_lazy_helpers(self):
+        photo = Photo(self.client, dict(id="p", tags=["a"]))
+        self.assertIsNone(photo._sizes)
+        self.assertIsNone(photo._tags)
+        self.assertIs(photo.sizes, photo.sizes)
+        self.assertEqual([t.id for t in photo.tags()], ["a"])
+        self.assertFalse(self.client.get.called)
+
+    def test_missing_sizes(self):
+        self.client.get.return_value.json.return_value = {
+            "result": {"path100x100": "/small.jpg"}
+        }
+        sizes = self.photo.sizes.get_sizes(["original", "100x100"])
+        self.assertEqual([s.url for s in sizes], ["/my/path.jpg", "/small.jpg"])
+        self.client.get.assert_called_once_with(
+            "/photo/myid/view.json", params=dict(returnSizes="100x100"))
+        self.assertEqual(self.photo.attr1, 1)
+
+        self.photo.sizes["100x100"]
+        self.assertEqual(self.client.get.call_count, 1)
+
+    def test_pickle(self):
+        photo = Photo(None, dict(id="p", attr1=1, pathOriginal="/my/path.jpg"))
+        photo = pickle.loads(pickle.dumps(photo))
+        self.assertEqual(photo.paths(), {"original": "/my/path.jpg"})
+        self.assertEqual(photo.attr1, 1)
+
     def test_albums(self):
         with self.assertRaises(NotImplementedError):
             self.photo.albums()
@@ -159,3 +192,226 @@ class TestPhoto(unittest.TestCase):
         json.return_value = {"result": {}}
         with self.assertRaises(StopIteration):
             getattr(g, met)()
+
+
+class TestPhotoCreateMany(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto(photos=1).start()
+        self.client = Client(self.server.host, "ckey", "csecret", "otoken",
+                             "osecret", scheme="http")
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_create_many(self):
+        new = [self.write("new%d.jpg" % i, b"\xff\xd8 " + str(i).encode())
+               for i in range(4)]
+        # same content as a file before it in the list
+        dup = self.write("dup.jpg", b"\xff\xd8 0")
+        # the fake server hashes photo "1" as sha1("1")
+        known = self.write("known.jpg", b"1")
+        missing = os.path.join(self.dir, "missing.jpg")
+
+        results = list(Photo.create_many(self.client,
+                                         new + [dup, known, missing],
+                                         workers=3, hash_workers=2,
+                                         title="bulk"))
+        by_path = dict((r.path, r) for r in results)
+        self.assertEqual(len(results), 7)
+        for path in new:
+            self.assertFalse(by_path[path].skipped)
+            self.assertIsNone(by_path[path].error)
+            self.assertEqual(by_path[path].photo.title, "bulk")
+        self.assertTrue(by_path[dup].skipped)
+        self.assertTrue(by_path[known].skipped)
+        self.assertIsNone(by_path[known].photo)
+        self.assertIsInstance(by_path[missing].error, (IOError, OSError))
+        uploads = [r for r in self.server.requests
+                   if r[1] == "/photo/upload.json"]
+        self.assertEqual(len(uploads), 4)
+
+    def test_create_many_failed_original(self):
+        paths = [self.write("a.jpg", b"a"), self.write("b.jpg", b"a")]
+        self.server.fail("/photo/upload.json", 500)
+        results = list(Photo.create_many(self.client, paths, workers=2))
+        self.assertEqual(len(results), 2)
+        failed = [r for r in results if r.error is not None]
+        self.assertEqual(len(failed), 1)
+        # the copy is uploaded in place of the failed file
+        self.assertEqual([r.skipped for r in results if r.error is None],
+                         [False])
+        self.assertEqual(len(self.server.photos), 2)
+
+    def test_create_many_no_skip(self):
+        paths = [self.write("a.jpg", b"a"), self.write("b.jpg", b"1")]
+        results = list(Photo.create_many(self.client, paths,
+                                         skip_existing=False,
+                                         allow_duplicate=True))
+        self.assertEqual(len(results), 2)
+        self.assertFalse(any(r.skipped or r.error for r in results))
+        self.assertEqual(len(self.server.photos), 3)
+
+
+class TestPhotoBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto(photos=12).start()
+        self.client = Client(self.server.host, "ckey", "csecret", "otoken",
+                             "osecret", scheme="http")
+        self.old_batch_size = Photo.batch_size
+        Photo.batch_size = 5
+
+    def tearDown(self):
+        Photo.batch_size = self.old_batch_size
+        self.server.stop()
+
+    def batch_requests(self, action):
+        path = "/photos/{0}.json".format(action)
+        return [r for r in self.server.requests if r[1] == path]
+
+    def test_update_batch(self):
+        photos = [Photo(self.client, {"id": str(i)}) for i in range(1, 12)]
+        res = Photo.update_batch(self.client, photos + ["1"], title="new",
+                                 tags=["a"], tags_action="add")
+        self.assertEqual(res, dict((str(i), True) for i in range(1, 12)))
+        self.assertEqual(len(self.batch_requests("update")), 3)
+        for i in range(1, 12):
+            photo = self.server.photos[str(i)]
+            self.assertEqual(photo["title"], "new")
+            self.assertEqual(photo["tags"], ["a"])
+        self.assertEqual(self.server.photos["12"]["title"], "photo 12")
+
+    def test_update_batch_failure(self):
+        # one unknown id fails the whole batch: its ids are sent one by one
+        res = Photo.update_batch(self.client, ["1", "2", "99", "3", "4"],
+                                 title="x")
+        self.assertEqual(res["99"].response.status_code, 404)
+        del res["99"]
+        self.assertEqual(res, dict((str(i), True) for i in range(1, 5)))
+        for i in range(1, 5):
+            self.assertEqual(self.server.photos[str(i)]["title"], "x")
+        self.assertEqual(len(self.batch_requests("update")), 1)
+        self.assertEqual(len(self.server.requests), 1 + 5)
+
+        self.server.fail("/photos/update.json", 500)
+        res = Photo.update_batch(self.client, ["5", "6"], title="y")
+        self.assertEqual(res, {"5": True, "6": True})
+
+    def test_update_batch_fallback(self):
+        self.server.batch = False
+        res = Photo.update_batch(self.client, ["1", "2", "99"], title="x")
+        self.assertEqual(res["1"], True)
+        self.assertEqual(res["2"], True)
+        self.assertEqual(res["99"].response.status_code, 404)
+        self.assertEqual(self.server.photos["2"]["title"], "x")
+
+    def test_delete_batch(self):
+        res = Photo.delete_batch(self.client, [str(i) for i in range(1, 8)])
+        self.assertEqual(res, dict((str(i), True) for i in range(1, 8)))
+        self.assertEqual(sorted(self.server.photos, key=int),
+                         [str(i) for i in range(8, 13)])
+        self.assertEqual(len(self.batch_requests("delete")), 2)
+
+        self.server.batch = False
+        res = Photo.delete_batch(self.client, ["8", "9"])
+        self.assertEqual(res, {"8": True, "9": True})
+        self.assertNotIn("9", self.server.photos)
+
+
+class TestPhotoPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto(photos=12).start()
+        self.client = Client(self.server.host, "ckey", "csecret", "otoken",
+                             "osecret", scheme="http")
+        self.photos = [Photo(self.client, {"id": str(i)})
+                       for i in range(1, 13)]
+        self.old_batch_size = Photo.batch_size
+        Photo.batch_size = 5
+
+    def tearDown(self):
+        Photo.batch_size = self.old_batch_size
+        self.server.stop()
+
+    def check(self, photos):
+        for photo in photos:
+            self.assertEqual(photo.title, "photo {0}".format(photo.id))
+            self.assertIn("/photo/{0}/100x100.jpg".format(photo.id),
+                          photo.paths()["100x100"])
+            self.assertEqual(photo.tags(), [])
+
+    def test_prefetch(self):
+        res = Photo.prefetch(self.photos, sizes="100x100")
+        self.assertEqual(res, self.photos)
+        self.assertEqual(len(self.server.requests), 3)
+        self.check(self.photos)
+        self.assertEqual(len(self.server.requests), 3)
+
+        # nothing missing, no requests
+        Photo.prefetch(self.photos, sizes=["100x100"])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_prefetch_fallback(self):
+        self.server.list_by_ids = False
+        Photo.prefetch(self.photos[:4], sizes="100x100")
+        # one ignored listing, then one view per photo
+        self.assertEqual(len(self.server.requests), 5)
+        self.check(self.photos[:4])
+        self.assertEqual(len(self.server.requests), 5)
+
+    def test_resolve_sizes(self):
+        self.photos[0].sizes["200x200"]
+        del self.server.requests[:]
+        sizes = Photo.resolve_sizes(self.photos, ["200x200", "100x100"])
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(sizes), 12)
+        small, thumb = sizes[3]
+        self.assertTrue(small.url.endswith("/photo/4/200x200.jpg"))
+        self.assertTrue(thumb.url.endswith("/photo/4/100x100.jpg"))
+        self.assertIs(small.photo, self.photos[3])
+        # PhotoSizes are cached
+        self.assertIs(self.photos[3].sizes["100x100"], thumb)
+        self.assertEqual(Photo.resolve_sizes(self.photos, "200x200"),
+                         [s[:1] for s in sizes])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_stream(self):
+        photos = list(self.photos[4].stream())
+        self.assertEqual([p.id for p in photos],
+                         [str(i) for i in range(6, 13)])
+        # two photos per response, the last one empty
+        self.assertEqual(len(self.server.requests), 4 + 1)
+        photos = list(self.photos[4].stream(reverse=True, window=3))
+        self.assertEqual([p.id for p in photos], ["4", "3", "2", "1"])
+
+    def test_stream_content(self):
+        stream = self.photos[9].stream(window=2, size="100x100")
+        pairs = list(stream)
+        self.assertEqual([p.id for p, _ in pairs], ["11", "12"])
+        for photo, content in pairs:
+            self.assertEqual(content,
+                             self.server.content(photo.id, "100x100"))
+
+    def test_stream_close(self):
+        self.server.nextprevious_count = 1
+        stream = self.photos[0].stream(window=2)
+        self.assertEqual(next(stream).id, "2")
+        stream.close()
+        with self.assertRaises(StopIteration):
+            next(stream)
+
+    def test_load(self):
+        photo = self.photos[0]
+        photo.load("tags", "title")
+        self.assertEqual(photo.title, "photo 1")
+        photo.load("tags", "title")
+        self.assertEqual(len(self.server.requests), 1)
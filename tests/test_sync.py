@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+from openphoto import Client
+from openphoto.models import Photo
+from openphoto.sync import Mirror
+from compat import unittest
+from benchmarks.server import FakeOpenPhoto
+
+
+class TestMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenPhoto(photos=25).start()
+        self.server.photos["1"]["tags"] = ["a"]
+        self.server.add_album("album")
+        self.client = Client(self.server.host, "ckey", "csecret", "otoken",
+                             "osecret", scheme="http")
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "mirror.db")
+        self.mirror = Mirror(self.client, self.path, page_size=10)
+
+    def tearDown(self):
+        self.mirror.close()
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def summary(self, changes):
+        return sorted((c.kind, c.action, c.id) for c in changes)
+
+    def requests(self):
+        count = len(self.server.requests)
+        del self.server.requests[:]
+        return count
+
+    def test_first_sync(self):
+        self.assertIsNone(self.mirror.last_sync)
+        changes = self.mirror.sync()
+        self.assertEqual(len(changes), 27)
+        self.assertEqual(set(c.action for c in changes), set(["added"]))
+        self.assertEqual(len(self.mirror), 25)
+        self.assertIsNotNone(self.mirror.last_full_sync)
+
+        photo = self.mirror.photo("1")
+        self.assertIsInstance(photo, Photo)
+        self.assertIs(photo.client, self.client)
+        self.assertEqual(photo.title, "photo 1")
+        self.assertEqual([t.id for t in self.mirror.tags()], ["a"])
+        self.assertEqual([a.name for a in self.mirror.albums()], ["album"])
+        self.assertEqual([p.id for p in self.mirror.photos(photo.hash)],
+                         ["1"])
+        self.assertIsNone(self.mirror.photo("missing"))
+
+    def test_delta_sync(self):
+        self.mirror.sync()
+        self.requests()
+        self.assertEqual(self.mirror.sync(), [])
+        # one page of photos, albums, tags
+        self.assertEqual(self.requests(), 3)
+
+        self.server.add_photo(dateUploaded=5000)
+        self.server.add_photo(dateUploaded=5000, tags=["b"])
+        self.server.photos["3"]["title"] = "edited"
+        del self.server.photos["4"]
+        changes = self.mirror.sync()
+        self.assertEqual(self.summary(changes),
+                         [("photo", "added", "27"), ("photo", "added", "28"),
+                          ("tag", "added", "b")])
+        self.assertEqual(self.requests(), 3)
+
+        # edits and deletions of older photos need a full pass
+        changes = self.mirror.sync(full=True)
+        self.assertEqual(self.summary(changes),
+                         [("photo", "deleted", "4"),
+                          ("photo", "updated", "3")])
+        self.assertEqual(self.mirror.photo("3").title, "edited")
+        self.assertEqual(len(self.mirror), 26)
+
+    def test_persistence(self):
+        self.mirror.sync()
+        self.mirror.close()
+        self.server.albums.clear()
+        self.mirror = Mirror(self.client, self.path, page_size=10)
+        self.assertEqual(len(self.mirror), 25)
+        self.assertEqual(self.summary(self.mirror.sync()),
+                         [("album", "deleted", "26")])
+
+    def test_failed_sync_is_rolled_back(self):
+        self.server.fail("/tags/list.json", 500)
+        with self.assertRaises(Exception):
+            self.mirror.sync()
+        self.assertEqual(len(self.mirror), 0)
+        self.assertIsNone(self.mirror.last_sync)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from openphoto.utils import (hash_,
+                             hash_tree)
+from compat import unittest
+
+
+class TestHash(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.content = os.urandom(300000)
+        self.path = self.write("photo.jpg", self.content)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_hash(self):
+        expected = hashlib.sha1(self.content).hexdigest()
+        self.assertEqual(hash_(self.path), expected)
+        self.assertEqual(hash_(self.path, chunk_size=1000), expected)
+        self.assertEqual(hash_(io.BytesIO(self.content)), expected)
+        with open(self.path, "rb") as f:
+            self.assertEqual(hash_(f), expected)
+            self.assertFalse(f.closed)
+
+    def test_hash_mmap(self):
+        expected = hashlib.sha1(self.content).hexdigest()
+        self.assertEqual(hash_(self.path, mmap_threshold=1), expected)
+        self.assertEqual(hash_(self.path, chunk_size=7, mmap_threshold=1),
+                         expected)
+        # objects without a file descriptor fall back to reading
+        self.assertEqual(hash_(io.BytesIO(self.content), mmap_threshold=1),
+                         expected)
+        empty = self.write("empty", b"")
+        self.assertEqual(hash_(empty, mmap_threshold=0),
+                         hashlib.sha1(b"").hexdigest())
+
+    def test_hash_tree(self):
+        other = self.write(os.path.join("sub", "other.jpg"), b"other")
+        broken = os.path.join(self.dir, "broken.jpg")
+        os.symlink(os.path.join(self.dir, "missing.jpg"), broken)
+        res = hash_tree(self.dir, workers=2)
+        self.assertEqual(res, {
+            self.path: hashlib.sha1(self.content).hexdigest(),
+            other: hashlib.sha1(b"other").hexdigest(),
+            broken: None
+        })